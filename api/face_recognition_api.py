@@ -1,16 +1,35 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse, Response
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import cv2
 import numpy as np
 import os
 import json
+import asyncio
+import shutil
+import tempfile
+import zipfile
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import base64
+import msgpack
 from PIL import Image
 import io
-from face_learning_model import FaceLearningModel
+from face_learning_model import FaceLearningModel, init_analysis_worker, analyze_in_worker, analyze_batch_in_worker
+from processing_pool import ProcessingPool, PoolSaturated, PoolUnavailable
+from job_queue import JobQueue
+from model_registry import registry, registry_report
+from gallery_store import GALLERY_FILES, CLUSTER_FILES, install_gallery
+from face_store import FaceStore
+from recluster import RECLUSTER_METHODS
+from thumbnail_cache import ThumbnailCache, is_thumbnail_key
+from encoding_cache import hash_bytes
 import logging
 
 # Configure logging
@@ -28,8 +47,279 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the face learning model
-face_model = FaceLearningModel()
+# The API process only matches identities, which needs no detection or encoding models;
+# those are loaded lazily, or up front by the startup warm-up below. With DATABASE_URL set,
+# faces and identities are stored in the app database and shared by every replica
+face_model = FaceLearningModel(store=FaceStore() if os.environ.get("DATABASE_URL") else None)
+STORE_SYNC_SECONDS = float(os.environ.get("FACE_STORE_SYNC_SECONDS", 10))
+
+# Workers write face thumbnails (and photo previews with FACE_THUMBNAIL_PREVIEWS=1) at ingest;
+# results carry their cache keys, served by GET /thumbnails/{key}
+THUMBNAIL_DIR = os.environ.get("FACE_THUMBNAIL_DIR", "thumbnails")
+# Least-recently-used thumbnails are evicted past this size; they come back on re-ingest
+THUMBNAIL_MAX_BYTES = int(os.environ.get("FACE_THUMBNAIL_MAX_BYTES", 1 << 30))
+thumbnail_cache = ThumbnailCache(THUMBNAIL_DIR, max_bytes=THUMBNAIL_MAX_BYTES)
+# Keys are content hashes, so a thumbnail never changes and can be cached indefinitely
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Clients that ask for it with ?format=msgpack or an Accept header get msgpack instead of
+# JSON, with encodings as raw float32 bytes rather than base64
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Detection and encoding run in worker processes so the event loop stays responsive;
+# each worker builds its own model and only identity assignment touches face_model
+processing_pool = ProcessingPool(
+    workers=int(os.environ.get("FACE_WORKERS", 0)) or None,
+    queue_depth=int(os.environ["FACE_QUEUE_DEPTH"]) if "FACE_QUEUE_DEPTH" in os.environ else None,
+    mode=os.environ.get("FACE_WORKER_MODE", "process"),
+    initializer=init_analysis_worker,
+    initargs=({"thumbnail_dir": THUMBNAIL_DIR, "thumbnail_max_bytes": THUMBNAIL_MAX_BYTES,
+               "thumbnail_previews": os.environ.get("FACE_THUMBNAIL_PREVIEWS", "0") != "0"},
+              os.environ.get("FACE_PRELOAD", "1") != "0")
+)
+startup_report: Dict[str, Any] = {}
+
+# Where the gallery is kept between restarts; it is memory mapped on startup and saved on shutdown
+GALLERY_PATH = os.environ.get("FACE_GALLERY_PATH", "face_gallery")
+
+# Large batches are queued on disk and drained into the pool in the background
+# Replicas sharing one jobs.db each lease items under their own id; set FACE_REPLICA_ID
+# when several replicas run on one host
+job_queue = JobQueue(os.environ.get("FACE_JOBS_DB", "jobs.db"),
+                     owner=os.environ.get("FACE_REPLICA_ID") or None,
+                     lease_seconds=float(os.environ.get("FACE_JOB_LEASE_SECONDS", "300")))
+JOB_POLL_SECONDS = 0.5
+jobs_available = asyncio.Event()
+background_tasks: List[asyncio.Task] = []
+
+async def drain_jobs():
+    """Feed queued job items to the processing pool one at a time, forever"""
+    while True:
+        jobs_available.clear()
+        try:
+            item = await run_in_threadpool(job_queue.claim_next)
+        except Exception as e:
+            # e.g. another replica holding the database lock for too long
+            logger.error(f"Could not claim a job item: {str(e)}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        if item is None:
+            try:
+                await asyncio.wait_for(jobs_available.wait(), timeout=JOB_POLL_SECONDS * 4)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            faces = await processing_pool.run(analyze_in_worker, item['payload'])
+            results = await run_in_threadpool(face_model.assign_identities, faces)
+            await run_in_threadpool(job_queue.complete, item['job_id'], item['seq'], results)
+        except PoolSaturated:
+            # Interactive requests are using every slot; try this item again shortly
+            await run_in_threadpool(job_queue.release, item['job_id'], item['seq'])
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        except Exception as e:
+            logger.error(f"Job {item['job_id']} failed on {item['filename']}: {str(e)}")
+            try:
+                await run_in_threadpool(job_queue.fail, item['job_id'], item['seq'], str(e))
+            except Exception as fail_error:
+                # The item keeps its lease and is picked up again once the lease runs out
+                logger.error(f"Could not mark job item {item['job_id']}/{item['seq']} failed: {str(fail_error)}")
+
+async def sync_store():
+    """Periodically pull people found by other replicas into this replica's gallery"""
+    while True:
+        await asyncio.sleep(STORE_SYNC_SECONDS)
+        try:
+            added = await run_in_threadpool(face_model.sync_from_store)
+            if added:
+                logger.info(f"Synced {added} gallery faces from the store")
+        except Exception as e:
+            logger.error(f"Store sync failed: {str(e)}")
+
+@app.on_event("startup")
+async def load_saved_gallery():
+    if face_model.store is not None:
+        start = time.perf_counter()
+        added = await run_in_threadpool(face_model.sync_from_store)
+        startup_report['gallery_load_seconds'] = time.perf_counter() - start
+        logger.info(f"Loaded {added} gallery faces from the store")
+        background_tasks.append(asyncio.create_task(sync_store()))
+    elif os.path.exists(GALLERY_PATH):
+        start = time.perf_counter()
+        meta = face_model.import_model_data(GALLERY_PATH)
+        startup_report['gallery_load_seconds'] = time.perf_counter() - start
+        logger.info(f"Loaded {meta['count']} gallery faces from {GALLERY_PATH}")
+
+@app.on_event("startup")
+async def warm_up_models():
+    """Start the workers and load their models before taking traffic (FACE_PRELOAD=0 to skip)"""
+    if os.environ.get("FACE_PRELOAD", "1") != "0":
+        warm_up = await processing_pool.warm_up(registry_report)
+        startup_report['worker_warm_up_seconds'] = warm_up['seconds']
+        startup_report['worker_models'] = warm_up['results'][0] if warm_up['results'] else {}
+    startup_report['cold_start_seconds'] = time.perf_counter() - import_started
+    logger.info(f"Cold start took {startup_report['cold_start_seconds']:.2f}s")
+
+@app.on_event("startup")
+async def start_job_drainers():
+    # One drainer per worker keeps the pool busy without crowding out /process-image
+    for _ in range(processing_pool.workers):
+        background_tasks.append(asyncio.create_task(drain_jobs()))
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    processing_pool.shutdown(wait=False)
+    job_queue.close()
+    if face_model.store is None:
+        face_model.export_model_data(GALLERY_PATH)
+    else:
+        face_model.store.close()
+
+def decode_upload(contents: bytes) -> np.ndarray:
+    """Decode uploaded file bytes straight to a BGR array"""
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode uploaded image")
+    return image
+
+# The last analyses by upload content hash, so e.g. /process-image/visualization for a photo
+# just sent to /process-image draws it without detecting and encoding its faces again
+RECENT_ANALYSES = int(os.environ.get("FACE_RECENT_ANALYSES", 64))
+recent_analyses: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+def _copy_analysis(faces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Identity assignment writes into the face dicts, so callers never share them with the cache
+    return [{**item, 'face': dict(item['face'])} for item in faces]
+
+async def analyze_in_pool(contents: bytes) -> List[Dict[str, Any]]:
+    """Detect and encode the faces in upload bytes in the processing pool, reusing a recent analysis of the same bytes"""
+    content_hash = hash_bytes(contents)
+    cached = recent_analyses.get(content_hash)
+    if cached is not None:
+        recent_analyses.move_to_end(content_hash)
+        return _copy_analysis(cached)
+    try:
+        faces = await processing_pool.run(analyze_in_worker, contents)
+    except PoolSaturated:
+        raise HTTPException(status_code=429, detail="Server is busy, try again shortly",
+                            headers={"Retry-After": "1"})
+    except PoolUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if RECENT_ANALYSES > 0:
+        recent_analyses[content_hash] = _copy_analysis(faces)
+        while len(recent_analyses) > RECENT_ANALYSES:
+            recent_analyses.popitem(last=False)
+    return faces
+
+async def analyze_upload(contents: bytes, photo_id: Optional[str] = None,
+                         include_encodings: bool = False) -> List[Dict[str, Any]]:
+    """Analyse upload bytes in the processing pool and assign identities to the faces found.
+
+    With include_encodings each result also carries its float32 encoding array.
+    """
+    faces = await analyze_in_pool(contents)
+    results = await run_in_threadpool(face_model.assign_identities, faces, photo_id)
+    if include_encodings:
+        attach_encodings(results, faces)
+    return results
+
+def attach_encodings(results: List[Dict[str, Any]], faces: List[Dict[str, Any]]):
+    for face, item in zip(results, faces):
+        face['encoding'] = np.asarray(item['encoding'], dtype=np.float32)
+
+async def analyze_batch(uploads: List[bytes]) -> List[Dict[str, Any]]:
+    """Analyse a batch of uploads across the pool, one {'faces': ...} or {'error': ...} per upload.
+
+    The batch is split into one contiguous slice per worker, so it takes `workers` pool
+    slots however many files it has. Raises 429 only if no slice could be admitted.
+    """
+    slices = min(processing_pool.workers, len(uploads))
+    size = -(-len(uploads) // slices)
+    chunks = [uploads[start:start + size] for start in range(0, len(uploads), size)]
+    chunk_outcomes = await asyncio.gather(*[processing_pool.run(analyze_batch_in_worker, chunk) for chunk in chunks],
+                                          return_exceptions=True)
+    if all(isinstance(outcome, PoolSaturated) for outcome in chunk_outcomes):
+        raise HTTPException(status_code=429, detail="Server is busy, try again shortly", headers={"Retry-After": "1"})
+    
+    outcomes = []
+    for chunk, outcome in zip(chunks, chunk_outcomes):
+        if isinstance(outcome, PoolSaturated):
+            outcomes.extend({'error': "Server is busy, try again shortly"} for _ in chunk)
+        elif isinstance(outcome, Exception):
+            outcomes.extend({'error': str(outcome)} for _ in chunk)
+        else:
+            outcomes.extend(outcome)
+    return outcomes
+
+def wants_msgpack(response_format: Optional[str], accept: Optional[str]) -> bool:
+    """Whether to answer in msgpack, from an explicit ?format= or else the Accept header"""
+    if response_format is not None:
+        if response_format not in ("json", "msgpack"):
+            raise HTTPException(status_code=400, detail="format must be json or msgpack")
+        return response_format == "msgpack"
+    return bool(accept) and ("application/msgpack" in accept or "application/x-msgpack" in accept)
+
+def _msgpack_default(value):
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32).tobytes()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not msgpack serializable")
+
+def _json_encodings(data):
+    """Replace encoding arrays with base64 float32 strings, in place"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, np.ndarray):
+                data[key] = base64.b64encode(value.astype(np.float32).tobytes()).decode("ascii")
+            else:
+                _json_encodings(value)
+    elif isinstance(data, list):
+        for value in data:
+            _json_encodings(value)
+    return data
+
+def shape_response(data: Any, msgpack_format: bool):
+    """The response body as msgpack, or as JSON-ready data"""
+    if msgpack_format:
+        return Response(msgpack.packb(data, default=_msgpack_default), media_type=MSGPACK_MEDIA_TYPE)
+    return _json_encodings(data)
+
+def render_visualization(contents: bytes, results: List[Dict[str, Any]]) -> bytes:
+    """Draw face boxes, labels and quality metrics on the upload and return it as JPEG bytes"""
+    vis_image = decode_upload(contents)
+    for face in results:
+        location = face['location']
+        person_id = face['person_id']
+        confidence = face['confidence']
+        
+        # Draw rectangle
+        cv2.rectangle(vis_image, 
+                     (location['left'], location['top']), 
+                     (location['right'], location['bottom']), 
+                     (0, 255, 0), 2)
+        
+        # Draw label
+        label = f"{person_id} ({confidence:.2f})"
+        cv2.putText(vis_image, label, (location['left'], location['top'] - 10), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        
+        # Add quality metrics
+        quality = face['quality']
+        metrics_text = f"B:{quality['brightness']:.2f} S:{quality['sharpness']:.2f} C:{quality['contrast']:.2f}"
+        cv2.putText(vis_image, metrics_text, (location['left'], location['bottom'] + 20),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    
+    _, buffer = cv2.imencode('.jpg', vis_image)
+    return buffer.tobytes()
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -58,7 +348,7 @@ async def root():
                 document.querySelector('form').addEventListener('submit', async (e) => {
                     e.preventDefault();
                     const formData = new FormData(e.target);
-                    const response = await fetch('/process-image', {
+                    const response = await fetch('/process-image?visualize=true', {
                         method: 'POST',
                         body: formData
                     });
@@ -75,108 +365,256 @@ async def root():
     """
 
 @app.post("/process-image")
-async def process_image(file: UploadFile = File(...)):
-    """Process an image and return face recognition results with visualization"""
+async def process_image(file: UploadFile = File(...), photo_id: Optional[str] = Form(None), visualize: bool = False,
+                        include_encodings: bool = False, response_format: Optional[str] = Query(None, alias="format"),
+                        accept: Optional[str] = Header(None)):
+    """Process an image and return face recognition results.
+
+    The annotated image is only rendered with visualize=true, as base64 JPEG; prefer
+    /process-image/visualization for it as a binary response.
+    """
     try:
-        # Read image file
+        msgpack_format = wants_msgpack(response_format, accept)
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Save temporarily
-        temp_path = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        cv2.imwrite(temp_path, image)
-        
-        # Process image
-        results = face_model.process_image(temp_path)
-        
-        # Create visualization
-        vis_image = image.copy()
-        for face in results:
-            location = face['location']
-            person_id = face['person_id']
-            confidence = face['confidence']
-            
-            # Draw rectangle
-            cv2.rectangle(vis_image, 
-                         (location['left'], location['top']), 
-                         (location['right'], location['bottom']), 
-                         (0, 255, 0), 2)
-            
-            # Draw label
-            label = f"{person_id} ({confidence:.2f})"
-            cv2.putText(vis_image, label, (location['left'], location['top'] - 10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            # Add quality metrics
-            quality = face['quality']
-            metrics_text = f"B:{quality['brightness']:.2f} S:{quality['sharpness']:.2f} C:{quality['contrast']:.2f}"
-            cv2.putText(vis_image, metrics_text, (location['left'], location['bottom'] + 20),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', vis_image)
-        vis_base64 = base64.b64encode(buffer).decode('utf-8')
         
-        # Clean up
-        os.remove(temp_path)
-        
-        return {
+        # Process image off the event loop
+        results = await analyze_upload(contents, photo_id, include_encodings)
+        response = {
             "faces_detected": len(results),
-            "face_details": results,
-            "visualization": vis_base64
+            "face_details": results
         }
         
+        if visualize:
+            visualization = await run_in_threadpool(render_visualization, contents, results)
+            response["visualization"] = visualization if msgpack_format else base64.b64encode(visualization).decode('utf-8')
+        
+        return shape_response(response, msgpack_format)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/process-image/visualization")
+async def process_image_visualization(file: UploadFile = File(...)):
+    """Return the upload annotated with its faces' closest known people as a JPEG; the face count is in X-Faces-Detected.
+
+    Faces are only matched, not ingested, so calling this after /process-image for the
+    same photo does not add its faces to the gallery or store twice, and the analysis
+    /process-image made of it is reused rather than detected again.
+    """
+    try:
+        contents = await file.read()
+        faces = await analyze_in_pool(contents)
+        results = await run_in_threadpool(face_model.match_identities, faces)
+        visualization = await run_in_threadpool(render_visualization, contents, results)
+        return Response(visualization, media_type="image/jpeg", headers={"X-Faces-Detected": str(len(results))})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/thumbnails/{key}")
+async def get_thumbnail(key: str, if_none_match: Optional[str] = Header(None)):
+    """A face thumbnail or photo preview by the cache key found in face results"""
+    if not is_thumbnail_key(key):
+        raise HTTPException(status_code=404, detail="Unknown thumbnail")
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    path = thumbnail_cache.path(key)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Unknown thumbnail")
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
 @app.get("/model-stats")
 async def get_model_stats():
     """Get current model statistics"""
     try:
         stats = face_model.get_person_statistics()
+        stats['processing_pool'] = processing_pool.stats()
+        stats['startup'] = dict(startup_report, api_models=registry.report())
+        stats['identities'] = {'people': len(face_model.clusterer), 'last_consolidation': face_model.clusterer.stats}
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/recluster")
+async def recluster(method: str = "chinese_whispers", threshold: float = 0.5, neighbors: int = 16,
+                    min_cluster_size: int = 2, index_backend: str = "exact"):
+    """Rebuild every identity from all stored faces and report clusters, outliers and per-stage times.
+
+    Matching is blocked while it runs; for large galleries prefer running recluster.py offline.
+    """
+    if method not in RECLUSTER_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {list(RECLUSTER_METHODS)}")
+    try:
+        return await run_in_threadpool(face_model.recluster, method=method, threshold=threshold, k=neighbors,
+                                       min_cluster_size=min_cluster_size, index_backend=index_backend)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/consolidate-identities")
+async def consolidate_identities():
+    """Re-cluster every known face (merging and splitting people) and return the pass's stats"""
+    try:
+        return await run_in_threadpool(face_model.consolidate_identities)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/train-batch")
-async def train_batch(files: List[UploadFile] = File(...)):
-    """Process multiple images in a batch"""
+async def train_batch(files: List[UploadFile] = File(...), include_encodings: bool = False,
+                      response_format: Optional[str] = Query(None, alias="format"), accept: Optional[str] = Header(None)):
+    """Process multiple images in a batch.
+
+    Files are read concurrently and analysed in parallel across the pool, then every face
+    in the batch is matched against the gallery in one step. A file that fails gets an
+    "error" entry instead of "results" without failing the others.
+    """
     try:
+        msgpack_format = wants_msgpack(response_format, accept)
+        uploads = await asyncio.gather(*[file.read() for file in files])
+        outcomes = await analyze_batch(uploads)
+        
+        # One identity assignment for the whole batch, split back per file afterwards
+        faces = [face for outcome in outcomes for face in outcome.get('faces', [])]
+        assigned = await run_in_threadpool(face_model.assign_identities, faces)
+        if include_encodings:
+            attach_encodings(assigned, faces)
+        
         results = []
-        for file in files:
-            # Read image file
-            contents = await file.read()
-            nparr = np.frombuffer(contents, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Save temporarily
-            temp_path = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            cv2.imwrite(temp_path, image)
-            
-            # Process image
-            result = face_model.process_image(temp_path)
-            results.append({
-                "filename": file.filename,
-                "results": result
-            })
-            
-            # Clean up
-            os.remove(temp_path)
+        offset = 0
+        for file, outcome in zip(files, outcomes):
+            if 'error' in outcome:
+                results.append({"filename": file.filename, "error": outcome['error']})
+                continue
+            count = len(outcome['faces'])
+            results.append({"filename": file.filename, "results": assigned[offset:offset + count]})
+            offset += count
         
-        return results
+        return shape_response(results, msgpack_format)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...)):
+    """Queue a batch of images for background processing and return its job id"""
+    uploads = [(file.filename, await file.read()) for file in files]
+    job_id = await run_in_threadpool(job_queue.create_job, uploads)
+    jobs_available.set()
+    return {
+        "job_id": job_id,
+        "total": len(uploads),
+        "status_url": f"/jobs/{job_id}",
+        "results_url": f"/jobs/{job_id}/results",
+        "events_url": f"/jobs/{job_id}/events"
+    }
+
+async def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = await run_in_threadpool(job_queue.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of a queued job"""
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, after: int = 0):
+    """Per-file results that finished after cursor `after`; pass the returned cursor to poll for more"""
+    job = await get_job_or_404(job_id)
+    results = await run_in_threadpool(job_queue.get_results, job_id, after)
+    return {
+        "job": job,
+        "results": results,
+        "cursor": results[-1]['cursor'] if results else after
+    }
+
+async def job_events(job_id: str, cursor: int):
+    last_progress = None
+    while True:
+        for result in await run_in_threadpool(job_queue.get_results, job_id, cursor):
+            cursor = result['cursor']
+            yield f"id: {cursor}\nevent: result\ndata: {json.dumps(result)}\n\n"
+
+        job = await run_in_threadpool(job_queue.get_job, job_id)
+        if job != last_progress:
+            yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+            last_progress = job
+        if job['status'] == 'completed':
+            yield "event: done\ndata: {}\n\n"
+            return
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, after: int = 0, last_event_id: Optional[str] = Header(None)):
+    """Server-sent events: one `result` per finished file, `progress` on change, then `done`"""
+    await get_job_or_404(job_id)
+    # EventSource reconnects with Last-Event-ID, which resumes after the last result received
+    cursor = int(last_event_id) if last_event_id and last_event_id.isdigit() else after
+    return StreamingResponse(job_events(job_id, cursor), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+def build_model_export(export_dir: str) -> str:
+    """Save the gallery into export_dir and pack it as an uncompressed zip, returning the zip path"""
+    gallery_dir = os.path.join(export_dir, "gallery")
+    face_model.export_model_data(gallery_dir)
+    zip_path = os.path.join(export_dir, "gallery.zip")
+    # Float32 encodings barely compress, so the archive is stored as-is
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name in GALLERY_FILES + CLUSTER_FILES:
+            if os.path.exists(os.path.join(gallery_dir, name)):
+                archive.write(os.path.join(gallery_dir, name), name)
+    return zip_path
+
 @app.get("/export-model")
 async def export_model():
-    """Export current model data"""
+    """Export the gallery as a zip of the gallery_store format"""
+    export_dir = tempfile.mkdtemp(prefix="face_export_")
+    try:
+        zip_path = await run_in_threadpool(build_model_export, export_dir)
+    except Exception as e:
+        shutil.rmtree(export_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(zip_path, media_type="application/zip",
+                        filename=f"face_gallery_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                        background=BackgroundTask(shutil.rmtree, export_dir, ignore_errors=True))
+
+def install_model_upload(contents: bytes) -> Dict[str, Any]:
+    """Unpack an exported gallery zip into GALLERY_PATH and load it"""
+    upload_dir = f"{os.path.abspath(GALLERY_PATH)}.upload-{os.getpid()}"
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    os.makedirs(upload_dir)
+    try:
+        with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+            # Only the known gallery files are extracted, never arbitrary archive paths; the
+            # cluster files are optional (older exports lack them)
+            present = set(archive.namelist())
+            for name in GALLERY_FILES + tuple(name for name in CLUSTER_FILES if name in present):
+                with archive.open(name) as src, open(os.path.join(upload_dir, name), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        install_gallery(upload_dir, GALLERY_PATH)
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"Not a valid gallery export: {str(e)}")
+    return face_model.import_model_data(GALLERY_PATH)
+
+@app.post("/import-model")
+async def import_model(file: UploadFile = File(...)):
+    """Replace the gallery with one produced by /export-model"""
+    contents = await file.read()
     try:
-        export_path = f"model_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        face_model.export_model_data(export_path)
-        return FileResponse(export_path, media_type="application/json")
+        meta = await run_in_threadpool(install_model_upload, contents)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"faces": meta["count"], "dim": meta["dim"], "version": meta["version"]}
 
 if __name__ == "__main__":
     import uvicorn
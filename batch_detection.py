@@ -0,0 +1,48 @@
+import numpy as np
+import face_recognition
+from collections import defaultdict
+from typing import List, Tuple, Dict
+
+
+def bucket_shape(shape: Tuple[int, ...], step: int = 128) -> Tuple[int, int]:
+    """Round an image's height and width up to a multiple of `step`"""
+    height, width = shape[:2]
+    return -(-height // step) * step, -(-width // step) * step
+
+
+def letterbox(image: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """Pad an image on the bottom and right to `shape`, so face coordinates are unchanged"""
+    height, width = image.shape[:2]
+    if (height, width) == tuple(shape):
+        return image
+    padded = np.zeros((shape[0], shape[1]) + image.shape[2:], dtype=image.dtype)
+    padded[:height, :width] = image
+    return padded
+
+
+def batch_cnn_face_locations(images: List[np.ndarray], batch_size: int = 32,
+                             step: int = 128) -> List[List[Tuple[int, int, int, int]]]:
+    """Run the CNN detector over many images in batches of similar size.
+
+    Images are grouped into buckets by size rounded up to `step`, letterboxed to the
+    bucket size and passed to face_recognition.batch_face_locations. Returns the face
+    locations for each input image, in input order.
+    """
+    buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for i, image in enumerate(images):
+        buckets[bucket_shape(image.shape, step)].append(i)
+
+    results: List[List[Tuple[int, int, int, int]]] = [[] for _ in images]
+    for shape, indices in buckets.items():
+        padded = [letterbox(images[i], shape) for i in indices]
+        batch_locations = face_recognition.batch_face_locations(
+            padded, number_of_times_to_upsample=1, batch_size=batch_size)
+
+        for i, face_locations in zip(indices, batch_locations):
+            height, width = images[i].shape[:2]
+            for top, right, bottom, left in face_locations:
+                # Detections that start inside the padding are not in the real image
+                if top >= height or left >= width:
+                    continue
+                results[i].append((max(top, 0), min(right, width), min(bottom, height), max(left, 0)))
+    return results
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from detection_scaling import downscale_for_detection, upscale_locations
+
+
+def list_images(input_dir):
+    image_paths = []
+    for root, _, files in os.walk(input_dir):
+        for file in files:
+            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                image_paths.append(os.path.join(root, file))
+    return sorted(image_paths)
+
+
+def make_detector(name):
+    """Return a function mapping an RGB image to (top, right, bottom, left) boxes"""
+    if name == 'haar':
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+        def detect(image):
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+            return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+        return detect
+
+    import face_recognition
+    return lambda image: face_recognition.face_locations(image, model=name)
+
+
+def iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def recall(found, reference, threshold=0.5):
+    if not reference:
+        return None
+    hits = sum(1 for ref in reference if any(iou(ref, box) >= threshold for box in found))
+    return hits / len(reference)
+
+
+def run(input_dir, detector_name, max_dims):
+    detect = make_detector(detector_name)
+    images = []
+    for image_path in list_images(input_dir):
+        image = cv2.imread(image_path)
+        if image is not None:
+            images.append((image_path, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+    results = []
+    reference = {}
+    for max_dim in [None] + max_dims:
+        elapsed, pixels, recalls, faces = 0.0, 0, [], 0
+        for image_path, image in images:
+            start = time.perf_counter()
+            small, scale = downscale_for_detection(image, max_dim)
+            found = upscale_locations(detect(small), scale, image.shape)
+            elapsed += time.perf_counter() - start
+            pixels += small.shape[0] * small.shape[1]
+            faces += len(found)
+            if max_dim is None:
+                reference[image_path] = found
+            else:
+                image_recall = recall(found, reference[image_path])
+                if image_recall is not None:
+                    recalls.append(image_recall)
+
+        row = {
+            'detector': detector_name,
+            'max_dim': max_dim,
+            'images': len(images),
+            'faces': faces,
+            'recall_vs_full': float(np.mean(recalls)) if recalls else 1.0,
+            'seconds': elapsed,
+            'images_per_second': len(images) / elapsed if elapsed else 0.0,
+            'megapixels_detected': pixels / 1e6
+        }
+        results.append(row)
+        print(f"max_dim={str(max_dim):>5}  faces={faces:4d}  recall={row['recall_vs_full']:.3f}  "
+              f"{row['images_per_second']:7.2f} img/s  {row['megapixels_detected']:8.1f} MP")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed/recall of detecting on downscaled images")
+    parser.add_argument('--input-dir', default='test_dataset')
+    parser.add_argument('--detector', default='hog', choices=['haar', 'hog', 'cnn'])
+    parser.add_argument('--max-dims', default='2048,1600,1280,1024,800,640', help="Comma-separated sizes to compare")
+    parser.add_argument('--output', help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    results = run(args.input_dir, args.detector, [int(d) for d in args.max_dims.split(',')])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+import numpy as np
+from face_index import BruteForceIndex, IVFIndex
+
+
+def make_gallery(size: int, dim: int = 128, seed: int = 0):
+    """Synthetic encodings with roughly the scale of dlib face encodings (unit-ish norm)"""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 1.0 / np.sqrt(dim), (size, dim)).astype(np.float32)
+
+
+def make_queries(gallery: np.ndarray, count: int, noise: float, seed: int = 1):
+    """Noisy copies of random gallery entries, standing in for new photos of known people"""
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(len(gallery), count, replace=False)
+    queries = gallery[sources] + rng.normal(0.0, noise / np.sqrt(gallery.shape[1]), (count, gallery.shape[1]))
+    return queries.astype(np.float32)
+
+
+def time_search(index, queries: np.ndarray, batch_size: int):
+    start = time.perf_counter()
+    ids = []
+    for offset in range(0, len(queries), batch_size):
+        _, batch_ids = index.search(queries[offset:offset + batch_size], k=1)
+        ids.append(batch_ids[:, 0])
+    elapsed = time.perf_counter() - start
+    return np.concatenate(ids), len(queries) / elapsed
+
+
+def run(sizes, num_queries, nprobes, noise, batch_size):
+    results = []
+    for size in sizes:
+        gallery = make_gallery(size)
+        queries = make_queries(gallery, num_queries, noise)
+        ids = np.arange(size)
+
+        exact = BruteForceIndex()
+        start = time.perf_counter()
+        exact.add(gallery, ids)
+        exact_build = time.perf_counter() - start
+        truth, exact_qps = time_search(exact, queries, batch_size)
+        results.append({'size': size, 'backend': 'exact', 'build_seconds': exact_build,
+                        'recall_at_1': 1.0, 'qps': exact_qps})
+        print(f"n={size:>8} exact           recall@1=1.000 qps={exact_qps:10.1f} build={exact_build:.2f}s")
+        del exact
+
+        nlist = max(16, int(4 * np.sqrt(size)))
+        ivf = IVFIndex(nlist=nlist, train_size=min(size, 64 * nlist))
+        start = time.perf_counter()
+        ivf.add(gallery, ids)
+        ivf_build = time.perf_counter() - start
+
+        for nprobe in nprobes:
+            ivf.nprobe = nprobe
+            found, qps = time_search(ivf, queries, batch_size)
+            recall = float(np.mean(found == truth))
+            results.append({'size': size, 'backend': 'ivf', 'nlist': nlist, 'nprobe': nprobe,
+                            'build_seconds': ivf_build, 'recall_at_1': recall, 'qps': qps})
+            print(f"n={size:>8} ivf nprobe={nprobe:<4} recall@1={recall:.3f} qps={qps:10.1f} build={ivf_build:.2f}s")
+        del ivf
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare exact and IVF face index recall@1 and throughput")
+    parser.add_argument('--sizes', default='10000,100000', help="Comma-separated gallery sizes")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--nprobe', default='1,4,16,64', help="Comma-separated nprobe values to sweep")
+    parser.add_argument('--noise', type=float, default=0.35, help="Query distance from its source encoding")
+    parser.add_argument('--batch-size', type=int, default=100, help="Queries per search call")
+    parser.add_argument('--output', help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    results = run([int(s) for s in args.sizes.split(',')], args.queries,
+                  [int(p) for p in args.nprobe.split(',')], args.noise, args.batch_size)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,198 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import cv2
+import numpy as np
+from benchmark_detection_scaling import list_images
+
+CATEGORIES = ('single_faces', 'multiple_faces', 'challenging_conditions')
+
+# Each configuration runs in its own process, so peak RSS is per configuration
+CONFIGURATIONS = {
+    'recognition-serial': {'processor': 'recognition', 'options': {'detection_policy': 'single'}, 'run': {}},
+    'recognition-cascade': {'processor': 'recognition', 'options': {'detection_policy': 'cascade'}, 'run': {}},
+    'recognition-batched': {'processor': 'recognition', 'options': {'detection_policy': 'single'}, 'run': {'batch_size': 8}},
+    'recognition-pool': {'processor': 'recognition', 'options': {'detection_policy': 'single'}, 'run': {'workers': None}},
+    'learning': {'processor': 'learning', 'options': {}, 'run': {}},
+}
+
+
+def git_commit() -> dict:
+    """The commit being measured, so results can be compared across commits"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def make_synthetic_corpus(sources, size: int, corpus_dir: str, seed: int = 0) -> str:
+    """`size` JPEG variants of the source images (rescaled, flipped, brightness-shifted), generated once.
+
+    Every variant has different pixels, so encoding caches cannot hide the work.
+    """
+    path = os.path.join(corpus_dir, f"synthetic_{size}_seed{seed}")
+    if len(list_images(path)) >= size:
+        return path
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(size):
+        image = cv2.imread(sources[i % len(sources)])
+        scale = rng.uniform(0.75, 1.5)
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        if rng.random() < 0.5:
+            image = cv2.flip(image, 1)
+        image = cv2.convertScaleAbs(image, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-20, 20))
+        cv2.imwrite(os.path.join(path, f"synthetic_{i:06d}.jpg"), image)
+    return path
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_configuration(name: str, config: dict, dataset_dir: str, workers: int) -> dict:
+    """Process one dataset with one configuration; runs in a fresh process"""
+    from pipeline_stats import PipelineStats
+    image_paths = list_images(dataset_dir)
+    stats = PipelineStats(keep_samples=True)
+    faces = 0
+    errors = 0
+
+    if config['processor'] == 'recognition':
+        from face_recognition_processor import FaceRecognitionProcessor
+        processor = FaceRecognitionProcessor(**config['options'])
+        # One image is analysed before the clock starts so the detectors and encoder are loaded and
+        # run once, as the learning model's preload does; pool workers fork from this warm process
+        if image_paths:
+            processor.analyze_image(image_paths[0])
+        processor.pipeline_stats = stats
+        run = dict(config['run'])
+        if 'workers' in run:
+            run['workers'] = workers
+        with tempfile.TemporaryDirectory(prefix='benchmark_output_') as output_dir:
+            start = time.perf_counter()
+            for _ in processor.iter_directory(dataset_dir, output_dir, keep_results=False, **run):
+                faces += 1
+            seconds = time.perf_counter() - start
+    else:
+        from face_learning_model import FaceLearningModel
+        from model_registry import registry
+        model = FaceLearningModel(**config['options'])
+        # Models load before the clock starts, as in the API after its warm-up. preload only
+        # logs failures, so a model the pipeline cannot run without is fetched again to raise
+        model.preload()
+        registry.get('face_recognition')
+        registry.get('face_visualizer')
+        model.pipeline_stats = stats
+        start = time.perf_counter()
+        for image_path in image_paths:
+            # process_image would turn every failure into "no faces", so errors are counted here
+            try:
+                faces += len(model.assign_identities(model.analyze_image(image_path)))
+            except Exception as e:
+                errors += 1
+                if errors == 1:
+                    print(f"learning: {image_path}: {str(e)}", file=sys.stderr)
+        seconds = time.perf_counter() - start
+
+    return {
+        'configuration': name,
+        'processor': config['processor'],
+        'options': config['options'],
+        'run': config['run'],
+        'images': len(image_paths),
+        'faces': faces,
+        'errors': errors,
+        'seconds': seconds,
+        'images_per_second': len(image_paths) / seconds if seconds else 0.0,
+        'stages': stats.report(),
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+        # ru_maxrss of RUSAGE_CHILDREN is the largest single worker, not the pool's total
+        'peak_largest_child_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    }
+
+
+def run(datasets, configurations, workers):
+    """Run every configuration on every dataset.
+
+    A configuration that raises, or finds no faces at all in a non-empty dataset, is not a
+    valid measurement: it is reported as failed with an 'error' and excluded from timing.
+    """
+    results = []
+    # spawn, so no configuration inherits another's memory or loaded models
+    context = multiprocessing.get_context('spawn')
+    for dataset, dataset_dir in datasets:
+        for name in configurations:
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_configuration, name, CONFIGURATIONS[name], dataset_dir, workers).result()
+            except Exception as e:
+                result = {'configuration': name, 'error': f"{type(e).__name__}: {str(e)}"}
+            else:
+                if result['images'] and not result['faces']:
+                    result['error'] = f"detected no faces in {result['images']} images ({result['errors']} errors)"
+            result['dataset'] = dataset
+            results.append(result)
+            if 'error' in result:
+                print(f"{dataset:<24} {name:<20} FAILED: {result['error']}")
+                continue
+            stages = '  '.join(f"{stage}={data['p50'] * 1000:.1f}/{data['p99'] * 1000:.1f}ms"
+                               for stage, data in result['stages'].items() if 'p50' in data)
+            print(f"{dataset:<24} {name:<20} {result['images']:>6} images {result['images_per_second']:8.2f}/s "
+                  f"peak {result['peak_rss_mb']:7.1f}MB  p50/p99 {stages}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput, per-stage latency percentiles and peak RSS of the face pipelines")
+    parser.add_argument('--dataset-dir', default='test_dataset')
+    parser.add_argument('--categories', default=','.join(CATEGORIES), help="Comma-separated dataset subdirectories")
+    parser.add_argument('--synthetic', default='', help="Comma-separated sizes of synthetic corpora built from the dataset")
+    parser.add_argument('--corpus-dir', default='.benchmark_corpus', help="Where synthetic corpora are generated and kept")
+    parser.add_argument('--configurations', default=','.join(CONFIGURATIONS), help="Comma-separated configuration names")
+    parser.add_argument('--workers', type=int, default=None, help="Pool size for pool configurations (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    configurations = [name for name in args.configurations.split(',') if name]
+    unknown = [name for name in configurations if name not in CONFIGURATIONS]
+    if unknown:
+        parser.error(f"unknown configurations {unknown}; choose from {list(CONFIGURATIONS)}")
+
+    datasets = [(category, os.path.join(args.dataset_dir, category)) for category in args.categories.split(',') if category]
+    if args.synthetic:
+        sources = [path for _, directory in datasets for path in list_images(directory)]
+        for size in (int(s) for s in args.synthetic.split(',')):
+            datasets.append((f"synthetic_{size}", make_synthetic_corpus(sources, size, args.corpus_dir, args.seed)))
+
+    results = run(datasets, configurations, args.workers)
+    failed = [result for result in results if 'error' in result]
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(),
+                'git': git_commit(),
+                'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                'cpus': os.cpu_count(), 'numpy': np.__version__, 'opencv': cv2.__version__},
+                'workers': args.workers,
+                'synthetic_seed': args.seed,
+                'results': results
+            }, f, indent=2)
+    if failed:
+        sys.exit(f"{len(failed)} of {len(results)} runs failed; see FAILED lines above")
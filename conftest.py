@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+import pytest
+
+
+def make_synthetic_faces(people: int = 6, faces_per_person: int = 20, seed: int = 0) -> np.ndarray:
+    """Tight clusters of 128-d encodings, far apart compared with the default tolerance"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.1, (people, 128))
+    return np.concatenate([center + rng.normal(0, 0.01, (faces_per_person, 128)) for center in centers]).astype(np.float32)
+
+
+@pytest.fixture
+def synthetic_faces():
+    return make_synthetic_faces
+
+
+class FakeShape:
+    """(68, 2) points standing in for a dlib full_object_detection"""
+
+    def __init__(self, location, points):
+        self.location = location
+        self.points = points
+
+    def parts(self):
+        return [type('Point', (), {'x': int(x), 'y': int(y)})() for x, y in self.points]
+
+
+class FakeRect:
+    """dlib rectangle for a (top, right, bottom, left) location"""
+
+    def __init__(self, location):
+        self._top, self._right, self._bottom, self._left = location
+
+    def top(self):
+        return self._top
+
+    def right(self):
+        return self._right
+
+    def bottom(self):
+        return self._bottom
+
+    def left(self):
+        return self._left
+
+
+class FakeHogDetector:
+    """dlib HOG detector returning the fake's locations with fixed scores"""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.score = 1.0
+
+    def run(self, image, upsample, threshold):
+        self.fake.detector_calls.append('hog_scored')
+        return [FakeRect(location) for location in self.fake.locations], [self.score] * len(self.fake.locations), []
+
+
+class FakeFaceRecognition:
+    """Deterministic stand-in for the face_recognition module that counts detector calls and shape predictions"""
+
+    def __init__(self, face_locations=((10, 50, 50, 10),)):
+        self.locations = [tuple(location) for location in face_locations]
+        self.shape_calls = 0
+        self.detector_calls = []
+        self.api = self
+        self.face_encoder = self
+        self.face_detector = FakeHogDetector(self)
+
+    def face_locations(self, image, number_of_times_to_upsample=1, model='hog'):
+        self.detector_calls.append(model)
+        return list(self.locations)
+
+    def batch_face_locations(self, images, number_of_times_to_upsample=1, batch_size=128):
+        self.detector_calls.append(('cnn_batch', len(images)))
+        return [list(self.locations) for _ in images]
+
+    def load_image_file(self, file):
+        if hasattr(file, 'read'):
+            data = file.read()
+        else:
+            with open(file, 'rb') as f:
+                data = f.read()
+        return cv2.cvtColor(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+    def _css_to_rect(self, location):
+        return location
+
+    def landmarks(self, location):
+        """68 points spread over the box's diagonal; tests replace this to place the eyes"""
+        top, right, bottom, left = location
+        return [(left + (right - left) * i // 68, top + (bottom - top) * i // 68) for i in range(68)]
+
+    def pose_predictor_68_point(self, image, rect):
+        self.shape_calls += 1
+        return FakeShape(rect, self.landmarks(rect))
+
+    def compute_face_descriptor(self, image, shape, num_jitters=1):
+        top, right, bottom, left = shape.location
+        seed = int(image[top:bottom, left:right].mean() * 1000)
+        return np.random.default_rng(seed).normal(0, 0.1, 128)
+
+
+@pytest.fixture
+def fake_face_recognition(monkeypatch):
+    """A FakeFaceRecognition installed in the model registry in place of face_recognition"""
+    from model_registry import registry
+    fake = FakeFaceRecognition()
+    monkeypatch.setitem(registry._models, 'face_recognition', fake)
+    return fake
+
+
+@pytest.fixture
+def fake_face_visualizer(monkeypatch):
+    """A visualizer with an empty characteristics report, installed in the model registry"""
+    from model_registry import registry
+    visualizer = type('FakeFaceVisualizer', (), {'create_characteristics_report': lambda self, region: {}})()
+    monkeypatch.setitem(registry._models, 'face_visualizer', visualizer)
+    return visualizer
@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+from typing import List, Tuple, Dict, Any, Optional
+
+
+def downscale_for_detection(image: np.ndarray, max_dim: Optional[int]) -> Tuple[np.ndarray, float]:
+    """Shrink an image so its longest side is at most max_dim, returning (image, scale)"""
+    if not max_dim:
+        return image, 1.0
+    longest = max(image.shape[:2])
+    if longest <= max_dim:
+        return image, 1.0
+    scale = max_dim / float(longest)
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def upscale_locations(face_locations: List[Tuple[int, int, int, int]], scale: float,
+                      shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+    """Map (top, right, bottom, left) boxes found at `scale` back to full resolution"""
+    if scale == 1.0:
+        return list(face_locations)
+    height, width = shape[:2]
+    return [
+        (max(int(round(top / scale)), 0), min(int(round(right / scale)), width),
+         min(int(round(bottom / scale)), height), max(int(round(left / scale)), 0))
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def upscale_boxes(faces: List[Dict[str, Any]], scale: float, shape: Tuple[int, ...]) -> List[Dict[str, Any]]:
+    """Map {'x', 'y', 'w', 'h'} detections (and any eye points) found at `scale` back to full resolution"""
+    if scale == 1.0:
+        return faces
+    height, width = shape[:2]
+    for face in faces:
+        x, y = int(round(face['x'] / scale)), int(round(face['y'] / scale))
+        face['x'], face['y'] = max(x, 0), max(y, 0)
+        face['w'] = min(int(round(face['w'] / scale)), width - face['x'])
+        face['h'] = min(int(round(face['h'] / scale)), height - face['y'])
+        for eye in ('left_eye', 'right_eye'):
+            if face.get(eye) is not None:
+                face[eye] = (face[eye][0] / scale, face[eye][1] / scale)
+    return faces
+
+
+def crop_face(image: np.ndarray, face_location: Tuple[int, int, int, int],
+              margin: float = 0.25) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+    """Native-resolution crop around a face plus a margin for the landmark model.
+
+    Returns the crop and the face location relative to it.
+    """
+    top, right, bottom, left = face_location
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    height, width = image.shape[:2]
+    y0, x0 = max(top - pad_y, 0), max(left - pad_x, 0)
+    y1, x1 = min(bottom + pad_y, height), min(right + pad_x, width)
+    return image[y0:y1, x0:x1], (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def equalization_lut(gray: np.ndarray) -> np.ndarray:
+    """Histogram-equalisation lookup table, so a LUT from a downscaled image can equalise full-res crops"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    cdf = np.cumsum(hist)
+    first = cdf[np.flatnonzero(hist)[0]] if hist.any() else 0.0
+    total = cdf[-1]
+    if total == first:
+        return np.arange(256, dtype=np.uint8)
+    return np.clip(np.round((cdf - first) * 255.0 / (total - first)), 0, 255).astype(np.uint8)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import struct
+import logging
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAGIC = b'FENC'
+CACHE_VERSION = 1
+# magic, version, face count, encoding dim, quality field count, quality names length, extras length
+_HEADER = struct.Struct('<4sBIHHII')
+
+
+def hash_bytes(data: bytes) -> str:
+    """Content hash used as the image part of a cache key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_array(image: np.ndarray) -> str:
+    """Content hash of a decoded image, including its shape and dtype"""
+    digest = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """Content-addressed on-disk cache of face locations, encodings and quality metrics.
+
+    Entries are keyed by the image content hash plus the detector/encoder settings that
+    produced them, stored in a small binary format and evicted least-recently-used once
+    the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = '.encoding_cache', max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = self._scan()[1]
+
+    def key(self, content_hash: str, settings: Dict[str, Any]) -> str:
+        """Combine an image content hash with the settings that affect its results"""
+        payload = json.dumps({'content': content_hash, 'settings': settings, 'version': CACHE_VERSION}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.bin")
+
+    def _scan(self):
+        entries, total = [], 0
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.bin'):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        return entries, total
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for a key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = self._decode(data)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (ValueError, struct.error) as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {str(e)}")
+            self._discard(path)
+            self.misses += 1
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Store an entry with face_locations, face_encodings, quality and optional extras"""
+        data = self._encode(entry)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._total_bytes += len(data)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _discard(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Delete least-recently-used entries until the cache is back under 90% of max_bytes"""
+        # Rescan rather than trusting the running total, other processes may share the directory
+        entries, total = self._scan()
+        entries.sort()
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._discard(path)
+            total -= size
+        self._total_bytes = total
+
+    @staticmethod
+    def _encode(entry: Dict[str, Any]) -> bytes:
+        locations = np.asarray(entry['face_locations'], dtype=np.int32).reshape(-1, 4)
+        encodings = np.asarray(entry['face_encodings'], dtype=np.float32)
+        encodings = encodings.reshape(len(locations), encodings.shape[-1] if len(locations) else 128)
+        quality = entry.get('quality') or [{} for _ in range(len(locations))]
+        names = sorted(quality[0].keys()) if quality else []
+        quality_matrix = np.asarray([[q[name] for name in names] for q in quality], dtype=np.float32).reshape(len(locations), len(names))
+        names_blob = '\n'.join(names).encode()
+        extras_blob = json.dumps(entry['extras']).encode() if entry.get('extras') is not None else b''
+
+        header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(locations), encodings.shape[1],
+                              len(names), len(names_blob), len(extras_blob))
+        return b''.join([header, names_blob, extras_blob, locations.tobytes(), encodings.tobytes(), quality_matrix.tobytes()])
+
+    @staticmethod
+    def _decode(data: bytes) -> Dict[str, Any]:
+        magic, version, count, dim, num_fields, names_len, extras_len = _HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError("not a current encoding cache entry")
+
+        offset = _HEADER.size
+        names = data[offset:offset + names_len].decode().split('\n') if names_len else []
+        offset += names_len
+        extras = json.loads(data[offset:offset + extras_len]) if extras_len else None
+        offset += extras_len
+
+        locations = np.frombuffer(data, dtype=np.int32, count=count * 4, offset=offset).reshape(count, 4)
+        offset += locations.nbytes
+        encodings = np.frombuffer(data, dtype=np.float32, count=count * dim, offset=offset).reshape(count, dim)
+        offset += encodings.nbytes
+        quality = np.frombuffer(data, dtype=np.float32, count=count * num_fields, offset=offset).reshape(count, num_fields)
+        if offset + quality.nbytes != len(data):
+            raise ValueError("truncated encoding cache entry")
+
+        return {
+            'face_locations': [tuple(int(v) for v in location) for location in locations],
+            'face_encodings': [encoding.astype(np.float64) for encoding in encodings],
+            'quality': [{name: float(value) for name, value in zip(names, row)} for row in quality],
+            'extras': extras
+        }
@@ -1,15 +1,19 @@
 import cv2
 import numpy as np
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterable, Iterator, Optional
 import logging
-from deepface import DeepFace
-from deepface.commons import functions
+from model_registry import registry
+from detection_scaling import downscale_for_detection, upscale_boxes
+from face_quality import score_face
+from face_landmarks import predict_shapes, shapes_to_arrays, eye_centers
 
 class FaceDetectionProcessor:
-    def __init__(self, detection_backend: str = "opencv"):
+    def __init__(self, detection_backend: str = "opencv", max_detection_dim: int = None,
+                 detectors: Tuple[str, ...] = ("haar", "deepface")):
         self.detection_backend = detection_backend
+        self.max_detection_dim = max_detection_dim
+        self.detectors = detectors
         self.logger = self._setup_logger()
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         
     def _setup_logger(self):
         logger = logging.getLogger('FaceDetection')
@@ -20,8 +24,26 @@ class FaceDetectionProcessor:
         logger.addHandler(handler)
         return logger
 
+    @property
+    def face_cascade(self):
+        # Loaded on first use so importing this module stays cheap
+        return registry.get('haar_frontalface')
+
+    def preload(self):
+        """Load the models detect_faces and align_faces will use, e.g. at service startup"""
+        names = ['face_recognition']
+        if 'haar' in self.detectors:
+            names.append('haar_frontalface')
+        if 'deepface' in self.detectors:
+            names.append(f'deepface_detector:{self.detection_backend}')
+        return registry.preload(names)
+
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """Preprocess image for better face detection"""
+        return cv2.cvtColor(self._haar_input(image), cv2.COLOR_GRAY2RGB)
+
+    def _haar_input(self, image: np.ndarray) -> np.ndarray:
+        """Equalised, thresholded and filtered grayscale image for the Haar cascade"""
         # Convert to grayscale
         gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         
@@ -33,62 +55,65 @@ class FaceDetectionProcessor:
                                    cv2.THRESH_BINARY, 11, 2)
         
         # Apply bilateral filter for noise reduction while preserving edges
-        gray = cv2.bilateralFilter(gray, 9, 75, 75)
-        
-        # Convert back to RGB
-        return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+        return cv2.bilateralFilter(gray, 9, 75, 75)
 
     def detect_faces(self, image: np.ndarray) -> List[Dict[str, Any]]:
         """Detect faces using multiple methods and combine results"""
-        processed_image = self.preprocess_image(image)
+        # Large photos are searched at a bounded size and the boxes mapped back afterwards
+        full_shape = image.shape
+        image, scale = downscale_for_detection(image, self.max_detection_dim)
         
         # Initialize results
         all_faces = []
         
-        # Method 1: Haar Cascade
-        try:
-            faces_haar = self.face_cascade.detectMultiScale(
-                processed_image,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
-            for (x, y, w, h) in faces_haar:
-                all_faces.append({
-                    'x': x,
-                    'y': y,
-                    'w': w,
-                    'h': h,
-                    'confidence': 1.0,
-                    'method': 'haar'
-                })
-        except Exception as e:
-            self.logger.warning(f"Error in Haar cascade detection: {str(e)}")
+        # Method 1: Haar Cascade, the only consumer of the expensive preprocessing
+        if 'haar' in self.detectors:
+            try:
+                faces_haar = self.face_cascade.detectMultiScale(
+                    self._haar_input(image),
+                    scaleFactor=1.1,
+                    minNeighbors=5,
+                    minSize=(30, 30)
+                )
+                for (x, y, w, h) in faces_haar:
+                    all_faces.append({
+                        'x': x,
+                        'y': y,
+                        'w': w,
+                        'h': h,
+                        'confidence': 1.0,
+                        'method': 'haar'
+                    })
+            except Exception as e:
+                self.logger.warning(f"Error in Haar cascade detection: {str(e)}")
         
-        # Method 2: DeepFace
-        try:
-            faces_deepface = DeepFace.extract_faces(
-                img_path=image,
-                target_size=(224, 224),
-                detector_backend=self.detection_backend,
-                enforce_detection=False
-            )
-            for face in faces_deepface:
-                all_faces.append({
-                    'x': face['facial_area']['x'],
-                    'y': face['facial_area']['y'],
-                    'w': face['facial_area']['w'],
-                    'h': face['facial_area']['h'],
-                    'confidence': face['confidence'],
-                    'method': 'deepface'
-                })
-        except Exception as e:
-            self.logger.warning(f"Error in DeepFace detection: {str(e)}")
+        # Method 2: DeepFace, whose eye positions (reported by newer DeepFace releases) are kept for alignment
+        if 'deepface' in self.detectors:
+            try:
+                faces_deepface = registry.get('deepface').extract_faces(
+                    img_path=image,
+                    target_size=(224, 224),
+                    detector_backend=self.detection_backend,
+                    enforce_detection=False
+                )
+                for face in faces_deepface:
+                    all_faces.append({
+                        'x': face['facial_area']['x'],
+                        'y': face['facial_area']['y'],
+                        'w': face['facial_area']['w'],
+                        'h': face['facial_area']['h'],
+                        'confidence': face['confidence'],
+                        'method': 'deepface',
+                        'left_eye': face['facial_area'].get('left_eye'),
+                        'right_eye': face['facial_area'].get('right_eye')
+                    })
+            except Exception as e:
+                self.logger.warning(f"Error in DeepFace detection: {str(e)}")
         
         # Remove duplicate detections
         unique_faces = self._remove_duplicates(all_faces)
         
-        return unique_faces
+        return upscale_boxes(unique_faces, scale, full_shape)
 
     def _remove_duplicates(self, faces: List[Dict[str, Any]], iou_threshold: float = 0.3) -> List[Dict[str, Any]]:
         """Remove duplicate face detections using IoU"""
@@ -115,6 +140,9 @@ class FaceDetectionProcessor:
                 iou = self._calculate_iou(face1, face2)
                 if iou > iou_threshold:
                     used_indices.add(j)
+                    # Keep the eyes of a suppressed DeepFace box for the Haar box that won
+                    if face1.get('left_eye') is None and face2.get('left_eye') is not None:
+                        face1['left_eye'], face1['right_eye'] = face2['left_eye'], face2.get('right_eye')
         
         return unique_faces
 
@@ -136,69 +164,86 @@ class FaceDetectionProcessor:
 
     def align_face(self, image: np.ndarray, face: Dict[str, Any]) -> np.ndarray:
         """Align face using facial landmarks"""
+        return self.align_faces(image, [face])[0]
+
+    def align_faces(self, image: np.ndarray, faces: List[Dict[str, Any]]) -> List[np.ndarray]:
+        """Crop every face and rotate it so the eyes are level.
+
+        Eye positions come from detection where the detector reports them (newer DeepFace
+        releases); the other faces, e.g. Haar boxes, get them from one 68-point landmark
+        pass. The rotation matrices for all faces are built in one vectorized step and each
+        warp samples the full image directly, so rotated corners hold real pixels rather
+        than black fill.
+        """
+        if not faces:
+            return []
         try:
-            # Extract face region
-            x, y, w, h = face['x'], face['y'], face['w'], face['h']
-            face_img = image[y:y+h, x:x+w]
+            boxes = np.array([[face['x'], face['y'], face['w'], face['h']] for face in faces], dtype=np.float64)
+            eyes = [(face.get('left_eye'), face.get('right_eye')) for face in faces]
+            missing = [i for i, (left, right) in enumerate(eyes) if left is None or right is None]
+            if missing:
+                locations = [(faces[i]['y'], faces[i]['x'] + faces[i]['w'], faces[i]['y'] + faces[i]['h'], faces[i]['x'])
+                             for i in missing]
+                for i, points in zip(missing, shapes_to_arrays(predict_shapes(image, locations))):
+                    eyes[i] = eye_centers(points)
+            eyes_a = np.array([left for left, _ in eyes], dtype=np.float64)
+            eyes_b = np.array([right for _, right in eyes], dtype=np.float64)
             
-            # Get facial landmarks
-            landmarks = DeepFace.extract_faces(
-                img_path=face_img,
-                target_size=(224, 224),
-                detector_backend=self.detection_backend,
-                enforce_detection=False
-            )
-            
-            if not landmarks:
-                return face_img
-                
-            # Get eye positions
-            left_eye = np.mean(landmarks[0]['facial_area']['left_eye'], axis=0)
-            right_eye = np.mean(landmarks[0]['facial_area']['right_eye'], axis=0)
+            # Measure from the eye on the image left to the one on the image right, whichever
+            # way the detector names them, so faces are never turned upside down
+            swap = eyes_a[:, 0] > eyes_b[:, 0]
+            eyes_a[swap], eyes_b[swap] = eyes_b[swap], eyes_a[swap].copy()
+            delta = eyes_b - eyes_a
+            angles = np.arctan2(delta[:, 1], delta[:, 0])
             
-            # Calculate angle
-            eye_angle = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+            # cv2.getRotationMatrix2D about each box centre, for every face at once
+            cos, sin = np.cos(angles), np.sin(angles)
+            cx, cy = boxes[:, 2] // 2, boxes[:, 3] // 2
+            matrices = np.empty((len(faces), 2, 3))
+            matrices[:, 0, 0], matrices[:, 0, 1] = cos, sin
+            matrices[:, 1, 0], matrices[:, 1, 1] = -sin, cos
+            matrices[:, 0, 2] = (1 - cos) * cx - sin * cy
+            matrices[:, 1, 2] = sin * cx + (1 - cos) * cy
+            # Fold in the crop offset so the warp reads from full-image coordinates
+            matrices[:, :, 2] -= np.einsum('nij,nj->ni', matrices[:, :, :2], boxes[:, :2])
             
-            # Rotate image
-            center = (w//2, h//2)
-            rotation_matrix = cv2.getRotationMatrix2D(center, eye_angle, 1.0)
-            aligned_face = cv2.warpAffine(face_img, rotation_matrix, (w, h))
-            
-            return aligned_face
+            return [cv2.warpAffine(image, matrix, (int(w), int(h)))
+                    for matrix, (_, _, w, h) in zip(matrices, boxes)]
             
         except Exception as e:
             self.logger.warning(f"Error in face alignment: {str(e)}")
-            return image[y:y+h, x:x+w]
+            return [image[face['y']:face['y'] + face['h'], face['x']:face['x'] + face['w']] for face in faces]
+
+    def _analyze(self, image_path: str, align: bool = True) -> List[Dict[str, Any]]:
+        """Detect, score and (optionally) align every face in an image"""
+        # Load image
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not load image: {image_path}")
+        
+        # Convert to RGB
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        
+        # Detect faces
+        faces = self.detect_faces(image)
+        
+        # Align every face in one pass and score the aligned crops, so quality does not
+        # depend on head tilt; the pixels are only returned when wanted
+        aligned_faces = self.align_faces(image, faces)
+        face_quality = [score_face(aligned_face) for aligned_face in aligned_faces]
+        
+        processed_faces = []
+        for face, aligned_face, quality_metrics in zip(faces, aligned_faces, face_quality):
+            processed_face = {'location': face, 'quality_metrics': quality_metrics}
+            if align:
+                processed_face['aligned_face'] = aligned_face
+            processed_faces.append(processed_face)
+        return processed_faces
 
     def process_image(self, image_path: str) -> Dict[str, Any]:
         """Process an image and return detected faces with metadata"""
         try:
-            # Load image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not load image: {image_path}")
-            
-            # Convert to RGB
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces
-            faces = self.detect_faces(image)
-            
-            # Process each face
-            processed_faces = []
-            for face in faces:
-                # Align face
-                aligned_face = self.align_face(image, face)
-                
-                # Get face quality metrics
-                quality_metrics = self._get_face_quality(aligned_face)
-                
-                processed_faces.append({
-                    'location': face,
-                    'aligned_face': aligned_face,
-                    'quality_metrics': quality_metrics
-                })
-            
+            processed_faces = self._analyze(image_path)
             return {
                 'total_faces': len(processed_faces),
                 'faces': processed_faces
@@ -212,40 +257,19 @@ class FaceDetectionProcessor:
                 'error': str(e)
             }
 
-    def _get_face_quality(self, face_img: np.ndarray) -> Dict[str, float]:
-        """Get quality metrics for a face image"""
-        quality_metrics = {
-            'brightness': 0.0,
-            'sharpness': 0.0,
-            'contrast': 0.0,
-            'blur': 0.0
-        }
-        
-        try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(face_img, cv2.COLOR_RGB2GRAY)
-            
-            # Brightness
-            brightness = np.mean(gray)
-            quality_metrics['brightness'] = 1.0 - abs(brightness - 127) / 127
-            
-            # Sharpness
-            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-            quality_metrics['sharpness'] = min(np.var(laplacian) / 1000, 1.0)
-            
-            # Contrast
-            quality_metrics['contrast'] = min(np.std(gray) / 128, 1.0)
-            
-            # Blur
-            quality_metrics['blur'] = self._assess_blur(gray)
-            
-        except Exception as e:
-            self.logger.warning(f"Error in quality assessment: {str(e)}")
+    def iter_images(self, image_paths: Iterable[str], include_pixels: bool = False) -> Iterator[Dict[str, Any]]:
+        """Yield one record per detected face, image by image.
         
-        return quality_metrics
-
-    def _assess_blur(self, gray_img: np.ndarray) -> float:
-        """Assess image blur using Laplacian variance"""
-        laplacian = cv2.Laplacian(gray_img, cv2.CV_64F)
-        variance = np.var(laplacian)
-        return min(variance / 1000, 1.0) 
\ No newline at end of file
+        Records hold image_path, face_index, location and quality_metrics; aligned_face is
+        only included with include_pixels. Nothing is kept between images, so
+        memory does not grow with the number of images (see face_stream.py for sinks).
+        Images that fail to load are logged and skipped.
+        """
+        for image_path in image_paths:
+            try:
+                processed_faces = self._analyze(image_path, align=include_pixels)
+            except Exception as e:
+                self.logger.error(f"Error processing image {image_path}: {str(e)}")
+                continue
+            for face_index, processed_face in enumerate(processed_faces):
+                yield {'image_path': image_path, 'face_index': face_index, **processed_face}
@@ -0,0 +1,98 @@
+import numpy as np
+from typing import List, Tuple, Any, Optional
+from face_index import FaceIndex, BruteForceIndex
+
+
+class FaceGallery:
+    """Known face encodings held in a nearest-neighbour index, with a parallel array of person IDs"""
+
+    def __init__(self, dim: int = 128, chunk_size: int = 1024, index: Optional[FaceIndex] = None):
+        self.dim = dim
+        self.chunk_size = chunk_size
+        self.index = index if index is not None else BruteForceIndex(dim, chunk_size)
+        self._next_id = 0
+        self._person_ids = np.empty(chunk_size, dtype=object)
+
+    @classmethod
+    def from_arrays(cls, encodings: np.ndarray, person_ids: np.ndarray, sq_norms: Optional[np.ndarray] = None,
+                    index: Optional[FaceIndex] = None, chunk_size: int = 1024) -> 'FaceGallery':
+        """Build a gallery whose entry IDs are the rows of `encodings`.
+
+        With the default exact index the arrays are used in place, so memory-mapped arrays
+        from gallery_store.load_gallery are not read at load time; the first change to the
+        gallery copies them into writable arrays once. Other indexes copy them in.
+        """
+        dim = encodings.shape[1]
+        if index is None:
+            index = BruteForceIndex.from_arrays(encodings, np.arange(len(encodings), dtype=np.int64), sq_norms, chunk_size)
+        elif len(encodings):
+            index.add(encodings, range(len(encodings)))
+        gallery = cls(dim, chunk_size, index)
+        gallery._person_ids = person_ids
+        gallery._next_id = len(encodings)
+        return gallery
+
+    def to_arrays(self) -> Tuple[np.ndarray, List[Any]]:
+        """(encodings, person_ids) for every stored entry, in entry ID order"""
+        entry_ids, encodings = self.index.vectors()
+        order = np.argsort(entry_ids, kind='stable')
+        return encodings[order], [self._person_ids[entry_id] for entry_id in entry_ids[order]]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def person_ids(self) -> np.ndarray:
+        """Person ID for each gallery entry ID (None for removed entries)"""
+        return self._person_ids[:self._next_id]
+
+    def _make_room(self, capacity: int, person_id: Any):
+        """Ensure person ID storage is writable, holds `capacity` entries and can store `person_id`.
+
+        A fixed-width unicode array (as loaded by gallery_store) stays one, widened if
+        needed, so it is grown with a plain copy rather than one Python object per entry.
+        """
+        dtype = self._person_ids.dtype
+        if dtype.kind == 'U':
+            if not isinstance(person_id, str):
+                dtype = np.dtype(object)
+            elif len(person_id) > dtype.itemsize // 4:
+                dtype = np.dtype(f'<U{len(person_id)}')
+        if capacity <= len(self._person_ids) and dtype == self._person_ids.dtype and self._person_ids.flags.writeable:
+            return
+        size = len(self._person_ids)
+        if capacity > size:
+            size += max(self.chunk_size, capacity - size)
+        person_ids = np.empty(size, dtype=dtype)
+        person_ids[:self._next_id] = self._person_ids[:self._next_id]
+        self._person_ids = person_ids
+
+    def add(self, encoding: np.ndarray, person_id: Any) -> int:
+        """Insert one encoding and return its gallery entry ID"""
+        entry_id = self._next_id
+        self._make_room(entry_id + 1, person_id)
+        self.index.add(np.asarray(encoding, dtype=np.float32)[None, :], [entry_id])
+        self._person_ids[entry_id] = person_id
+        self._next_id += 1
+        return entry_id
+
+    def set_person(self, entry_id: int, person_id: Any):
+        """Move an entry to another person"""
+        self._make_room(self._next_id, person_id)
+        self._person_ids[entry_id] = person_id
+
+    def remove(self, entry_ids: List[int]):
+        """Drop entries from the gallery"""
+        self.index.remove(entry_ids)
+        # Removed entries are marked None
+        self._make_room(self._next_id, None)
+        for entry_id in entry_ids:
+            self._person_ids[entry_id] = None
+
+    def best_matches(self, encodings: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Entry ID and distance of the closest stored encoding for each query (-1 / inf when empty)"""
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(self.index) == 0:
+            return np.full(len(queries), -1, dtype=np.int64), np.full(len(queries), np.inf, dtype=np.float32)
+        distances, entry_ids = self.index.search(queries, k=1)
+        return entry_ids[:, 0], distances[:, 0]
@@ -0,0 +1,330 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple, Iterable, Optional
+
+
+class FaceIndex(ABC):
+    """Nearest-neighbour index over face encodings keyed by integer IDs"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of stored entries"""
+
+    @abstractmethod
+    def add(self, vectors: np.ndarray, ids: Iterable[int]):
+        """Insert encodings under the given IDs"""
+
+    @abstractmethod
+    def remove(self, ids: Iterable[int]):
+        """Delete encodings by ID, ignoring IDs that are not present"""
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (distances, ids) of shape (m, k), padded with inf / -1 when fewer than k results exist"""
+
+    @abstractmethod
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, encodings) for every stored entry"""
+
+
+def _as_matrix(vectors, dim: int) -> np.ndarray:
+    return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, dim))
+
+
+def _top_k(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Select the k smallest distances per row, sorted, padding short rows with inf / -1"""
+    m, n = distances.shape
+    if n < k:
+        distances = np.hstack([distances, np.full((m, k - n), np.inf, dtype=np.float32)])
+        ids = np.hstack([ids, np.full((m, k - n), -1, dtype=np.int64)])
+    elif n > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(distances, axis=1, kind='stable')
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class BruteForceIndex(FaceIndex):
+    """Exact index: a contiguous float32 matrix that grows in chunks and is scanned with matrix products.
+
+    Searches walk the stored vectors in tiles of `search_block` rows and keep a running
+    top-k per query, so a search over a large gallery needs memory for one
+    (queries x search_block) tile rather than a full (queries x gallery) distance matrix.
+    """
+
+    def __init__(self, dim: int = 128, chunk_size: int = 1024, search_block: int = 8192):
+        self.dim = dim
+        self.chunk_size = chunk_size
+        self.search_block = search_block
+        self._size = 0
+        self._vectors = np.empty((chunk_size, dim), dtype=np.float32)
+        self._sq_norms = np.empty(chunk_size, dtype=np.float32)
+        self._ids = np.empty(chunk_size, dtype=np.int64)
+        self._row_map: Optional[Dict[int, int]] = {}
+
+    @classmethod
+    def from_arrays(cls, vectors: np.ndarray, ids: np.ndarray, sq_norms: Optional[np.ndarray] = None,
+                    chunk_size: int = 1024) -> 'BruteForceIndex':
+        """Wrap existing arrays (e.g. memory-mapped ones) without copying them.
+
+        Read-only arrays are copied into growable ones only when the index is first modified.
+        """
+        index = cls(vectors.shape[1], chunk_size)
+        index._vectors = vectors
+        index._sq_norms = sq_norms if sq_norms is not None else np.einsum('ij,ij->i', vectors, vectors)
+        index._ids = ids
+        index._size = len(vectors)
+        # The ID -> row map is only needed for updates, so it is built on first use
+        index._row_map = None
+        return index
+
+    @property
+    def _rows(self) -> Dict[int, int]:
+        if self._row_map is None:
+            self._row_map = {int(face_id): row for row, face_id in enumerate(self._ids[:self._size])}
+        return self._row_map
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays in whole chunks so appends stay amortised O(1)"""
+        if capacity <= len(self._vectors) and self._vectors.flags.writeable:
+            return
+        new_capacity = -(-capacity // self.chunk_size) * self.chunk_size
+
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        ids = np.empty(new_capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+
+        self._vectors, self._sq_norms, self._ids = vectors, sq_norms, ids
+
+    def add(self, vectors: np.ndarray, ids: Iterable[int]):
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(vectors)} vectors but {len(ids)} ids")
+        for face_id in ids:
+            if int(face_id) in self._rows:
+                raise ValueError(f"ID {face_id} is already in the index")
+
+        start = self._size
+        self._reserve(start + len(vectors))
+        end = start + len(vectors)
+        self._vectors[start:end] = vectors
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self._ids[start:end] = ids
+        for offset, face_id in enumerate(ids):
+            self._rows[int(face_id)] = start + offset
+        self._size = end
+
+    def remove(self, ids: Iterable[int]):
+        self._reserve(self._size)
+        for face_id in ids:
+            row = self._rows.pop(int(face_id), None)
+            if row is None:
+                continue
+            # Keep the matrix dense by moving the last row into the hole
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._ids[row] = self._ids[last]
+                self._rows[int(self._ids[row])] = row
+            self._size = last
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """Euclidean distances between each query and every stored vector, shape (m, len(self))"""
+        queries = _as_matrix(queries, self.dim)
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, computed for all pairs in one matrix product
+        sq = np.einsum('ij,ij->i', queries, queries)[:, None] + self._sq_norms[:self._size][None, :]
+        sq -= 2.0 * (queries @ self._vectors[:self._size].T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_matrix(queries, self.dim)
+        m = len(queries)
+        best_sq = np.full((m, k), np.inf, dtype=np.float32)
+        best_rows = np.full((m, k), -1, dtype=np.int64)
+        q_sq = np.einsum('ij,ij->i', queries, queries)[:, None]
+        for start in range(0, self._size, self.search_block):
+            end = min(start + self.search_block, self._size)
+            # Squared distances for this tile only; the sqrt is taken on the k winners at the end
+            sq = q_sq + self._sq_norms[start:end][None, :]
+            sq -= 2.0 * (queries @ self._vectors[start:end].T)
+            if k == 1:
+                col = np.argmin(sq, axis=1)
+                tile_best = sq[np.arange(m), col]
+                better = tile_best < best_sq[:, 0]
+                best_sq[better, 0] = tile_best[better]
+                best_rows[better, 0] = start + col[better]
+            else:
+                tile_sq, tile_rows = _top_k(sq, np.broadcast_to(np.arange(start, end), sq.shape), k)
+                best_sq, best_rows = _top_k(np.hstack([best_sq, tile_sq]), np.hstack([best_rows, tile_rows]), k)
+
+        np.maximum(best_sq, 0.0, out=best_sq)
+        ids = np.full((m, k), -1, dtype=np.int64)
+        found = best_rows >= 0
+        ids[found] = self._ids[best_rows[found]]
+        return np.sqrt(best_sq, out=best_sq), ids
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._ids[:self._size], self._vectors[:self._size]
+
+
+class IVFIndex(FaceIndex):
+    """Approximate inverted-file index: k-means coarse quantiser with one exact list per centroid.
+
+    `nprobe` is the recall/latency knob: each query scans only the `nprobe` closest lists.
+    Vectors added before the index has seen `train_size` entries are kept in a flat
+    buffer that every query scans exhaustively, so small galleries stay exact.
+    """
+
+    def __init__(self, dim: int = 128, nlist: int = 256, nprobe: int = 8,
+                 train_size: Optional[int] = None, kmeans_iters: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size if train_size is not None else 32 * nlist
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[BruteForceIndex] = []
+        self._pending = BruteForceIndex(dim)
+        self._list_of: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending) + sum(len(inv_list) for inv_list in self._lists)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray):
+        """Fit the coarse quantiser with k-means and redistribute any buffered vectors"""
+        vectors = _as_matrix(vectors, self.dim)
+        if len(vectors) < self.nlist:
+            raise ValueError(f"Need at least {self.nlist} vectors to train, got {len(vectors)}")
+
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(len(vectors), self.nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            assignment = self._nearest_centroids(vectors, centroids, 1)[:, 0]
+            counts = np.bincount(assignment, minlength=self.nlist)
+            filled = counts > 0
+            order = np.argsort(assignment, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+            centroids[filled] = np.add.reduceat(vectors[order], starts, axis=0) / counts[filled, None]
+            # Re-seed empty lists from random vectors so no list stays dead
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        self.centroids = centroids
+        self._lists = [BruteForceIndex(self.dim, chunk_size=256) for _ in range(self.nlist)]
+
+        ids, pending = self._pending.vectors()
+        ids, pending = ids.copy(), pending.copy()
+        self._pending = BruteForceIndex(self.dim)
+        self._list_of.clear()
+        if len(ids):
+            self._add_to_lists(pending, ids)
+
+    @staticmethod
+    def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, n: int, block_cells: int = 1 << 22) -> np.ndarray:
+        """Indices of the n closest centroids for each vector, computed in blocks of about block_cells distances"""
+        c_sq = np.einsum('ij,ij->i', centroids, centroids)
+        out = np.empty((len(vectors), n), dtype=np.int64)
+        block = max(1, block_cells // len(centroids))
+        for start in range(0, len(vectors), block):
+            chunk = vectors[start:start + block]
+            sq = chunk @ centroids.T
+            sq *= -2.0
+            sq += c_sq[None, :]
+            if n == 1:
+                out[start:start + block, 0] = np.argmin(sq, axis=1)
+            else:
+                part = np.argpartition(sq, n - 1, axis=1)[:, :n]
+                order = np.argsort(np.take_along_axis(sq, part, axis=1), axis=1)
+                out[start:start + block] = np.take_along_axis(part, order, axis=1)
+        return out
+
+    def _add_to_lists(self, vectors: np.ndarray, ids: np.ndarray):
+        assignment = self._nearest_centroids(vectors, self.centroids, 1)[:, 0]
+        for list_no in np.unique(assignment):
+            mask = assignment == list_no
+            self._lists[list_no].add(vectors[mask], ids[mask])
+            for face_id in ids[mask]:
+                self._list_of[int(face_id)] = int(list_no)
+
+    def add(self, vectors: np.ndarray, ids: Iterable[int]):
+        vectors = _as_matrix(vectors, self.dim)
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if self.is_trained:
+            self._add_to_lists(vectors, ids)
+            return
+        self._pending.add(vectors, ids)
+        if len(self._pending) >= max(self.train_size, self.nlist):
+            pending = self._pending.vectors()[1]
+            sample = np.random.default_rng(self.seed).choice(len(pending), max(self.train_size, self.nlist), replace=False)
+            self.train(pending[np.sort(sample)])
+
+    def remove(self, ids: Iterable[int]):
+        for face_id in ids:
+            list_no = self._list_of.pop(int(face_id), None)
+            if list_no is None:
+                self._pending.remove([face_id])
+            else:
+                self._lists[list_no].remove([face_id])
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_matrix(queries, self.dim)
+        m = len(queries)
+        cand_distances = [np.empty((m, 0), dtype=np.float32)]
+        cand_ids = [np.empty((m, 0), dtype=np.int64)]
+
+        if len(self._pending):
+            d, i = self._pending.search(queries, k)
+            cand_distances.append(d)
+            cand_ids.append(i)
+
+        if self.is_trained:
+            nprobe = min(self.nprobe, self.nlist)
+            probes = self._nearest_centroids(queries, self.centroids, nprobe)
+            d = np.full((m, nprobe * k), np.inf, dtype=np.float32)
+            i = np.full((m, nprobe * k), -1, dtype=np.int64)
+            # Group queries by probed list so each list is scanned once per call
+            for list_no in np.unique(probes):
+                inv_list = self._lists[list_no]
+                if not len(inv_list):
+                    continue
+                rows, slots = np.nonzero(probes == list_no)
+                cols = slots[:, None] * k + np.arange(k)[None, :]
+                d[rows[:, None], cols], i[rows[:, None], cols] = inv_list.search(queries[rows], k)
+            cand_distances.append(d)
+            cand_ids.append(i)
+
+        return _top_k(np.hstack(cand_distances), np.hstack(cand_ids), k)
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        parts = [self._pending.vectors()] + [inv_list.vectors() for inv_list in self._lists]
+        return (np.concatenate([ids for ids, _ in parts]),
+                np.concatenate([vectors for _, vectors in parts]).reshape(-1, self.dim))
+
+
+INDEX_BACKENDS = {
+    'exact': BruteForceIndex,
+    'ivf': IVFIndex,
+}
+
+
+def create_index(backend: str = 'exact', dim: int = 128, **kwargs) -> FaceIndex:
+    """Build an index by backend name ("exact" or "ivf")"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend: {backend}")
+    return INDEX_BACKENDS[backend](dim=dim, **kwargs)
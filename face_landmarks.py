@@ -0,0 +1,51 @@
+import numpy as np
+from typing import List, Tuple, Dict, Any
+from model_registry import registry
+
+# Shape model every face descriptor is computed from (face_recognition's model="large").
+# Descriptors from 5-point shapes differ slightly, so galleries record it and refuse to mix.
+ENCODER_MODEL = 'large'
+
+# Index ranges of the 68-point model, named as in face_recognition.face_landmarks
+LANDMARK_GROUPS = {
+    'chin': list(range(0, 17)),
+    'left_eyebrow': list(range(17, 22)),
+    'right_eyebrow': list(range(22, 27)),
+    'nose_bridge': list(range(27, 31)),
+    'nose_tip': list(range(31, 36)),
+    'left_eye': list(range(36, 42)),
+    'right_eye': list(range(42, 48)),
+    'top_lip': list(range(48, 55)) + [64, 63, 62, 61, 60],
+    'bottom_lip': list(range(54, 60)) + [48, 60, 67, 66, 65, 64]
+}
+
+
+def _face_api():
+    return registry.get('face_recognition').api
+
+
+def predict_shapes(image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]) -> List[Any]:
+    """Run the 68-point shape predictor once per face, returning dlib shapes"""
+    face_api = _face_api()
+    return [face_api.pose_predictor_68_point(image, face_api._css_to_rect(location)) for location in face_locations]
+
+
+def shapes_to_arrays(shapes: List[Any]) -> List[np.ndarray]:
+    """(68, 2) int32 arrays of (x, y) points for each dlib shape"""
+    return [np.array([(point.x, point.y) for point in shape.parts()], dtype=np.int32) for shape in shapes]
+
+
+def encode_shapes(image: np.ndarray, shapes: List[Any], num_jitters: int = 1) -> List[np.ndarray]:
+    """Face descriptors computed from already predicted 68-point shapes, so landmarks run only once"""
+    face_api = _face_api()
+    return [np.array(face_api.face_encoder.compute_face_descriptor(image, shape, num_jitters)) for shape in shapes]
+
+
+def landmark_groups(points: np.ndarray) -> Dict[str, List[Tuple[int, int]]]:
+    """Named landmark groups in the format returned by face_recognition.face_landmarks"""
+    return {name: [tuple(int(v) for v in points[i]) for i in indices] for name, indices in LANDMARK_GROUPS.items()}
+
+
+def eye_centers(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean (x, y) of the left and right eye points, for alignment"""
+    return points[36:42].mean(axis=0), points[42:48].mean(axis=0)
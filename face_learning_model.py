@@ -1,21 +1,76 @@
 import os
 import cv2
 import numpy as np
-import face_recognition
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Union
 import logging
-from face_visualizer import FaceVisualizer
-from sklearn.cluster import DBSCAN
+import threading
+from face_gallery import FaceGallery
+from face_index import create_index
+from encoding_cache import EncodingCache, hash_array, hash_bytes
+from detection_scaling import downscale_for_detection, upscale_locations
+from face_landmarks import ENCODER_MODEL, predict_shapes, shapes_to_arrays, encode_shapes, landmark_groups
+from face_quality import score_faces, QUALITY_VERSION
+from model_registry import registry
+from gallery_store import save_face_gallery, load_face_gallery, load_clusters
+from face_store import FaceStore, SYNC_OVERLAP, new_id
+from identity_clustering import IdentityClusterer, face_key
+from recluster import recluster_identities
+from thumbnail_cache import ThumbnailCache
+from pipeline_stats import PipelineStats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# A file path, encoded image bytes or a decoded BGR array
+ImageSource = Union[str, bytes, np.ndarray]
+
 class FaceLearningModel:
-    def __init__(self):
-        self.face_encodings = []
+    def __init__(self, index_backend: str = "exact", index_options: Dict[str, Any] = None,
+                 cache_dir: str = None, cache_max_bytes: int = 1 << 30, max_detection_dim: int = None,
+                 store: FaceStore = None, tolerance: float = 0.6, thumbnail_dir: str = None,
+                 thumbnail_previews: bool = False, thumbnail_max_bytes: int = 1 << 30):
+        self.index_backend = index_backend
+        self.index_options = index_options or {}
+        self.tolerance = tolerance
+        self.gallery = FaceGallery(index=create_index(index_backend, **self.index_options))
+        self.clusterer = self._make_clusterer()
         self.person_metadata = {}
-        self.clustering_model = DBSCAN(eps=0.6, min_samples=3)
-        self.face_visualizer = FaceVisualizer()
+        self.cache = EncodingCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.max_detection_dim = max_detection_dim
+        # Face crops (and photo previews if thumbnail_previews) are written here by analyze_image
+        self.thumbnails = ThumbnailCache(thumbnail_dir, max_bytes=thumbnail_max_bytes) if thumbnail_dir else None
+        self.thumbnail_previews = thumbnail_previews
+        self.pipeline_stats = PipelineStats()
+        self._gallery_lock = threading.Lock()
+        # With a store, faces and identities are shared through the database
+        self.store = store
+        # Store face ID -> person ID as last written or synced, to spot relabels from other replicas
+        self._store_person_of = {}
+        self._store_face_ids_by_key = {}
+        self._store_cursor = None
+        
+    @property
+    def face_visualizer(self):
+        return registry.get('face_visualizer')
+        
+    def _make_clusterer(self, clusters: Tuple[List[str], np.ndarray, np.ndarray] = None) -> IdentityClusterer:
+        """Identity clustering over self.gallery, which holds every face seen, from saved per-person state if given"""
+        return IdentityClusterer(self.gallery, self.tolerance, new_label=self._new_person_id,
+                                 index_factory=lambda: create_index(self.index_backend, **self.index_options),
+                                 clusters=clusters)
+        
+    def _new_person_id(self) -> str:
+        # Replicas sharing a store need IDs that cannot collide
+        if self.store is not None:
+            return new_id()
+        number = len(self.gallery)
+        while str(number) in self.clusterer:
+            number += 1
+        return str(number)
+        
+    def preload(self) -> Dict[str, float]:
+        """Load the dlib models and visualizer up front instead of on the first image."""
+        return registry.preload(['face_recognition', 'face_visualizer'])
         
     def _preprocess_image(self, image):
         """Preprocess the image for better face detection."""
@@ -30,51 +85,51 @@ class FaceLearningModel:
             
         return image
         
-    def _get_face_quality(self, face_image) -> Dict[str, float]:
-        """Assess the quality of a face image."""
-        quality_scores = {}
-        
-        # Brightness
-        brightness = np.mean(face_image)
-        quality_scores['brightness'] = brightness / 255.0
-        
-        # Contrast
-        contrast = np.std(face_image)
-        quality_scores['contrast'] = contrast / 128.0
-        
-        # Sharpness using Laplacian variance
-        gray = cv2.cvtColor(face_image, cv2.COLOR_RGB2GRAY)
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        quality_scores['sharpness'] = np.var(laplacian) / 100.0
+    def _get_face_encodings(self, image, content_hash: str = None) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]], List[Dict[str, float]], List[Dict[str, Any]], List[np.ndarray]]:
+        """Get face encodings, locations, quality scores, characteristics and (68, 2) landmarks from an image.
         
-        return quality_scores
+        `content_hash` (see read_image) keys the encoding cache; the pixels are hashed without it.
+        """
+        cache_key = None
+        if self.cache is not None:
+            settings = {'detector': 'hog', 'num_jitters': 1, 'encoder': ENCODER_MODEL, 'max_detection_dim': self.max_detection_dim,
+                        'quality_version': QUALITY_VERSION}
+            cache_key = self.cache.key(content_hash or hash_array(image), settings)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                extras = cached['extras'] or {'characteristics': [], 'landmarks': []}
+                landmarks = [np.array(points, dtype=np.int32) for points in extras['landmarks']]
+                return cached['face_encodings'], cached['face_locations'], cached['quality'], extras['characteristics'], landmarks
         
-    def _get_face_encodings(self, image) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]], List[Dict[str, float]], List[Dict[str, Any]]]:
-        """Get face encodings, locations, quality scores and characteristics from an image."""
+        stats = self.pipeline_stats
         try:
-            # Find all face locations in the image
-            face_locations = face_recognition.face_locations(image)
+            # Find all face locations, on a downscaled copy for large photos
+            with stats.stage('detect'):
+                small_image, scale = downscale_for_detection(image, self.max_detection_dim)
+                face_locations = upscale_locations(registry.get('face_recognition').face_locations(small_image), scale, image.shape)
             
             if not face_locations:
-                return [], [], [], []
+                if cache_key is not None:
+                    self.cache.put(cache_key, {'face_locations': [], 'face_encodings': [], 'quality': [],
+                                               'extras': {'characteristics': [], 'landmarks': []}})
+                return [], [], [], [], []
                 
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(image, face_locations)
+            # One 68-point landmark pass per face, shared by the encoder, characteristics and callers;
+            # dlib only samples the face regions, at native resolution
+            with stats.stage('landmark', len(face_locations)):
+                shapes = predict_shapes(image, face_locations)
+                landmarks = shapes_to_arrays(shapes)
+            with stats.stage('encode', len(face_locations)):
+                face_encodings = encode_shapes(image, shapes)
             
-            # Get quality scores and characteristics for each face
-            quality_scores = []
-            characteristics = []
+            # Score every face from one grayscale pass over the image
+            with stats.stage('quality', len(face_locations)):
+                quality_scores = score_faces(image, face_locations)
             
-            for face_location in face_locations:
-                top, right, bottom, left = face_location
-                face_image = image[top:bottom, left:right]
-                
-                # Get quality scores
-                quality = self._get_face_quality(face_image)
-                quality_scores.append(quality)
-                
-                # Get face characteristics using face_recognition landmarks
-                face_landmarks = face_recognition.face_landmarks(image, [face_location])[0]
+            # Get characteristics for each face
+            characteristics = []
+            for points in landmarks:
+                face_landmarks = landmark_groups(points)
                 char_dict = {
                     'has_eyes': len(face_landmarks.get('left_eye', [])) > 0 and len(face_landmarks.get('right_eye', [])) > 0,
                     'has_nose': len(face_landmarks.get('nose_bridge', [])) > 0,
@@ -83,70 +138,259 @@ class FaceLearningModel:
                 }
                 characteristics.append(char_dict)
             
-            return face_encodings, face_locations, quality_scores, characteristics
+            if cache_key is not None:
+                self.cache.put(cache_key, {
+                    'face_locations': face_locations,
+                    'face_encodings': face_encodings,
+                    'quality': quality_scores,
+                    'extras': {'characteristics': characteristics, 'landmarks': [points.tolist() for points in landmarks]}
+                })
+            
+            return face_encodings, face_locations, quality_scores, characteristics, landmarks
             
         except Exception as e:
             logger.error(f"Error processing image: {str(e)}")
-            return [], [], [], []
+            return [], [], [], [], []
             
-    def process_image(self, image_path: str) -> List[Dict[str, Any]]:
-        """Process an image and return face analysis results."""
+    @staticmethod
+    def load_image(image: ImageSource) -> np.ndarray:
+        """Decode an image given as a file path, encoded bytes or an already decoded BGR array."""
+        if isinstance(image, np.ndarray):
+            return image
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            decoded = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+            if decoded is None:
+                raise ValueError("Could not decode image bytes")
+            return decoded
+        decoded = cv2.imread(image)
+        if decoded is None:
+            raise ValueError(f"Could not read image at {image}")
+        return decoded
+        
+    @staticmethod
+    def read_image(image: ImageSource) -> Tuple[np.ndarray, str]:
+        """Decode an image like load_image and return it with its content hash.
+        
+        Files and encoded bytes are keyed by the hash of their bytes, as in
+        FaceRecognitionProcessor, so both processors share cache and thumbnail keys for the
+        same photo; an already decoded array can only be keyed by its pixels.
+        """
+        if isinstance(image, np.ndarray):
+            return image, hash_array(image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return FaceLearningModel.load_image(image), hash_bytes(image)
         try:
-            # Read and preprocess the image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not read image at {image_path}")
-                
-            # Convert to RGB for face_recognition
-            image = self._preprocess_image(image)
+            with open(image, 'rb') as f:
+                data = f.read()
+        except OSError:
+            raise ValueError(f"Could not read image at {image}")
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if decoded is None:
+            raise ValueError(f"Could not read image at {image}")
+        return decoded, hash_bytes(data)
+        
+    def analyze_image(self, image: ImageSource) -> List[Dict[str, Any]]:
+        """Detect, encode and describe every face in an image without touching the gallery.
+        
+        Returns one {'face': face_dict, 'encoding': encoding, 'landmarks': (68, 2) array} item
+        per face. This is the CPU-heavy half of process_image and is safe to run in a worker process.
+        With a thumbnail_dir, face_dict also carries its thumbnail (and preview) cache key.
+        """
+        # Read and preprocess the image
+        with self.pipeline_stats.stage('decode'):
+            image, content_hash = self.read_image(image)
             
-            # Get face information
-            face_encodings, face_locations, quality_scores, characteristics = self._get_face_encodings(image)
+        # Convert to RGB for face_recognition
+        with self.pipeline_stats.stage('preprocess'):
+            image = self._preprocess_image(image)
+        
+        # Get face information
+        face_encodings, face_locations, quality_scores, characteristics, landmarks = self._get_face_encodings(image, content_hash)
+        
+        thumbnails, preview = [None] * len(face_locations), None
+        if self.thumbnails is not None and face_locations:
+            with self.pipeline_stats.stage('thumbnail', len(face_locations)):
+                thumbnails = self.thumbnails.put_faces(image, face_locations, content_hash)
+                if self.thumbnail_previews:
+                    preview = self.thumbnails.put_preview(image, content_hash)
+        
+        faces = []
+        for idx, (encoding, location, quality, chars, points, thumbnail) in enumerate(zip(face_encodings, face_locations, quality_scores, characteristics, landmarks, thumbnails)):
+            # Convert face location to more intuitive format
+            top, right, bottom, left = location
+            face_dict = {
+                'location': {
+                    'top': top,
+                    'right': right,
+                    'bottom': bottom,
+                    'left': left,
+                    'width': right - left,
+                    'height': bottom - top
+                },
+                'quality': quality,
+                'characteristics': chars
+            }
             
-            if not face_encodings:
-                return []
-                
-            results = []
-            for idx, (encoding, location, quality, chars) in enumerate(zip(face_encodings, face_locations, quality_scores, characteristics)):
-                # Convert face location to more intuitive format
-                top, right, bottom, left = location
-                face_dict = {
-                    'location': {
-                        'top': top,
-                        'right': right,
-                        'bottom': bottom,
-                        'left': left,
-                        'width': right - left,
-                        'height': bottom - top
-                    },
-                    'quality': quality,
-                    'characteristics': chars
-                }
-                
-                # Get additional characteristics from visualizer
-                face_region = image[top:bottom, left:right]
+            # Get additional characteristics from visualizer
+            face_region = image[top:bottom, left:right]
+            with self.pipeline_stats.stage('describe'):
                 additional_chars = self.face_visualizer.create_characteristics_report(face_region)
-                face_dict['additional'] = additional_chars
+            face_dict['additional'] = additional_chars
+            
+            if thumbnail is not None:
+                face_dict['thumbnail'] = thumbnail
+            if preview is not None:
+                face_dict['preview'] = preview
+            
+            faces.append({'face': face_dict, 'encoding': encoding, 'landmarks': points})
+        
+        return faces
+        
+    def analyze_images(self, images: List[ImageSource]) -> List[Dict[str, Any]]:
+        """analyze_image over several images, isolating failures.
+        
+        Returns one {'faces': [...]} or {'error': message} per image, so one bad file does
+        not lose the rest of a batch.
+        """
+        outcomes = []
+        for image in images:
+            try:
+                outcomes.append({'faces': self.analyze_image(image)})
+            except Exception as e:
+                logger.error(f"Error analysing batch image: {str(e)}")
+                outcomes.append({'error': str(e)})
+        return outcomes
+        
+    def assign_identities(self, faces: List[Dict[str, Any]], photo_id: str = None) -> List[Dict[str, Any]]:
+        """Match analysed faces against the gallery, adding unknown faces as new people.
+        
+        With a store, every face is also written to it (tagged with `photo_id` when given)
+        and new people get globally unique IDs, so other replicas can pick them up.
+        """
+        results = []
+        records = []
+        # The gallery is shared by every request, so matching and insertion happen under one lock
+        with self._gallery_lock, self.pipeline_stats.stage('match', len(faces)):
+            # Each face joins the person with the nearest centroid, or starts a new person
+            identities = self.clusterer.assign([item['encoding'] for item in faces])
+            for item, (person_id, distance) in zip(faces, identities):
+                face_dict, encoding = item['face'], item['encoding']
+                face_dict['person_id'] = person_id
+                face_dict['confidence'] = 1 - distance if distance is not None else 1.0
                 
-                # Find similar faces in our database
-                if self.face_encodings:
-                    distances = face_recognition.face_distance(self.face_encodings, encoding)
-                    min_distance = min(distances)
-                    if min_distance < 0.6:  # Threshold for face similarity
-                        face_dict['person_id'] = str(np.argmin(distances))
-                        face_dict['confidence'] = 1 - min_distance
-                    else:
-                        face_dict['person_id'] = str(len(self.face_encodings))
-                        face_dict['confidence'] = 1.0
-                        self.face_encodings.append(encoding)
-                else:
-                    face_dict['person_id'] = '0'
-                    face_dict['confidence'] = 1.0
-                    self.face_encodings.append(encoding)
+                if self.store is not None:
+                    face_dict['face_id'] = new_id()
+                    self._store_person_of[face_dict['face_id']] = str(face_dict['person_id'])
+                    self._store_face_ids_by_key[face_key(encoding)] = face_dict['face_id']
+                    records.append({
+                        'id': face_dict['face_id'],
+                        'photo_id': photo_id,
+                        'person_id': str(face_dict['person_id']),
+                        'bounding_box': face_dict['location'],
+                        'confidence': face_dict['confidence'],
+                        'embedding': encoding,
+                        'quality': face_dict['quality'],
+                        'in_gallery': True
+                    })
                 
                 results.append(face_dict)
-            
-            return results
+        
+        # Database writes happen outside the lock so matching is never blocked on I/O
+        if records:
+            self.store.add_faces(records)
+            if photo_id is not None:
+                self.store.tag_photos([photo_id])
+        
+        return results
+        
+    def match_identities(self, faces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Label analysed faces with their closest known person, leaving the gallery and store untouched.
+        
+        Faces that match nobody are labelled "Unknown" with zero confidence.
+        """
+        with self._gallery_lock:
+            matches = self.clusterer.match([item['encoding'] for item in faces])
+        results = []
+        for item, (person_id, distance) in zip(faces, matches):
+            face_dict = dict(item['face'])
+            face_dict['person_id'] = person_id if person_id is not None else 'Unknown'
+            face_dict['confidence'] = 1 - distance if person_id is not None else 0.0
+            results.append(face_dict)
+        return results
+        
+    def sync_from_store(self) -> int:
+        """Pull reference faces added or relabelled by other replicas into the gallery.
+        
+        Returns how many faces were added or moved to another person.
+        """
+        since = self._store_cursor - SYNC_OVERLAP if self._store_cursor is not None else None
+        face_ids, person_ids, encodings, latest = self.store.load_gallery(since)
+        added = 0
+        moves = {}
+        with self._gallery_lock:
+            for face_id, person_id, encoding in zip(face_ids, person_ids, encodings):
+                known = self._store_person_of.get(face_id)
+                if known is None:
+                    self.clusterer.add_member(encoding, person_id)
+                    self._store_face_ids_by_key[face_key(encoding)] = face_id
+                    added += 1
+                elif known != person_id:
+                    moves[face_key(encoding)] = person_id
+                self._store_person_of[face_id] = person_id
+            # One pass over the gallery for every relabel in this batch
+            added += self.clusterer.move_faces(moves)
+            if latest is not None:
+                self._store_cursor = latest
+        return added
+        
+    def consolidate_identities(self) -> Dict[str, Any]:
+        """Run the merge/split pass over every face and return its stats.
+        
+        The resulting people do not depend on the order faces arrived in, so replicas that
+        consolidate the same faces agree. With a store, moved faces are reassigned there too.
+        """
+        with self._gallery_lock:
+            relabelled = self.clusterer.consolidate()
+            stats = dict(self.clusterer.stats)
+            moves = self._store_moves(relabelled)
+        
+        for person_id, face_ids in moves.items():
+            self.store.assign_person(face_ids, person_id)
+        return stats
+        
+    def recluster(self, **options) -> Dict[str, Any]:
+        """Rebuild every identity from scratch with the offline graph clustering in recluster.py.
+        
+        Takes the gallery lock for the whole run, so it is meant for quiet periods. Options are
+        passed to recluster.recluster; returns its report.
+        """
+        with self._gallery_lock:
+            relabelled, report = recluster_identities(self.clusterer, **options)
+            moves = self._store_moves(relabelled)
+        
+        for person_id, face_ids in moves.items():
+            self.store.assign_person(face_ids, person_id)
+        return report
+        
+    def _store_moves(self, relabelled: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Store face IDs to reassign per new person, for faces relabelled by consolidation"""
+        moves = {}
+        if self.store is not None:
+            for key, person_id in relabelled.items():
+                face_id = self._store_face_ids_by_key.get(key)
+                if face_id is not None:
+                    moves.setdefault(str(person_id), []).append(face_id)
+                    self._store_person_of[face_id] = str(person_id)
+        return moves
+        
+    def process_image(self, image: ImageSource) -> List[Dict[str, Any]]:
+        """Process an image and return face analysis results.
+        
+        `image` may be a file path, the encoded file contents (e.g. an upload) or a decoded
+        BGR array as returned by cv2.imdecode / cv2.imread, so callers never need a temp file.
+        """
+        try:
+            return self.assign_identities(self.analyze_image(image))
             
         except Exception as e:
             logger.error(f"Error processing image: {str(e)}")
@@ -154,8 +398,10 @@ class FaceLearningModel:
             
     def get_person_statistics(self) -> Dict[str, Any]:
         """Get statistics about recognized persons."""
+        with self._gallery_lock:
+            total_faces = len(self.gallery)
         stats = {
-            'total_faces': len(self.face_encodings),
+            'total_faces': total_faces,
             'unique_persons': len(set(self.person_metadata.keys())),
             'person_details': {}
         }
@@ -167,4 +413,49 @@ class FaceLearningModel:
                 'characteristics': metadata.get('characteristics', {})
             }
         
-        return stats 
\ No newline at end of file
+        return stats 
+        
+    def export_model_data(self, path: str) -> Dict[str, Any]:
+        """Save the gallery and person metadata to a gallery directory (see gallery_store.py)."""
+        with self._gallery_lock:
+            return save_face_gallery(path, self.gallery, {
+                'person_metadata': self.person_metadata,
+                'index_backend': self.index_backend
+            }, clusters=self.clusterer.cluster_state())
+            
+    def import_model_data(self, path: str, mmap: bool = True) -> Dict[str, Any]:
+        """Replace the gallery with a saved one.
+        
+        With the exact backend and mmap the encodings are memory mapped rather than read,
+        and processes loading the same gallery share its pages. Person centroids come from
+        the sums saved with the gallery, so the load costs O(people) rather than O(faces);
+        galleries saved without them are clustered from every encoding.
+        """
+        index = None if self.index_backend == "exact" else create_index(self.index_backend, **self.index_options)
+        gallery, meta = load_face_gallery(path, mmap=mmap, index=index)
+        clusters = load_clusters(path)
+        with self._gallery_lock:
+            self.gallery = gallery
+            self.clusterer = self._make_clusterer(clusters)
+            self.person_metadata = meta['metadata'].get('person_metadata', {})
+        return meta
+
+
+# Per-process model used when analyze_image runs in a worker pool
+_worker_model = None
+
+def init_analysis_worker(options: Dict[str, Any] = None, preload: bool = True):
+    """Pool initializer: build the worker's model once instead of per task."""
+    global _worker_model
+    if _worker_model is None:
+        _worker_model = FaceLearningModel(**(options or {}))
+        if preload:
+            _worker_model.preload()
+
+def analyze_in_worker(image: ImageSource) -> List[Dict[str, Any]]:
+    """Pool task: the stateless half of FaceLearningModel.process_image."""
+    return _worker_model.analyze_image(image)
+
+def analyze_batch_in_worker(images: List[ImageSource]) -> List[Dict[str, Any]]:
+    """Pool task: FaceLearningModel.analyze_images over one slice of a batch."""
+    return _worker_model.analyze_images(images)
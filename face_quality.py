@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+from typing import List, Tuple, Dict, Optional
+
+# Bump whenever a formula below changes, so cached quality scores are recomputed
+QUALITY_VERSION = 1
+QUALITY_FIELDS = ('brightness', 'contrast', 'sharpness', 'blur')
+
+# Laplacian variance at which a face counts as fully sharp
+SHARPNESS_SCALE = 1000.0
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Grayscale view of an RGB (or already gray) image"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def _scores(mean: float, std: float, laplacian_var: float) -> Dict[str, float]:
+    sharpness = min(laplacian_var / SHARPNESS_SCALE, 1.0)
+    return {
+        'brightness': mean / 255.0,
+        'contrast': min(std / 128.0, 1.0),
+        'sharpness': sharpness,
+        'blur': 1.0 - sharpness
+    }
+
+
+def score_faces(image: np.ndarray, face_locations: List[Tuple[int, int, int, int]],
+                gray: Optional[np.ndarray] = None) -> List[Dict[str, float]]:
+    """Quality of every (top, right, bottom, left) face in an image, all fields in [0, 1].
+
+    The image is converted to grayscale once (or `gray` is reused if the caller already has
+    it) and each face is scored from a view of it. The Laplacian of every face is written
+    into one float32 buffer sized for the largest face, and mean, deviation and Laplacian
+    variance come from cv2.meanStdDev, so no per-face float64 arrays are allocated.
+    """
+    if not face_locations:
+        return []
+    if gray is None:
+        gray = to_gray(image)
+    height, width = gray.shape[:2]
+
+    boxes = [(max(top, 0), min(right, width), min(bottom, height), max(left, 0))
+             for top, right, bottom, left in face_locations]
+    max_h = max(max(bottom - top for top, _, bottom, _ in boxes), 1)
+    max_w = max(max(right - left for _, right, _, left in boxes), 1)
+    laplacian = np.empty((max_h, max_w), dtype=np.float32)
+
+    scores = []
+    for top, right, bottom, left in boxes:
+        if bottom <= top or right <= left:
+            scores.append(_scores(0.0, 0.0, 0.0))
+            continue
+        region = gray[top:bottom, left:right]
+        region_laplacian = laplacian[:bottom - top, :right - left]
+        cv2.Laplacian(region, cv2.CV_32F, dst=region_laplacian)
+        mean, std = cv2.meanStdDev(region)
+        _, laplacian_std = cv2.meanStdDev(region_laplacian)
+        scores.append(_scores(float(mean[0, 0]), float(std[0, 0]), float(laplacian_std[0, 0]) ** 2))
+    return scores
+
+
+def score_face(face_image: np.ndarray) -> Dict[str, float]:
+    """Quality of a single cropped face"""
+    height, width = face_image.shape[:2]
+    return score_faces(face_image, [(0, width, height, 0)])[0]
@@ -3,24 +3,81 @@ import numpy as np
 import os
 from datetime import datetime
 import face_recognition
-from collections import defaultdict
-import shutil
+from collections import Counter, defaultdict
 import json
-from typing import List, Tuple, Dict, Any
+import io
+import base64
+from typing import List, Tuple, Dict, Any, Iterable, Iterator
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from face_gallery import FaceGallery
+from face_index import create_index
+from encoding_cache import EncodingCache, hash_bytes
+from scan_manifest import ScanManifest
+from batch_detection import batch_cnn_face_locations
+from pipeline_stats import PipelineStats
+from detection_scaling import downscale_for_detection, upscale_locations, crop_face, equalization_lut
+from face_quality import score_faces, QUALITY_VERSION
+from face_landmarks import ENCODER_MODEL, predict_shapes, encode_shapes
+from gallery_store import save_face_gallery, load_face_gallery, load_clusters
+from identity_clustering import IdentityClusterer, face_key
+from face_stream import write_records
+from photo_organizer import PhotoOrganizer
+from thumbnail_cache import ThumbnailCache
+
+# When the "cascade" detection policy escalates from HOG to CNN
+DEFAULT_CASCADE_OPTIONS = {
+    'escalate_on_no_faces': True,
+    'escalate_on_low_confidence': True,
+    'escalate_on_hard_image': True,
+    'min_confidence': 0.5,   # dlib HOG detection score
+    'min_face_size': 60,     # pixels; HOG misses faces much smaller than its 80px window
+    'min_sharpness': 50.0    # Laplacian variance of a 256px thumbnail
+}
 
 class FaceRecognitionProcessor:
-    def __init__(self, tolerance=0.6, model="hog", num_jitters=1):
-        self.known_face_encodings = []
-        self.known_face_names = []
+    def __init__(self, tolerance=0.6, model="hog", num_jitters=1, index_backend="exact", index_options=None,
+                 cache_dir=None, cache_max_bytes=1 << 30, detection_policy="all", cascade_options=None,
+                 max_detection_dim=None, thumbnail_dir=None, thumbnail_previews=False, thumbnail_max_bytes=1 << 30):
+        self.index_backend = index_backend
+        self.index_options = index_options or {}
+        self.gallery = FaceGallery(index=create_index(index_backend, **self.index_options))
         self.person_photos = defaultdict(list)
         self.tolerance = tolerance
         self.next_person_id = 1
+        self.clusterer = self._make_clusterer()
+        self.relabelled = {}
         self.model = model  # "hog" or "cnn"
         self.num_jitters = num_jitters
         self.face_detection_models = ["hog", "cnn"]
+        self.detection_policy = detection_policy  # "all" (hog + cnn), "single" (self.model) or "cascade"
+        self.cascade_options = {**DEFAULT_CASCADE_OPTIONS, **(cascade_options or {})}
+        self.detection_stats = {'images': 0, 'escalated': 0, 'triggers': defaultdict(int)}
+        self.max_detection_dim = max_detection_dim  # detect on a copy no larger than this, None for full resolution
+        self.pipeline_stats = PipelineStats()
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.cache = EncodingCache(cache_dir, cache_max_bytes) if cache_dir else None
+        # Face crops (and photo previews if thumbnail_previews) are written here at ingest
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_previews = thumbnail_previews
+        self.thumbnail_max_bytes = thumbnail_max_bytes
+        self.thumbnails = ThumbnailCache(thumbnail_dir, max_bytes=thumbnail_max_bytes) if thumbnail_dir else None
+        # Whether analyses carry the file bytes' hash, e.g. for a scan manifest to reuse
+        self.hash_files = False
         self.logger = self._setup_logger()
 
+    def _make_clusterer(self, clusters: Tuple[List[str], np.ndarray, np.ndarray] = None) -> IdentityClusterer:
+        """Identity clustering over self.gallery, which holds every face seen, from saved per-person state if given"""
+        return IdentityClusterer(self.gallery, self.tolerance, new_label=self._new_person_id,
+                                 index_factory=lambda: create_index(self.index_backend, **self.index_options),
+                                 clusters=clusters)
+
+    def _new_person_id(self) -> str:
+        person_id = f"Person_{self.next_person_id}"
+        self.next_person_id += 1
+        return person_id
+
     def _setup_logger(self):
         logger = logging.getLogger('FaceRecognition')
         logger.setLevel(logging.INFO)
@@ -52,14 +109,127 @@ class FaceRecognitionProcessor:
             except Exception as e:
                 self.logger.warning(f"Error using {model} model: {str(e)}")
         
-        # Remove duplicate detections
+        return self._remove_duplicate_faces(all_face_locations)
+
+    def _remove_duplicate_faces(self, face_locations: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+        """Keep the first of any group of overlapping detections"""
         unique_face_locations = []
-        for face in all_face_locations:
+        for face in face_locations:
             if not any(self._is_similar_face(face, existing) for existing in unique_face_locations):
                 unique_face_locations.append(face)
         
         return unique_face_locations
 
+    def _detect_hog_with_scores(self, image: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[float]]:
+        """HOG detection that also returns dlib's detection scores"""
+        height, width = image.shape[:2]
+        rects, scores, _ = face_recognition.api.face_detector.run(image, 1, 0)
+        face_locations = [
+            (max(rect.top(), 0), min(rect.right(), width), min(rect.bottom(), height), max(rect.left(), 0))
+            for rect in rects
+        ]
+        return face_locations, list(scores)
+
+    def _is_hard_image(self, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]) -> bool:
+        """Quality heuristics for images where HOG is likely to miss faces"""
+        options = self.cascade_options
+        if any(bottom - top < options['min_face_size'] for top, right, bottom, left in face_locations):
+            return True
+        # Blur check on a small thumbnail, so it stays cheap next to HOG itself
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        scale = 256.0 / max(gray.shape)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.Laplacian(gray, cv2.CV_32F).var() < options['min_sharpness']
+
+    def _cascade_triggers(self, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]],
+                          scores: List[float]) -> List[str]:
+        """Which cascade triggers fire for a HOG result"""
+        options = self.cascade_options
+        triggers = []
+        if options['escalate_on_no_faces'] and not face_locations:
+            triggers.append('no_faces')
+        if options['escalate_on_low_confidence'] and any(score < options['min_confidence'] for score in scores):
+            triggers.append('low_confidence')
+        if options['escalate_on_hard_image'] and self._is_hard_image(image, face_locations):
+            triggers.append('hard_image')
+        return triggers
+
+    def _detect_faces_cascade(self, image: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[str]]:
+        """Run HOG first and only pay for CNN when a configured trigger fires"""
+        face_locations, scores = self._detect_hog_with_scores(image)
+        triggers = self._cascade_triggers(image, face_locations, scores)
+        
+        if triggers:
+            try:
+                face_locations = self._remove_duplicate_faces(
+                    face_locations + face_recognition.face_locations(image, model="cnn"))
+            except Exception as e:
+                self.logger.warning(f"Error using cnn model: {str(e)}")
+        
+        return face_locations, triggers
+
+    def _detect_faces(self, image: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[str]]:
+        """Detect faces according to the detection policy, returning any cascade escalation triggers"""
+        if self.detection_policy == "cascade":
+            return self._detect_faces_cascade(image)
+        if self.detection_policy == "single":
+            return face_recognition.face_locations(image, model=self.model), []
+        return self._detect_faces_multiple_models(image), []
+
+    def _detect_faces_batch(self, images: List[np.ndarray], batch_size: int) -> List[Tuple[List[Tuple[int, int, int, int]], List[str]]]:
+        """Same as _detect_faces for many images, with every CNN pass batched across images"""
+        if self.detection_policy == "cascade":
+            results = []
+            escalated = []
+            for i, image in enumerate(images):
+                face_locations, scores = self._detect_hog_with_scores(image)
+                triggers = self._cascade_triggers(image, face_locations, scores)
+                results.append((face_locations, triggers))
+                if triggers:
+                    escalated.append(i)
+            
+            cnn_locations = batch_cnn_face_locations([images[i] for i in escalated], batch_size)
+            for i, face_locations in zip(escalated, cnn_locations):
+                results[i] = (self._remove_duplicate_faces(results[i][0] + face_locations), results[i][1])
+            return results
+        
+        models = [self.model] if self.detection_policy == "single" else self.face_detection_models
+        if "cnn" not in models:
+            return [self._detect_faces(image) for image in images]
+        
+        cnn_locations = batch_cnn_face_locations(images, batch_size)
+        results = []
+        for image, cnn_faces in zip(images, cnn_locations):
+            # Combine in model order, exactly like _detect_faces_multiple_models
+            all_face_locations = []
+            for model in models:
+                all_face_locations.extend(cnn_faces if model == "cnn" else face_recognition.face_locations(image, model=model))
+            results.append((self._remove_duplicate_faces(all_face_locations), []))
+        return results
+
+    def _record_detection(self, analysis: Dict[str, Any]):
+        """Count cascade escalations for an analysed image (cache hits ran no detector)"""
+        triggers = analysis.get('escalation_triggers')
+        if triggers is None or self.detection_policy != "cascade":
+            return
+        self.detection_stats['images'] += 1
+        if triggers:
+            self.detection_stats['escalated'] += 1
+        for trigger in triggers:
+            self.detection_stats['triggers'][trigger] += 1
+
+    def get_detection_stats(self) -> Dict[str, Any]:
+        """How often the cascade escalated to CNN, overall and per trigger"""
+        images = self.detection_stats['images']
+        return {
+            'policy': self.detection_policy,
+            'images': images,
+            'escalated': self.detection_stats['escalated'],
+            'escalation_rate': self.detection_stats['escalated'] / images if images else 0.0,
+            'triggers': dict(self.detection_stats['triggers'])
+        }
+
     def _is_similar_face(self, face1: Tuple[int, int, int, int], face2: Tuple[int, int, int, int], 
                         threshold: float = 0.3) -> bool:
         """Check if two face detections are likely the same face"""
@@ -82,131 +252,613 @@ class FaceRecognitionProcessor:
         iou = intersection_area / float(face1_area + face2_area - intersection_area)
         return iou > threshold
 
-    def get_face_encodings(self, image_path: str) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]], List[np.ndarray]]:
-        """Get face encodings with improved detection"""
-        # Load image
-        image = face_recognition.load_image_file(image_path)
+    def _prepare_detection_image(self, image: np.ndarray) -> Tuple[np.ndarray, float, np.ndarray]:
+        """Downscale (if configured) and preprocess an image for detection.
+
+        Returns the preprocessed detection image, its scale relative to the original and
+        the grayscale of the downscaled copy (used to equalise face crops).
+        """
+        small_image, scale = downscale_for_detection(image, self.max_detection_dim)
+        small_gray = cv2.cvtColor(small_image, cv2.COLOR_RGB2GRAY) if scale != 1.0 else None
+        return self._preprocess_image(small_image), scale, small_gray
+
+    def _encode_faces(self, image: np.ndarray, processed_image: np.ndarray, scale: float, small_gray: np.ndarray,
+                      face_locations: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """Encode full-resolution face locations from their 68-point shapes (see face_landmarks.py).
         
-        # Preprocess image
-        processed_image = self._preprocess_image(image)
+        The landmark and encode stages are timed separately, as in FaceLearningModel.
+        """
+        stats = self.pipeline_stats
+        if scale == 1.0:
+            with stats.stage('landmark', len(face_locations)):
+                shapes = predict_shapes(processed_image, face_locations)
+            # Get face encodings with multiple jitters for better accuracy
+            with stats.stage('encode', len(face_locations)):
+                return encode_shapes(processed_image, shapes, self.num_jitters)
         
-        # Detect faces using multiple models
-        face_locations = self._detect_faces_multiple_models(processed_image)
+        # Equalise only native-resolution crops, using the whole-image histogram from the small copy;
+        # preparing the crops is counted with the landmark pass that needs them
+        lut = equalization_lut(small_gray)
+        with stats.stage('landmark', len(face_locations)):
+            crops = []
+            for face_location in face_locations:
+                crop, crop_location = crop_face(image, face_location)
+                processed_crop = cv2.cvtColor(cv2.LUT(cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY), lut), cv2.COLOR_GRAY2RGB)
+                crops.append((processed_crop, predict_shapes(processed_crop, [crop_location])))
+        with stats.stage('encode', len(face_locations)):
+            face_encodings = []
+            for processed_crop, shapes in crops:
+                face_encodings.extend(encode_shapes(processed_crop, shapes, self.num_jitters))
+        return face_encodings
+
+    def _detect_and_encode(self, image: np.ndarray, image_path: str) -> Tuple[List[Tuple[int, int, int, int]], List[np.ndarray], List[str]]:
+        """Detect faces and compute their encodings"""
+        stats = self.pipeline_stats
+        with stats.stage('preprocess'):
+            processed_image, scale, small_gray = self._prepare_detection_image(image)
+        
+        # Detect faces with the configured policy
+        with stats.stage('detect'):
+            small_locations, triggers = self._detect_faces(processed_image)
+        face_locations = upscale_locations(small_locations, scale, image.shape)
         
         if not face_locations:
             self.logger.warning(f"No faces detected in {image_path}")
-            return image, [], []
-        
-        # Get face encodings with multiple jitters for better accuracy
-        face_encodings = face_recognition.face_encodings(
-            processed_image, 
-            face_locations,
-            num_jitters=self.num_jitters
-        )
+            return [], [], triggers
         
-        return image, face_locations, face_encodings
+        # _encode_faces records the landmark and encode stages itself
+        face_encodings = self._encode_faces(image, processed_image, scale, small_gray, face_locations)
+        return face_locations, face_encodings, triggers
 
-    def process_image(self, image_path: str, output_dir: str = 'processed_results') -> List[Dict[str, Any]]:
-        self.logger.info(f"Processing {image_path}")
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+    def get_face_encodings(self, image_path: str) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]], List[np.ndarray]]:
+        """Get face encodings with improved detection"""
+        image, analysis = self.analyze_image(image_path)
+        return image, analysis['face_locations'], analysis['face_encodings']
+
+    def _cache_settings(self) -> Dict[str, Any]:
+        """Settings that change detection or encoding results, used in encoding cache keys"""
+        return {
+            'detectors': self.face_detection_models,
+            'detection_policy': self.detection_policy,
+            'cascade_options': self.cascade_options if self.detection_policy == "cascade" else None,
+            'max_detection_dim': self.max_detection_dim,
+            'model': self.model,
+            'num_jitters': self.num_jitters,
+            'encoder': ENCODER_MODEL,
+            'preprocess': 'equalize_hist',
+            'quality_version': QUALITY_VERSION
+        }
+
+    def _load_image(self, image_path: str) -> Tuple[np.ndarray, Any, Dict[str, Any], str]:
+        """Decode an image and look it up in the encoding cache.
+
+        Returns (image, cache_key, cached_analysis, content_hash); cache_key and
+        cached_analysis are None without a cache or on a miss, and content_hash (the file
+        bytes' hash, shared by cache and thumbnail keys and the scan manifest) is None
+        without a cache, thumbnails or hash_files.
+        """
+        if self.cache is None and self.thumbnails is None and not self.hash_files:
+            return face_recognition.load_image_file(image_path), None, None, None
         
-        # Get face information
-        image, face_locations, face_encodings = self.get_face_encodings(image_path)
+        # Read the file once: the bytes are both hashed for the keys and decoded
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        image = face_recognition.load_image_file(io.BytesIO(data))
+        content_hash = hash_bytes(data)
+        if self.cache is None:
+            return image, None, None, content_hash
+        cache_key = self.cache.key(content_hash, self._cache_settings())
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return image, cache_key, None, content_hash
+        return image, cache_key, {
+            'image_path': image_path,
+            'face_locations': cached['face_locations'],
+            'face_encodings': cached['face_encodings'],
+            'quality': cached['quality']
+        }, content_hash
+
+    def _build_analysis(self, image_path: str, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]],
+                        face_encodings: List[np.ndarray], triggers: List[str], cache_key: Any) -> Dict[str, Any]:
+        """Score each face and package the per-image result, storing it in the cache"""
+        quality = score_faces(image, face_locations)
         
-        if not face_locations:
-            self.logger.warning(f"No faces found in {image_path}")
-            return []
+        analysis = {
+            'image_path': image_path,
+            'face_locations': face_locations,
+            'face_encodings': face_encodings,
+            'quality': quality,
+            'escalation_triggers': triggers
+        }
+        if cache_key is not None:
+            self.cache.put(cache_key, analysis)
+        return analysis
+
+    def _add_thumbnails(self, image: np.ndarray, analysis: Dict[str, Any], content_hash: str) -> Dict[str, Any]:
+        """Write the thumbnails of an analysed image, adding their cache keys to the analysis"""
+        if self.thumbnails is None or not analysis['face_locations']:
+            return analysis
+        analysis = {**analysis, 'thumbnails': self.thumbnails.put_faces(image, analysis['face_locations'], content_hash)}
+        if self.thumbnail_previews:
+            analysis['preview'] = self.thumbnails.put_preview(image, content_hash)
+        return analysis
+
+    def analyze_image(self, image_path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Detect, encode and score every face in an image without touching identity state.
+
+        Per-stage timings go to self.pipeline_stats.
+        """
+        stats = self.pipeline_stats
+        with stats.stage('decode'):
+            image, cache_key, analysis, content_hash = self._load_image(image_path)
+        if analysis is None:
+            face_locations, face_encodings, triggers = self._detect_and_encode(image, image_path)
+            with stats.stage('quality', len(face_locations)):
+                analysis = self._build_analysis(image_path, image, face_locations, face_encodings, triggers, cache_key)
         
-        # Convert image for OpenCV
-        image_cv = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        if self.thumbnails is not None:
+            with stats.stage('thumbnail', len(analysis['face_locations'])):
+                analysis = self._add_thumbnails(image, analysis, content_hash)
+        if content_hash is not None:
+            analysis = {**analysis, 'content_hash': content_hash}
+        return image, analysis
+
+    def _merge_analysis(self, analysis: Dict[str, Any], keep_results: bool = True) -> List[Dict[str, Any]]:
+        """Assign identities to an analysed image, recording its faces in person_photos if keep_results"""
+        # Match every face in the image against the gallery in one batch
+        identities = self._assign_identities(analysis['face_encodings'])
         
-        # Process each face in the image
         face_data = []
-        for idx, (face_encoding, face_location) in enumerate(zip(face_encodings, face_locations)):
-            # Try to match with known faces
-            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=self.tolerance)
-            
-            # Calculate face distances for better matching
-            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-            
-            person_id = None
-            best_match_index = None
-            if True in matches:
-                # Find the best match
-                best_match_index = np.argmin(face_distances)
-                if face_distances[best_match_index] < self.tolerance:
-                    person_id = self.known_face_names[best_match_index]
-                    self.logger.info(f"Matched face to {person_id} with distance {face_distances[best_match_index]:.2f}")
-            else:
-                # New person
-                person_id = f"Person_{self.next_person_id}"
-                self.next_person_id += 1
-                self.known_face_encodings.append(face_encoding)
-                self.known_face_names.append(person_id)
-                self.logger.info(f"Found new person: {person_id}")
+        for face_index, (face_location, face_encoding, quality, (person_id, face_distance)) in enumerate(zip(
+                analysis['face_locations'], analysis['face_encodings'], analysis['quality'], identities)):
+            # The key ties this face to its gallery entry when consolidation relabels it
+            key = face_key(face_encoding)
+            timestamp = datetime.now().isoformat()
+            thumbnails = {}
+            if 'thumbnails' in analysis:
+                thumbnails['thumbnail'] = analysis['thumbnails'][face_index]
+            if 'preview' in analysis:
+                thumbnails['preview'] = analysis['preview']
             
             # Store photo information for this person
-            face_distance = float(face_distances[best_match_index]) if best_match_index is not None else None
-            self.person_photos[person_id].append({
-                'image_path': image_path,
-                'face_location': face_location,
-                'timestamp': datetime.now().isoformat(),
-                'face_distance': face_distance
-            })
-            
-            # Draw rectangle and label on image
-            top, right, bottom, left = face_location
-            cv2.rectangle(image_cv, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(image_cv, person_id, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            if keep_results:
+                self.person_photos[person_id].append({
+                    'image_path': analysis['image_path'],
+                    'face_location': face_location,
+                    'timestamp': timestamp,
+                    'face_distance': face_distance,
+                    'quality': quality,
+                    'face_key': key,
+                    **thumbnails
+                })
             
             face_data.append({
                 'person_id': person_id,
                 'face_location': face_location,
-                'face_distance': face_distance
+                'face_distance': face_distance,
+                'quality': quality,
+                'face_key': key,
+                'timestamp': timestamp,
+                **thumbnails
             })
         
+        return face_data
+
+    def _write_annotated_image(self, image: np.ndarray, image_path: str, face_data: List[Dict[str, Any]], output_dir: str):
+        """Draw labelled boxes on the image and save it to the output directory"""
+        # Convert image for OpenCV
+        image_cv = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        
+        for face in face_data:
+            # Draw rectangle and label on image
+            top, right, bottom, left = face['face_location']
+            cv2.rectangle(image_cv, (left, top), (right, bottom), (0, 255, 0), 2)
+            cv2.putText(image_cv, face['person_id'], (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        
         # Save processed image
         output_filename = os.path.join(output_dir, f"processed_{os.path.basename(image_path)}")
         cv2.imwrite(output_filename, image_cv)
+
+    def process_image(self, image_path: str, output_dir: str = 'processed_results') -> List[Dict[str, Any]]:
+        self.logger.info(f"Processing {image_path}")
+        
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # Get face information
+        image, analysis = self.analyze_image(image_path)
+        return self._merge_and_write(image, analysis, output_dir)
+
+    def _merge_and_write(self, image: np.ndarray, analysis: Dict[str, Any], output_dir: str,
+                         keep_results: bool = True) -> List[Dict[str, Any]]:
+        """Assign identities to an analysed image and write its annotated copy"""
+        self._record_detection(analysis)
+        
+        if not analysis['face_locations']:
+            self.logger.warning(f"No faces found in {analysis['image_path']}")
+            return []
+        
+        with self.pipeline_stats.stage('match', len(analysis['face_locations'])):
+            face_data = self._merge_analysis(analysis, keep_results)
+        with self.pipeline_stats.stage('write'):
+            self._write_annotated_image(image, analysis['image_path'], face_data, output_dir)
         
         return face_data
 
-    def process_directory(self, input_dir: str, output_dir: str = 'processed_results'):
-        """Process all images in directory and subdirectories"""
+    def _face_records(self, analysis: Dict[str, Any], face_data: List[Dict[str, Any]],
+                      image: np.ndarray = None) -> Iterator[Dict[str, Any]]:
+        """Stream records for an image's faces, with face_image crops when the image is given"""
+        for face_index, (face, encoding) in enumerate(zip(face_data, analysis['face_encodings'])):
+            record = {'image_path': analysis['image_path'], 'face_index': face_index, **face,
+                      'encoding': np.asarray(encoding, dtype=np.float32)}
+            if image is not None:
+                top, right, bottom, left = face['face_location']
+                record['face_image'] = image[top:bottom, left:right].copy()
+            yield record
+
+    def _assign_identities(self, face_encodings: List[np.ndarray]) -> List[Tuple[str, Any]]:
+        """Assign a person ID to each face by its nearest person centroid, registering unmatched faces as new people"""
+        identities = self.clusterer.assign(face_encodings)
+        for person_id, face_distance in identities:
+            if face_distance is None:
+                self.logger.info(f"Found new person: {person_id}")
+            else:
+                self.logger.info(f"Matched face to {person_id} with distance {face_distance:.2f}")
+        return identities
+
+    def consolidate_identities(self, manifest: ScanManifest = None) -> Dict[str, str]:
+        """Run the clusterer's merge/split pass and move faces to their final people.
+
+        person_photos (and the manifest's recorded results, if given) are relabelled to match,
+        so the people found do not depend on the order images were processed in. Annotated
+        images already written keep the labels they were drawn with. Returns
+        {face_key: person_id} for the faces that changed person.
+        """
+        relabelled = self.clusterer.consolidate()
+        if not relabelled:
+            return relabelled
+        
+        person_photos = defaultdict(list)
+        for person_id, photos in self.person_photos.items():
+            for photo in photos:
+                person_photos[relabelled.get(photo.get('face_key'), person_id)].append(photo)
+        self.person_photos = person_photos
+        
+        if manifest is not None:
+            for entry in manifest.files.values():
+                for face in entry.get('result') or []:
+                    face['person_id'] = relabelled.get(face.get('face_key'), face['person_id'])
+        
+        self.logger.info(f"Consolidated identities: {len(relabelled)} faces moved, {len(self.clusterer)} people")
+        return relabelled
+
+    def _list_images(self, input_dir: str) -> List[str]:
+        """All images under input_dir in a stable order, so Person_N numbering is reproducible"""
+        image_paths = []
         for root, _, files in os.walk(input_dir):
             for file in files:
                 if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(root, file)
-                    self.process_image(image_path, output_dir)
+                    image_paths.append(os.path.join(root, file))
+        return sorted(image_paths)
+
+    @staticmethod
+    def _gallery_sidecar(manifest: ScanManifest) -> str:
+        """Binary gallery saved beside a scan manifest (see gallery_store.py)"""
+        return f"{manifest.path}.gallery"
 
-    def organize_by_person(self, output_base_dir: str = 'organized_faces'):
-        """Organize photos by person with improved metadata"""
-        os.makedirs(output_base_dir, exist_ok=True)
+    def _save_state(self, manifest: ScanManifest):
+        """Save the gallery sidecar, then a full manifest snapshot that supersedes the journal"""
+        self.save_gallery(self._gallery_sidecar(manifest))
+        manifest.state = {'next_person_id': self.next_person_id}
+        manifest.save()
+
+    def _restore_state(self, manifest: ScanManifest):
+        """Rebuild the gallery and person_photos from a scan manifest and its gallery sidecar"""
+        state = manifest.state
+        if os.path.isdir(self._gallery_sidecar(manifest)):
+            self.load_gallery(self._gallery_sidecar(manifest), mmap=False)
+        elif state.get('person_ids'):
+            # Manifests from before the sidecar held the gallery inline
+            encodings = np.frombuffer(base64.b64decode(state['encodings']), dtype=np.float32)
+            for person_id, encoding in zip(state['person_ids'], encodings.reshape(len(state['person_ids']), -1)):
+                self.gallery.add(encoding, person_id)
+            self.next_person_id = state['next_person_id']
+            self.clusterer.rebuild()
+        if os.path.exists(manifest.journal_path):
+            self._reconcile_gallery(manifest)
         
-        for person_id, photos in self.person_photos.items():
-            person_dir = os.path.join(output_base_dir, person_id)
-            os.makedirs(person_dir, exist_ok=True)
+        for image_path, entry in manifest.files.items():
+            for face in entry.get('result') or []:
+                # Thumbnail keys are only present for runs with a thumbnail_dir
+                thumbnails = {key: face[key] for key in ('thumbnail', 'preview') if face.get(key) is not None}
+                self.person_photos[face['person_id']].append({
+                    'image_path': image_path,
+                    'face_location': tuple(face['face_location']),
+                    'timestamp': entry['processed_at'],
+                    'face_distance': face['face_distance'],
+                    'quality': face.get('quality'),
+                    'face_key': face.get('face_key'),
+                    **thumbnails
+                })
+
+    def _reconcile_gallery(self, manifest: ScanManifest):
+        """Bring the gallery in line with the manifest's entries after an interrupted run.
+
+        The sidecar is only written by a complete save, so faces recorded since then are
+        re-added from the encodings in the journal, faces of images forgotten since are
+        dropped, and every face takes the person its manifest entry has.
+        """
+        expected = Counter()
+        person_of = {}
+        for entry in manifest.files.values():
+            for face in entry.get('result') or []:
+                if face.get('face_key') is not None:
+                    expected[face['face_key']] += 1
+                    person_of[face['face_key']] = face['person_id']
+        
+        entry_ids, encodings = self.gallery.index.vectors()
+        stale = []
+        for entry_id, encoding in zip(entry_ids, encodings):
+            key = face_key(encoding)
+            if expected[key] > 0:
+                expected[key] -= 1
+                if self.gallery.person_ids[entry_id] != person_of[key]:
+                    self.gallery.set_person(int(entry_id), person_of[key])
+            else:
+                stale.append(int(entry_id))
+        if stale:
+            self.gallery.remove(stale)
+        
+        for image_path, extra in manifest.journal_extras.items():
+            result = manifest.files[image_path].get('result') or []
+            encodings = np.frombuffer(base64.b64decode(extra['encodings']), dtype=np.float32).reshape(len(result), -1)
+            for face, encoding in zip(result, encodings):
+                if expected[face['face_key']] > 0:
+                    expected[face['face_key']] -= 1
+                    self.gallery.add(encoding, face['person_id'])
+        self.clusterer.rebuild()
+        
+        # Labels handed out after the last save must not be handed out again
+        numbers = [int(label[len('Person_'):]) for label in person_of.values()
+                   if str(label).startswith('Person_') and label[len('Person_'):].isdigit()]
+        self.next_person_id = max([self.next_person_id] + [number + 1 for number in numbers])
+        self.logger.info(f"Reconciled gallery with the manifest journal: {len(stale)} stale faces dropped, "
+                         f"{len(manifest.journal_extras)} images re-added")
+
+    def _forget_images(self, image_paths: set):
+        """Drop every person_photos entry that came from these images, in one pass"""
+        if not image_paths:
+            return
+        for person_id in list(self.person_photos):
+            photos = [photo for photo in self.person_photos[person_id] if photo['image_path'] not in image_paths]
+            if photos:
+                self.person_photos[person_id] = photos
+            else:
+                del self.person_photos[person_id]
+
+    def _record_result(self, manifest: ScanManifest, analysis: Dict[str, Any], face_data: List[Dict[str, Any]]):
+        """Mark an image as done in the manifest, journaling its encodings so a crash can be resumed"""
+        if manifest is None:
+            return
+        extra = None
+        if face_data:
+            encodings = np.asarray(analysis['face_encodings'], dtype=np.float32)
+            extra = {'encodings': base64.b64encode(np.ascontiguousarray(encodings).tobytes()).decode('ascii')}
+        manifest.record(analysis['image_path'], face_data, sha256=analysis.get('content_hash'), extra=extra)
+        if manifest.needs_checkpoint:
+            manifest.checkpoint()
+
+    def process_directory(self, input_dir: str, output_dir: str = 'processed_results', workers: int = 1,
+                          manifest_path: str = None, batch_size: int = None, consolidate: bool = True,
+                          sinks: List[Any] = None, keep_results: bool = True) -> int:
+        """Process all images in directory and subdirectories, returning the number of faces found.
+
+        Runs iter_directory to the end, feeding every face record to `sinks` (see
+        face_stream.py). With keep_results=False, person_photos is not filled, so memory
+        stays flat on very large runs; organize_by_person can then run from the saved stream.
+        Records carry the online person IDs; faces moved by the closing consolidation pass
+        are passed to each sink's relabel() afterwards, before the caller closes the sinks.
+        """
+        sinks = sinks or []
+        count = write_records(self.iter_directory(input_dir, output_dir, workers, manifest_path, batch_size,
+                                                  consolidate=consolidate, keep_results=keep_results), sinks)
+        if self.relabelled:
+            for sink in sinks:
+                if hasattr(sink, 'relabel'):
+                    sink.relabel(self.relabelled)
+        return count
+
+    def iter_directory(self, input_dir: str, output_dir: str = 'processed_results', workers: int = 1,
+                       manifest_path: str = None, batch_size: int = None, include_pixels: bool = False,
+                       keep_results: bool = True, consolidate: bool = False) -> Iterator[Dict[str, Any]]:
+        """Process all images in directory and subdirectories, yielding one record per face as each image finishes.
+
+        Records hold image_path, face_index, face_location, encoding (float32), quality,
+        person_id, face_distance, face_key and timestamp; with include_pixels they also carry
+        the face_image crop, and with a thumbnail_dir the thumbnail (and preview) cache keys.
+        With keep_results=False nothing accumulates in person_photos.
+
+        With workers != 1, detection, encoding, quality scoring and annotated-image writing
+        run in a process pool (workers=None sizes it to the machine). Identity assignment
+        stays in this process and consumes results in path order, so the people found are
+        the same as a serial run.
+
+        With batch_size, images are processed in this process in windows, and CNN detection
+        runs in batches of similar-size images (see batch_detection.py). Per-stage throughput
+        is kept in self.pipeline_stats.
+
+        With manifest_path, the scan is incremental: only new or changed images are
+        processed and deleted images are dropped from person_photos. Checkpoints append
+        only the changed entries (with their encodings) to the manifest's journal, so an
+        interrupted run picks up where it stopped; the gallery itself is saved beside the
+        manifest (manifest_path + ".gallery") once the run completes.
+
+        Streamed person IDs are the online assignment. With consolidate, a merge/split pass
+        over every face settles the final people once the stream is exhausted (see
+        consolidate_identities); the faces it moved are left in self.relabelled.
+        """
+        if batch_size and workers != 1:
+            raise ValueError("batch_size batches detection in this process; use it with workers=1")
+        
+        image_paths = self._list_images(input_dir)
+        
+        manifest = None
+        if manifest_path:
+            manifest = ScanManifest(manifest_path)
+            # The manifest reuses the hash of the bytes each image was decoded from
+            self.hash_files = True
+            if len(self.gallery) == 0:
+                self._restore_state(manifest)
+            image_paths, unchanged, deleted = manifest.diff(image_paths)
+            # Only images the manifest already knows can have faces to forget; new files are skipped
+            known = {image_path for image_path in image_paths + deleted if image_path in manifest.files}
+            self._forget_images(known)
+            forgotten = [face.get('face_key') for image_path in known
+                         for face in manifest.files[image_path].get('result') or []]
+            # Their faces leave the gallery too; changed images are re-added below
+            self.clusterer.remove_faces([key for key in forgotten if key is not None])
+            for image_path in deleted:
+                manifest.forget(image_path)
+            self.logger.info(f"Incremental scan: {len(image_paths)} new or changed, "
+                             f"{len(unchanged)} unchanged, {len(deleted)} deleted")
+        
+        if batch_size:
+            merged = self._iter_batched(image_paths, output_dir, batch_size, keep_results)
+        elif workers == 1:
+            merged = self._iter_serial(image_paths, output_dir, keep_results)
+        else:
+            merged = self._iter_parallel(image_paths, output_dir, workers, keep_results)
+        
+        for image, analysis, face_data in merged:
+            self._record_result(manifest, analysis, face_data)
+            if include_pixels and image is None and face_data:
+                image = face_recognition.load_image_file(analysis['image_path'])
+            yield from self._face_records(analysis, face_data, image if include_pixels else None)
+        
+        self.relabelled = self.consolidate_identities(manifest) if consolidate else {}
+        
+        if manifest is not None:
+            self.hash_files = False
+            self._save_state(manifest)
+
+    def _iter_serial(self, image_paths: List[str], output_dir: str, keep_results: bool):
+        os.makedirs(output_dir, exist_ok=True)
+        for image_path in image_paths:
+            self.logger.info(f"Processing {image_path}")
+            image, analysis = self.analyze_image(image_path)
+            yield image, analysis, self._merge_and_write(image, analysis, output_dir, keep_results)
+
+    def _iter_batched(self, image_paths: List[str], output_dir: str, batch_size: int, keep_results: bool):
+        os.makedirs(output_dir, exist_ok=True)
+        stats = self.pipeline_stats
+        # Several batches per window gives the size buckets a chance to fill up
+        window = batch_size * 4
+        
+        for start in range(0, len(image_paths), window):
+            chunk = image_paths[start:start + window]
+            
+            with stats.stage('decode', len(chunk)):
+                loaded = [self._load_image(image_path) for image_path in chunk]
+            pending = [i for i, (_, _, cached, _) in enumerate(loaded) if cached is None]
+            
+            with stats.stage('preprocess', len(pending)):
+                prepared = {i: self._prepare_detection_image(loaded[i][0]) for i in pending}
             
-            # Sort photos by face distance (best matches first)
-            photos.sort(key=lambda x: x.get('face_distance', float('inf')))
+            with stats.stage('detect', len(pending)):
+                detections = self._detect_faces_batch([prepared[i][0] for i in pending], batch_size)
             
-            for idx, photo_data in enumerate(photos):
-                src_path = photo_data['image_path']
-                ext = os.path.splitext(src_path)[1]
-                dst_path = os.path.join(person_dir, f"{person_id}_photo_{idx}{ext}")
-                shutil.copy2(src_path, dst_path)
+            analyses = [cached for _, _, cached, _ in loaded]
+            for i, (small_locations, triggers) in zip(pending, detections):
+                image, cache_key, _, _ = loaded[i]
+                processed_image, scale, small_gray = prepared[i]
+                face_locations = upscale_locations(small_locations, scale, image.shape)
+                face_encodings = self._encode_faces(image, processed_image, scale, small_gray, face_locations) if face_locations else []
+                with stats.stage('quality', len(face_locations)):
+                    analyses[i] = self._build_analysis(chunk[i], image, face_locations, face_encodings, triggers, cache_key)
             
-            # Save enhanced metadata
-            metadata_path = os.path.join(person_dir, 'metadata.json')
-            with open(metadata_path, 'w') as f:
-                json.dump({
-                    'person_id': person_id,
-                    'total_photos': len(photos),
-                    'photos': photos,
-                    'average_face_distance': np.mean([p.get('face_distance', float('inf')) for p in photos])
-                }, f, indent=2)
+            # Merge in path order so numbering matches the serial and pool modes
+            for (image, _, _, content_hash), analysis in zip(loaded, analyses):
+                if self.thumbnails is not None:
+                    with stats.stage('thumbnail', len(analysis['face_locations'])):
+                        analysis = self._add_thumbnails(image, analysis, content_hash)
+                self._record_detection(analysis)
+                if not analysis['face_locations']:
+                    self.logger.warning(f"No faces found in {analysis['image_path']}")
+                    yield image, analysis, []
+                    continue
+                with stats.stage('match', len(analysis['face_locations'])):
+                    face_data = self._merge_analysis(analysis, keep_results)
+                with stats.stage('write'):
+                    self._write_annotated_image(image, analysis['image_path'], face_data, output_dir)
+                yield image, analysis, face_data
+        
+        self.logger.info(f"Batched pipeline throughput:\n{stats.format_report()}")
+
+    def _iter_parallel(self, image_paths: List[str], output_dir: str, workers: int, keep_results: bool):
+        os.makedirs(output_dir, exist_ok=True)
+        settings = {'tolerance': self.tolerance, 'model': self.model, 'num_jitters': self.num_jitters,
+                    'cache_dir': self.cache_dir, 'cache_max_bytes': self.cache_max_bytes,
+                    'detection_policy': self.detection_policy, 'cascade_options': self.cascade_options,
+                    'max_detection_dim': self.max_detection_dim, 'thumbnail_dir': self.thumbnail_dir,
+                    'thumbnail_previews': self.thumbnail_previews, 'thumbnail_max_bytes': self.thumbnail_max_bytes}
+        
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(settings, self.pipeline_stats.keep_samples, self.hash_files)) as pool:
+            writes = []
+            # map() yields in submission order, which makes this the deterministic merge step
+            for analysis, worker_stats in pool.map(_analyze_in_worker, image_paths):
+                # Analysis stages are timed in the workers and merged here
+                self.pipeline_stats.merge(worker_stats)
+                self._record_detection(analysis)
+                if not analysis['face_locations']:
+                    self.logger.warning(f"No faces found in {analysis['image_path']}")
+                    yield None, analysis, []
+                    continue
+                with self.pipeline_stats.stage('match', len(analysis['face_locations'])):
+                    face_data = self._merge_analysis(analysis, keep_results)
+                writes.append(pool.submit(_write_in_worker, analysis['image_path'], face_data, output_dir))
+                # Finished writes are released as we go instead of piling up until the end
+                for write in [write for write in writes if write.done()]:
+                    self.pipeline_stats.merge(write.result())
+                writes = [write for write in writes if not write.done()]
+                yield None, analysis, face_data
+            
+            for write in writes:
+                self.pipeline_stats.merge(write.result())
+
+    def organize_by_person(self, output_base_dir: str = 'organized_faces', records: Iterable[Dict[str, Any]] = None,
+                           relabelled: Dict[str, str] = None, strategy: str = 'hardlink', workers: int = 8) -> Dict[str, Any]:
+        """Organize photos by person with improved metadata.
+
+        `records` is a face record stream, e.g. iter_directory's or read_jsonl() of a saved
+        run; without it person_photos is used, best matches first. `relabelled`
+        ({face_key: person_id}, e.g. self.relabelled) maps streamed IDs to consolidated people.
+        Photos are hard-linked by default; see photo_organizer.py for the other strategies and
+        for how reruns only rebuild people whose photos changed. Returns the organizer report.
+        """
+        if records is None:
+            records = self._person_photo_records()
+        organizer = PhotoOrganizer(output_base_dir, strategy=strategy, workers=workers)
+        return organizer.organize(records, relabelled)
+
+    def _person_photo_records(self) -> Iterator[Dict[str, Any]]:
+        """person_photos as a record stream, each person's best matches first"""
+        for person_id, photos in self.person_photos.items():
+            # A person's first face has no distance; it is their reference
+            for photo in sorted(photos, key=lambda p: p.get('face_distance') or 0.0):
+                yield {**photo, 'person_id': person_id}
+
+    def save_gallery(self, path: str):
+        """Save the known face encodings in the binary gallery format (see gallery_store.py)"""
+        save_face_gallery(path, self.gallery, {'next_person_id': self.next_person_id, 'tolerance': self.tolerance},
+                          clusters=self.clusterer.cluster_state())
+
+    def load_gallery(self, path: str, mmap: bool = True):
+        """Resume matching against a gallery written by save_gallery"""
+        index = None if self.index_backend == "exact" else create_index(self.index_backend, **self.index_options)
+        self.gallery, meta = load_face_gallery(path, mmap=mmap, index=index)
+        self.next_person_id = meta['metadata'].get('next_person_id', len(self.gallery) + 1)
+        self.clusterer = self._make_clusterer(load_clusters(path))
 
     def save_recognition_data(self, output_file: str = 'recognition_data.json'):
         """Save recognition data with enhanced information"""
@@ -228,6 +880,33 @@ class FaceRecognitionProcessor:
         with open(output_file, 'w') as f:
             json.dump(data, f, indent=2)
 
+# Per-process processor used by the process_directory worker pool
+_worker_processor = None
+
+def _init_worker(settings: Dict[str, Any], keep_samples: bool = False, hash_files: bool = False):
+    global _worker_processor
+    _worker_processor = FaceRecognitionProcessor(**settings)
+    _worker_processor.pipeline_stats = PipelineStats(keep_samples)
+    _worker_processor.hash_files = hash_files
+
+def _worker_stats() -> PipelineStats:
+    # Each task times its stages into fresh stats that go back to the parent with its result
+    stats = _worker_processor.pipeline_stats = PipelineStats(_worker_processor.pipeline_stats.keep_samples)
+    return stats
+
+def _analyze_in_worker(image_path: str) -> Tuple[Dict[str, Any], PipelineStats]:
+    stats = _worker_stats()
+    _worker_processor.logger.info(f"Processing {image_path}")
+    _, analysis = _worker_processor.analyze_image(image_path)
+    return analysis, stats
+
+def _write_in_worker(image_path: str, face_data: List[Dict[str, Any]], output_dir: str) -> PipelineStats:
+    stats = _worker_stats()
+    with stats.stage('write'):
+        image = face_recognition.load_image_file(image_path)
+        _worker_processor._write_annotated_image(image, image_path, face_data, output_dir)
+    return stats
+
 if __name__ == "__main__":
     # Initialize processor with improved settings
     processor = FaceRecognitionProcessor(
@@ -236,8 +915,8 @@ if __name__ == "__main__":
         num_jitters=3   # More jitters for better encoding
     )
     
-    # Process all images
-    processor.process_directory('test_dataset')
+    # Process all images, using every core for detection and encoding
+    processor.process_directory('test_dataset', workers=None)
     
     # Organize photos by person
     processor.organize_by_person()
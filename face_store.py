@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import os
+import uuid
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from sqlalchemy import (create_engine, MetaData, Table, Column, String, Float, Boolean, DateTime, JSON,
+                        LargeBinary, ForeignKey, UniqueConstraint, Index, select, update, func, false)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+
+logger = logging.getLogger(__name__)
+
+# Mirrors prisma/schema.prisma; Prisma migrations own the Postgres schema, create_all is only
+# used for SQLite (tests and local runs)
+metadata = MetaData()
+_json = JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+users = Table(
+    'User', metadata,
+    Column('id', String, primary_key=True),
+    Column('email', String, nullable=False, unique=True),
+    Column('username', String, nullable=False, unique=True),
+    Column('name', String, nullable=False),
+    Column('passwordHash', String, nullable=False),
+    Column('createdAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Column('updatedAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Column('bio', String),
+    Column('avatarUrl', String)
+)
+
+photos = Table(
+    'Photo', metadata,
+    Column('id', String, primary_key=True),
+    Column('url', String, nullable=False),
+    Column('uploaderId', String, ForeignKey('User.id'), nullable=False),
+    Column('createdAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Column('updatedAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Column('caption', String),
+    Column('location', String)
+)
+
+photo_tags = Table(
+    'PhotoTag', metadata,
+    Column('id', String, primary_key=True),
+    Column('photoId', String, ForeignKey('Photo.id'), nullable=False),
+    Column('userId', String, ForeignKey('User.id'), nullable=False),
+    Column('boundingBox', _json),
+    Column('confidence', Float),
+    Column('createdAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    UniqueConstraint('photoId', 'userId', name='PhotoTag_photoId_userId_key')
+)
+
+persons = Table(
+    'Person', metadata,
+    Column('id', String, primary_key=True),
+    Column('userId', String, ForeignKey('User.id')),
+    Column('createdAt', DateTime, nullable=False, server_default=func.current_timestamp())
+)
+
+face_embeddings = Table(
+    'FaceEmbedding', metadata,
+    Column('id', String, primary_key=True),
+    Column('photoId', String, ForeignKey('Photo.id')),
+    Column('personId', String, ForeignKey('Person.id')),
+    Column('boundingBox', _json, nullable=False),
+    Column('confidence', Float),
+    Column('embedding', LargeBinary, nullable=False),
+    Column('quality', _json),
+    Column('inGallery', Boolean, nullable=False, server_default=false()),
+    Column('createdAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    # Bumped whenever the face moves to another person, so replicas sync relabels too
+    Column('updatedAt', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Index('FaceEmbedding_photoId_idx', 'photoId'),
+    Index('FaceEmbedding_personId_idx', 'personId'),
+    Index('FaceEmbedding_inGallery_updatedAt_idx', 'inGallery', 'updatedAt')
+)
+
+FACE_COLUMNS = ['id', 'photoId', 'personId', 'boundingBox', 'confidence', 'embedding', 'quality', 'inGallery']
+
+# How far back each sync re-reads, for rows committed after a later-stamped row was seen
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _sqlalchemy_url(url: str) -> URL:
+    """Accept a Prisma DATABASE_URL: postgres:// scheme and the Prisma-only ?schema= parameter"""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return make_url(url).difference_update_query(['schema'])
+
+
+class FaceStore:
+    """Face detections, embeddings and person assignments in the app database.
+
+    Uses the Prisma-managed Postgres schema (Person, FaceEmbedding, PhotoTag) through a
+    pooled SQLAlchemy engine, or a SQLite file for tests. Faces are written in bulk, with
+    COPY on Postgres via psycopg2 and executemany elsewhere.
+    """
+
+    def __init__(self, url: Optional[str] = None, pool_size: int = 5, max_overflow: int = 10,
+                 create_tables: Optional[bool] = None):
+        url = _sqlalchemy_url(url or os.environ['DATABASE_URL'])
+        self.is_sqlite = url.get_backend_name() == 'sqlite'
+        options = {} if self.is_sqlite else {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_pre_ping': True}
+        self.engine = create_engine(url, **options)
+        if create_tables if create_tables is not None else self.is_sqlite:
+            metadata.create_all(self.engine)
+
+    def _insert(self, table: Table):
+        dialect = postgresql if self.engine.dialect.name == 'postgresql' else sqlite
+        return dialect.insert(table)
+
+    def ensure_persons(self, person_ids: Iterable[str]):
+        """Create any Person rows that do not exist yet"""
+        rows = [{'id': person_id} for person_id in sorted(set(person_ids))]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(self._insert(persons).on_conflict_do_nothing(index_elements=['id']), rows)
+
+    def add_faces(self, faces: List[Dict[str, Any]]):
+        """Insert faces in one batch.
+
+        Each face has id, photo_id (optional), person_id, bounding_box, confidence, embedding,
+        quality and in_gallery (whether it is a reference encoding for matching).
+        """
+        if not faces:
+            return
+        self.ensure_persons(face['person_id'] for face in faces if face.get('person_id') is not None)
+        rows = [{
+            'id': face['id'],
+            'photoId': face.get('photo_id'),
+            'personId': face.get('person_id'),
+            'boundingBox': face['bounding_box'],
+            'confidence': face.get('confidence'),
+            'embedding': np.asarray(face['embedding'], dtype=np.float32).tobytes(),
+            'quality': face.get('quality'),
+            'inGallery': bool(face.get('in_gallery', False))
+        } for face in faces]
+
+        if self.engine.dialect.name == 'postgresql' and self.engine.dialect.driver == 'psycopg2':
+            self._copy_faces(rows)
+        else:
+            with self.engine.begin() as conn:
+                conn.execute(face_embeddings.insert(), rows)
+
+    def _copy_faces(self, rows: List[Dict[str, Any]]):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # Unquoted empty fields are NULL in COPY's CSV format
+            writer.writerow([
+                row['id'], row['photoId'], row['personId'], json.dumps(row['boundingBox']),
+                row['confidence'], '\\x' + row['embedding'].hex(),
+                json.dumps(row['quality']) if row['quality'] is not None else None,
+                't' if row['inGallery'] else 'f'
+            ])
+        buffer.seek(0)
+        columns = ', '.join(f'"{column}"' for column in FACE_COLUMNS)
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(f'COPY "FaceEmbedding" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def assign_person(self, face_ids: List[str], person_id: str):
+        """Move faces to a person, e.g. after a merge"""
+        self.ensure_persons([person_id])
+        with self.engine.begin() as conn:
+            conn.execute(update(face_embeddings).where(face_embeddings.c.id.in_(face_ids))
+                         .values(personId=person_id, updatedAt=func.current_timestamp()))
+
+    def link_person(self, person_id: str, user_id: Optional[str]):
+        """Associate a person with an app user, so their faces become PhotoTags"""
+        self.ensure_persons([person_id])
+        with self.engine.begin() as conn:
+            conn.execute(update(persons).where(persons.c.id == person_id).values(userId=user_id))
+
+    def tag_photos(self, photo_ids: Optional[List[str]] = None) -> int:
+        """Create PhotoTags for faces whose person is linked to a user, returning how many were added.
+
+        One tag per (photo, user), from the most confident face; existing tags are kept.
+        """
+        query = (select(face_embeddings.c.photoId, persons.c.userId, face_embeddings.c.boundingBox,
+                        face_embeddings.c.confidence)
+                 .join(persons, face_embeddings.c.personId == persons.c.id)
+                 .where(persons.c.userId.is_not(None), face_embeddings.c.photoId.is_not(None)))
+        if photo_ids is not None:
+            query = query.where(face_embeddings.c.photoId.in_(photo_ids))
+
+        best: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with self.engine.begin() as conn:
+            for photo_id, user_id, box, confidence in conn.execute(query):
+                current = best.get((photo_id, user_id))
+                if current is None or (confidence or 0.0) > (current['confidence'] or 0.0):
+                    best[(photo_id, user_id)] = {'id': new_id(), 'photoId': photo_id, 'userId': user_id,
+                                                 'boundingBox': box, 'confidence': confidence}
+            if not best:
+                return 0
+            result = conn.execute(
+                self._insert(photo_tags).on_conflict_do_nothing(index_elements=['photoId', 'userId']),
+                list(best.values()))
+        return max(result.rowcount, 0)
+
+    def load_gallery(self, since: Optional[datetime] = None) -> Tuple[List[str], List[str], np.ndarray, Optional[datetime]]:
+        """Reference faces added or moved to another person at or after `since`.
+
+        Returns (face_ids, person_ids, encodings, latest updatedAt); a face already seen is
+        returned again with its new person after assign_person moves it.
+        """
+        query = (select(face_embeddings.c.id, face_embeddings.c.personId, face_embeddings.c.embedding,
+                        face_embeddings.c.updatedAt)
+                 .where(face_embeddings.c.inGallery.is_(True))
+                 .order_by(face_embeddings.c.updatedAt))
+        if since is not None:
+            query = query.where(face_embeddings.c.updatedAt >= since)
+
+        face_ids, person_ids, blobs, latest = [], [], [], since
+        with self.engine.connect() as conn:
+            for face_id, person_id, embedding, updated_at in conn.execute(query):
+                face_ids.append(face_id)
+                person_ids.append(person_id)
+                blobs.append(embedding)
+                latest = updated_at
+        encodings = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1) if blobs else np.empty((0, 128), dtype=np.float32)
+        return face_ids, person_ids, encodings, latest
+
+    def faces_for_photo(self, photo_id: str) -> List[Dict[str, Any]]:
+        query = (select(face_embeddings.c.id, face_embeddings.c.personId, face_embeddings.c.boundingBox,
+                        face_embeddings.c.confidence, face_embeddings.c.quality)
+                 .where(face_embeddings.c.photoId == photo_id))
+        with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(query)]
+
+    def close(self):
+        self.engine.dispose()
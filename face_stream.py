@@ -0,0 +1,206 @@
+import base64
+import json
+import os
+import numpy as np
+from typing import Iterable, Iterator, List, Dict, Any, Optional
+from gallery_store import save_gallery
+from face_store import FaceStore, new_id
+
+# Per-face records, as yielded by FaceRecognitionProcessor.iter_directory and
+# FaceDetectionProcessor.iter_images, are plain dicts. Sinks consume them one at a time so a
+# run never has to hold every result in memory. Pixel payloads (face_image, aligned_face)
+# are only present when asked for and are never written by the JSONL or database sinks.
+# Sinks may also have relabel({face_key: person_id}), called before close when identity
+# consolidation moved faces after they were written.
+PIXEL_FIELDS = ('face_image', 'aligned_face')
+
+
+def _encode_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def record_to_json(record: Dict[str, Any]) -> str:
+    """One JSON line for a record; the encoding is stored as base64 float32"""
+    data = {key: value for key, value in record.items() if key not in PIXEL_FIELDS and key != 'encoding'}
+    if record.get('encoding') is not None:
+        data['encoding'] = base64.b64encode(np.asarray(record['encoding'], dtype=np.float32).tobytes()).decode('ascii')
+    return json.dumps(data, default=_encode_value)
+
+
+def record_from_json(line: str) -> Dict[str, Any]:
+    record = json.loads(line)
+    if record.get('encoding') is not None:
+        record['encoding'] = np.frombuffer(base64.b64decode(record['encoding']), dtype=np.float32)
+    if record.get('face_location') is not None:
+        record['face_location'] = tuple(record['face_location'])
+    return record
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream records back from a JsonlSink file"""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield record_from_json(line)
+
+
+def write_records(records: Iterable[Dict[str, Any]], sinks: List[Any]) -> int:
+    """Feed every record to every sink, returning how many records there were"""
+    count = 0
+    for record in records:
+        for sink in sinks:
+            sink.write(record)
+        count += 1
+    return count
+
+
+class JsonlSink:
+    """Appends one JSON line per record"""
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self._file = open(path, 'a' if append else 'w')
+        self._relabelled: Dict[str, Any] = {}
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(record_to_json(record) + '\n')
+
+    def relabel(self, relabelled: Dict[str, Any]):
+        """Move faces to new people; the file is rewritten once, on close"""
+        self._relabelled.update(relabelled)
+
+    def close(self):
+        self._file.close()
+        if not self._relabelled:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(self.path) as source, open(tmp_path, 'w') as target:
+            for line in source:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                person_id = self._relabelled.get(record.get('face_key'))
+                if person_id is not None:
+                    record['person_id'] = person_id
+                    line = json.dumps(record) + '\n'
+                target.write(line)
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BinarySink:
+    """Writes encodings and person IDs as a gallery directory (see gallery_store.py).
+
+    Encodings are appended to a raw float32 file as they arrive and only turned into the
+    gallery files on close, through a memory map, so memory use does not grow with the run.
+    Records without an encoding are skipped.
+    """
+
+    def __init__(self, path: str, dim: int = 128, metadata: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.dim = dim
+        self.metadata = metadata or {}
+        self.count = 0
+        self._raw_path = f"{os.path.abspath(path)}.raw-{os.getpid()}"
+        self._raw = open(self._raw_path, 'wb')
+        self._person_ids: List[str] = []
+        self._face_keys: List[Optional[str]] = []
+
+    def write(self, record: Dict[str, Any]):
+        if record.get('encoding') is None:
+            return
+        self._raw.write(np.asarray(record['encoding'], dtype=np.float32).reshape(self.dim).tobytes())
+        self._person_ids.append(str(record.get('person_id')))
+        self._face_keys.append(record.get('face_key'))
+        self.count += 1
+
+    def relabel(self, relabelled: Dict[str, Any]):
+        """Move already written faces to new people"""
+        for i, key in enumerate(self._face_keys):
+            if key in relabelled:
+                self._person_ids[i] = str(relabelled[key])
+
+    def close(self) -> Dict[str, Any]:
+        self._raw.close()
+        try:
+            if self.count:
+                encodings = np.memmap(self._raw_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+            else:
+                encodings = np.empty((0, self.dim), dtype=np.float32)
+            return save_gallery(self.path, encodings, self._person_ids, self.metadata)
+        finally:
+            os.remove(self._raw_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StoreSink:
+    """Inserts records into the app database (see face_store.py) in batches"""
+
+    def __init__(self, store: FaceStore, batch_size: int = 500, photo_id: Optional[str] = None):
+        self.store = store
+        self.batch_size = batch_size
+        self.photo_id = photo_id
+        self._pending: List[Dict[str, Any]] = []
+        # Face row IDs by face_key, so relabel can move rows already inserted
+        self._face_ids: Dict[str, str] = {}
+
+    def write(self, record: Dict[str, Any]):
+        if record.get('encoding') is None:
+            return
+        top, right, bottom, left = (int(value) for value in record['face_location'])
+        distance = record.get('face_distance')
+        face_id = new_id()
+        if record.get('face_key') is not None:
+            self._face_ids[record['face_key']] = face_id
+        self._pending.append({
+            'id': face_id,
+            'photo_id': record.get('photo_id', self.photo_id),
+            'person_id': str(record['person_id']) if record.get('person_id') is not None else None,
+            'bounding_box': {'top': top, 'right': right, 'bottom': bottom, 'left': left,
+                             'width': right - left, 'height': bottom - top},
+            'confidence': 1 - distance if distance is not None else 1.0,
+            'embedding': record['encoding'],
+            'quality': record.get('quality'),
+            'in_gallery': True
+        })
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.store.add_faces(self._pending)
+            self._pending = []
+
+    def relabel(self, relabelled: Dict[str, Any]):
+        """Move already written faces to new people"""
+        self.flush()
+        moves: Dict[str, List[str]] = {}
+        for key, person_id in relabelled.items():
+            face_id = self._face_ids.get(key)
+            if face_id is not None:
+                moves.setdefault(str(person_id), []).append(face_id)
+        for person_id, face_ids in moves.items():
+            self.store.assign_person(face_ids, person_id)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+from typing import List, Tuple, Dict, Any, Optional, Sequence
+from face_gallery import FaceGallery
+from face_index import FaceIndex
+from face_landmarks import ENCODER_MODEL
+
+logger = logging.getLogger(__name__)
+
+GALLERY_FORMAT = 'face-gallery'
+GALLERY_VERSION = 1
+
+ENCODINGS_FILE = 'encodings.npy'
+SQ_NORMS_FILE = 'sq_norms.npy'
+PERSON_IDS_FILE = 'person_ids.npy'
+META_FILE = 'meta.json'
+GALLERY_FILES = (ENCODINGS_FILE, SQ_NORMS_FILE, PERSON_IDS_FILE, META_FILE)
+# Optional per-person running sums and counts, so identity clustering loads without
+# reading every encoding (see IdentityClusterer.cluster_state)
+CLUSTER_LABELS_FILE = 'cluster_labels.npy'
+CLUSTER_SUMS_FILE = 'cluster_sums.npy'
+CLUSTER_COUNTS_FILE = 'cluster_counts.npy'
+CLUSTER_FILES = (CLUSTER_LABELS_FILE, CLUSTER_SUMS_FILE, CLUSTER_COUNTS_FILE)
+
+
+def save_gallery(path: str, encodings: np.ndarray, person_ids: Sequence[Any],
+                 metadata: Optional[Dict[str, Any]] = None,
+                 clusters: Optional[Tuple[Sequence[Any], np.ndarray, np.ndarray]] = None) -> Dict[str, Any]:
+    """Write a gallery directory: float32 encodings, their squared norms, person IDs and meta.json.
+
+    Person IDs are stored as a fixed-width unicode array so every file can be memory
+    mapped without unpickling. `clusters`, if given, is (labels, sums, counts) per person
+    and is saved alongside. The directory is written beside `path` and swapped in, so
+    readers never see a half-written gallery.
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    if encodings.ndim != 2:
+        raise ValueError(f"Expected an (n, dim) encoding matrix, got shape {encodings.shape}")
+    if len(person_ids) != len(encodings):
+        raise ValueError(f"Got {len(encodings)} encodings but {len(person_ids)} person IDs")
+    person_ids = np.array([str(person_id) for person_id in person_ids], dtype=str)
+
+    meta = {
+        'format': GALLERY_FORMAT,
+        'version': GALLERY_VERSION,
+        'count': int(len(encodings)),
+        'dim': int(encodings.shape[1]),
+        'dtype': 'float32',
+        'encoder': ENCODER_MODEL,
+        'saved_at': time.time(),
+        'metadata': metadata or {}
+    }
+    if clusters is not None:
+        meta['clusters'] = len(clusters[0])
+
+    path = os.path.abspath(path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, ENCODINGS_FILE), encodings)
+    np.save(os.path.join(tmp_path, SQ_NORMS_FILE), np.einsum('ij,ij->i', encodings, encodings))
+    np.save(os.path.join(tmp_path, PERSON_IDS_FILE), person_ids)
+    if clusters is not None:
+        labels, sums, counts = clusters
+        np.save(os.path.join(tmp_path, CLUSTER_LABELS_FILE), np.array([str(label) for label in labels], dtype=str))
+        np.save(os.path.join(tmp_path, CLUSTER_SUMS_FILE), np.asarray(sums, dtype=np.float64).reshape(-1, encodings.shape[1]))
+        np.save(os.path.join(tmp_path, CLUSTER_COUNTS_FILE), np.asarray(counts, dtype=np.int64))
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    install_gallery(tmp_path, path)
+    return meta
+
+
+def install_gallery(src_path: str, path: str):
+    """Move a complete gallery directory to `path`, replacing any gallery already there.
+
+    The old directory is renamed away before being deleted, so processes that still have
+    it memory mapped keep working.
+    """
+    load_gallery(src_path)
+    load_clusters(src_path)
+    old_path = f"{os.path.abspath(path)}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(src_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_meta(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != GALLERY_FORMAT:
+        raise ValueError(f"{path} is not a face gallery")
+    if meta.get('version') != GALLERY_VERSION:
+        raise ValueError(f"Unsupported gallery version {meta.get('version')} (expected {GALLERY_VERSION})")
+    # Galleries from before the encoder was recorded may hold 5-point encodings from FaceRecognitionProcessor
+    if 'encoder' not in meta:
+        logger.warning(f"Gallery at {path} does not record its encoder; it may mix with {ENCODER_MODEL} encodings")
+    elif meta['encoder'] != ENCODER_MODEL:
+        raise ValueError(f"Gallery at {path} was encoded from {meta['encoder']} shapes, not {ENCODER_MODEL}; re-encode it")
+    return meta
+
+
+def load_gallery(path: str, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Return (encodings, sq_norms, person_ids, meta) for a gallery directory.
+
+    With mmap the arrays are read-only views of the files: mapping them reads nothing up
+    front, and processes that open the same gallery share its pages.
+    """
+    meta = read_meta(path)
+    mmap_mode = 'r' if mmap else None
+    encodings = np.load(os.path.join(path, ENCODINGS_FILE), mmap_mode=mmap_mode)
+    sq_norms = np.load(os.path.join(path, SQ_NORMS_FILE), mmap_mode=mmap_mode)
+    person_ids = np.load(os.path.join(path, PERSON_IDS_FILE), mmap_mode=mmap_mode)
+    if encodings.shape != (meta['count'], meta['dim']) or len(person_ids) != meta['count'] or len(sq_norms) != meta['count']:
+        raise ValueError(f"Gallery at {path} does not match its meta.json")
+    return encodings, sq_norms, person_ids, meta
+
+
+def load_clusters(path: str) -> Optional[Tuple[List[str], np.ndarray, np.ndarray]]:
+    """Return the (labels, sums, counts) saved with a gallery, or None if it was saved without them"""
+    meta = read_meta(path)
+    if 'clusters' not in meta:
+        return None
+    labels = np.load(os.path.join(path, CLUSTER_LABELS_FILE)).tolist()
+    sums = np.load(os.path.join(path, CLUSTER_SUMS_FILE))
+    counts = np.load(os.path.join(path, CLUSTER_COUNTS_FILE))
+    k = meta['clusters']
+    if len(labels) != k or sums.shape != (k, meta['dim']) or len(counts) != k or int(counts.sum()) != meta['count']:
+        raise ValueError(f"Clusters at {path} do not match its meta.json")
+    return labels, sums, counts
+
+
+def save_face_gallery(path: str, gallery: FaceGallery, metadata: Optional[Dict[str, Any]] = None,
+                      clusters: Optional[Tuple[Sequence[Any], np.ndarray, np.ndarray]] = None) -> Dict[str, Any]:
+    """Save a FaceGallery, and optionally its clusterer's state; entry IDs are renumbered densely in the saved copy"""
+    encodings, person_ids = gallery.to_arrays()
+    return save_gallery(path, encodings.reshape(-1, gallery.dim), person_ids, metadata, clusters)
+
+
+def load_face_gallery(path: str, mmap: bool = True, index: Optional[FaceIndex] = None) -> Tuple[FaceGallery, Dict[str, Any]]:
+    """Load a saved gallery; with the default exact index and mmap the encodings are not copied"""
+    encodings, sq_norms, person_ids, meta = load_gallery(path, mmap)
+    return FaceGallery.from_arrays(encodings, person_ids, sq_norms, index=index), meta
@@ -0,0 +1,420 @@
+import time
+import logging
+import numpy as np
+from collections import Counter
+from typing import List, Tuple, Dict, Any, Optional, Callable, Sequence
+from face_gallery import FaceGallery
+from face_index import FaceIndex, BruteForceIndex
+from encoding_cache import hash_array
+
+logger = logging.getLogger(__name__)
+
+# Identities whose centroids are closer than this fraction of the tolerance are merged
+MERGE_RATIO = 0.75
+# Smallest identity the split pass will try to divide
+MIN_SPLIT_SIZE = 4
+
+
+def face_key(encoding: np.ndarray) -> str:
+    """Content key of an encoding; consolidation visits faces in key order, never ingest order"""
+    return hash_array(np.asarray(encoding, dtype=np.float32).ravel())
+
+
+def _distances(queries: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Euclidean distances between every query and centroid, shape (m, k)"""
+    sq = np.einsum('ij,ij->i', queries, queries)[:, None] + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    sq -= 2.0 * (queries @ centroids.T)
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq, out=sq)
+
+
+def _means(encodings: np.ndarray, assignment: np.ndarray, k: int) -> np.ndarray:
+    """Centroid of each of k clusters (every cluster must be non-empty)"""
+    counts = np.bincount(assignment, minlength=k)
+    order = np.argsort(assignment, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sums = np.add.reduceat(encodings[order].astype(np.float64), starts, axis=0)
+    return (sums / counts[:, None]).astype(np.float32)
+
+
+def _leader_clusters(encodings: np.ndarray, tolerance: float, block: int = 1024) -> np.ndarray:
+    """Sequential leader clustering of encodings in the given order, returning a cluster per row.
+
+    Each block is matched against the existing clusters with one matrix product; rows
+    that match nothing start clusters, checked one by one against clusters started
+    earlier in the same block. Existing centroids are updated once per block.
+    """
+    n, dim = encodings.shape
+    assignment = np.empty(n, dtype=np.int64)
+    sums = np.zeros((max(n, 1), dim), dtype=np.float64)
+    counts = np.zeros(max(n, 1), dtype=np.int64)
+    k = 0
+    for start in range(0, n, block):
+        chunk = encodings[start:start + block]
+        block_start = k
+        if k:
+            distances = _distances(chunk, (sums[:k] / counts[:k, None]).astype(np.float32))
+            nearest = np.argmin(distances, axis=1)
+            nearest_distances = distances[np.arange(len(chunk)), nearest]
+        else:
+            nearest = np.full(len(chunk), -1, dtype=np.int64)
+            nearest_distances = np.full(len(chunk), np.inf, dtype=np.float32)
+
+        for i, encoding in enumerate(chunk):
+            cluster, distance = nearest[i], nearest_distances[i]
+            if k > block_start:
+                new_distances = np.linalg.norm(sums[block_start:k] / counts[block_start:k, None] - encoding, axis=1)
+                j = int(np.argmin(new_distances))
+                if new_distances[j] < distance:
+                    cluster, distance = block_start + j, new_distances[j]
+            if distance > tolerance:
+                cluster = k
+                k += 1
+            assignment[start + i] = cluster
+            sums[cluster] += encoding
+            counts[cluster] += 1
+    return assignment
+
+
+def canonical_clusters(assignment: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Renumber clusters by the first row they appear in, dropping empty ones"""
+    _, first, inverse = np.unique(assignment, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[inverse], len(first)
+
+
+class IdentityClusterer:
+    """Online identity assignment over per-person centroids, with a periodic merge/split pass.
+
+    Every face is kept in `gallery` under its person's label. `assign` compares a face with
+    one running-mean centroid per person (O(k) per face) and either joins the closest
+    person or starts a new one. Online results depend on arrival order, so `consolidate`
+    re-clusters every stored face visiting them in content-key order: the people it
+    produces are the same whatever order, or however many workers, the faces came in.
+    """
+
+    def __init__(self, gallery: Optional[FaceGallery] = None, tolerance: float = 0.6,
+                 merge_threshold: Optional[float] = None, new_label: Optional[Callable[[], Any]] = None,
+                 index_factory: Optional[Callable[[], FaceIndex]] = None, max_iterations: int = 10,
+                 clusters: Optional[Tuple[Sequence[Any], np.ndarray, np.ndarray]] = None):
+        self.gallery = gallery if gallery is not None else FaceGallery()
+        self.dim = self.gallery.dim
+        self.tolerance = tolerance
+        self.merge_threshold = merge_threshold if merge_threshold is not None else MERGE_RATIO * tolerance
+        self.new_label = new_label or self._next_label
+        self.index_factory = index_factory or (lambda: BruteForceIndex(self.dim))
+        self.max_iterations = max_iterations
+        self.stats: Dict[str, Any] = {}
+        self._label_count = 0
+        if clusters is not None:
+            self.restore(*clusters)
+        else:
+            self.rebuild()
+
+    def _next_label(self) -> str:
+        # Skip labels already used by a loaded gallery
+        while True:
+            self._label_count += 1
+            label = f"Person_{self._label_count}"
+            if label not in self._cluster_of:
+                return label
+
+    def rebuild(self):
+        """Recompute every centroid from the gallery, e.g. after it was loaded or replaced"""
+        self._index = self.index_factory()
+        self._labels: List[Any] = []
+        self._cluster_of: Dict[Any, int] = {}
+        self._sums = np.zeros((16, self.dim), dtype=np.float64)
+        self._counts = np.zeros(16, dtype=np.int64)
+
+        entry_ids, encodings = self.gallery.index.vectors()
+        if not len(entry_ids):
+            return
+        labels = self.gallery.person_ids[entry_ids]
+        clusters = np.array([self._cluster(label) for label in labels], dtype=np.int64)
+        self._counts[:len(self._labels)] = np.bincount(clusters, minlength=len(self._labels))
+        self._sums[:len(self._labels)] = _means(encodings, clusters, len(self._labels)) * self._counts[:len(self._labels), None]
+        self._index.add(self.centroids(), range(len(self._labels)))
+
+    def cluster_state(self) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+        """(labels, float64 encoding sums, face counts) of every non-empty person, for saving with the gallery"""
+        k = len(self._labels)
+        kept = np.flatnonzero(self._counts[:k] > 0)
+        return [self._labels[cluster] for cluster in kept], self._sums[kept], self._counts[kept]
+
+    def restore(self, labels: Sequence[Any], sums: np.ndarray, counts: np.ndarray):
+        """Take the per-person state saved by cluster_state instead of rebuilding it from every face.
+
+        O(people) rather than O(faces); the caller guarantees it matches the gallery.
+        """
+        k = len(labels)
+        self._index = self.index_factory()
+        self._labels = list(labels)
+        self._cluster_of = {label: cluster for cluster, label in enumerate(self._labels)}
+        self._sums = np.zeros((max(16, k), self.dim), dtype=np.float64)
+        self._counts = np.zeros(max(16, k), dtype=np.int64)
+        self._sums[:k] = sums
+        self._counts[:k] = counts
+        if k:
+            self._index.add(self.centroids(), range(k))
+
+    def __len__(self) -> int:
+        """Number of people"""
+        return len(self._index)
+
+    def __contains__(self, label: Any) -> bool:
+        return label in self._cluster_of
+
+    def _cluster(self, label: Any) -> int:
+        """Cluster number for a label, creating an empty cluster for new labels"""
+        cluster = self._cluster_of.get(label)
+        if cluster is None:
+            cluster = len(self._labels)
+            if cluster >= len(self._counts):
+                self._sums = np.vstack([self._sums, np.zeros_like(self._sums)])
+                self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+            self._labels.append(label)
+            self._cluster_of[label] = cluster
+        return cluster
+
+    def centroids(self) -> np.ndarray:
+        """Centroid of every cluster, in cluster order"""
+        k = len(self._labels)
+        counts = np.maximum(self._counts[:k], 1)
+        return (self._sums[:k] / counts[:, None]).astype(np.float32)
+
+    def add_member(self, encoding: np.ndarray, label: Any) -> int:
+        """Store a face under a known label (e.g. one assigned by another replica) and return its entry ID"""
+        encoding = np.asarray(encoding, dtype=np.float32).ravel()
+        cluster = self._cluster(label)
+        entry_id = self.gallery.add(encoding, label)
+        self._sums[cluster] += encoding
+        self._counts[cluster] += 1
+        self._index.remove([cluster])
+        self._index.add(self._sums[cluster] / self._counts[cluster], [cluster])
+        return entry_id
+
+    def remove_faces(self, keys: List[str]) -> int:
+        """Drop one stored face per key (see face_key) and recompute the centroids, returning how many were removed"""
+        wanted = Counter(keys)
+        if not wanted:
+            return 0
+        entry_ids, encodings = self.gallery.index.vectors()
+        removed = []
+        for entry_id, encoding in zip(entry_ids, encodings):
+            key = face_key(encoding)
+            if wanted[key] > 0:
+                wanted[key] -= 1
+                removed.append(int(entry_id))
+        if removed:
+            self.gallery.remove(removed)
+            self.rebuild()
+        return len(removed)
+
+    def move_faces(self, labels: Dict[str, Any]) -> int:
+        """Move stored faces to new labels by key (see face_key) and recompute the centroids, returning how many moved"""
+        if not labels:
+            return 0
+        entry_ids, encodings = self.gallery.index.vectors()
+        person_ids = self.gallery.person_ids
+        moved = 0
+        for entry_id, encoding in zip(entry_ids, encodings):
+            label = labels.get(face_key(encoding))
+            if label is not None and person_ids[entry_id] != label:
+                self.gallery.set_person(int(entry_id), label)
+                moved += 1
+        if moved:
+            self.rebuild()
+        return moved
+
+    def assign(self, encodings: List[np.ndarray]) -> List[Tuple[Any, Optional[float]]]:
+        """Label each face with its closest person and add it to that person's centroid.
+
+        Faces farther than the tolerance from every centroid start a new person. Returns
+        (label, distance to the centroid) per face, with None as the distance for new people.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(self._index):
+            distances, clusters = self._index.search(queries, k=1)
+            distances, clusters = distances[:, 0], clusters[:, 0]
+        else:
+            distances = np.full(len(queries), np.inf, dtype=np.float32)
+            clusters = np.full(len(queries), -1, dtype=np.int64)
+
+        new_rows, new_clusters = [], []
+        identities = []
+        for i, query in enumerate(queries):
+            cluster, distance = clusters[i], distances[i]
+            # People started earlier in this same batch are not part of the search above
+            if new_rows:
+                new_distances = np.linalg.norm(queries[new_rows] - query, axis=1)
+                nearest = int(np.argmin(new_distances))
+                if new_distances[nearest] < distance:
+                    cluster, distance = new_clusters[nearest], new_distances[nearest]
+
+            if cluster >= 0 and distance <= self.tolerance:
+                label = self._labels[cluster]
+                identities.append((label, float(distance)))
+            else:
+                label = self.new_label()
+                new_rows.append(i)
+                new_clusters.append(self._cluster(label))
+                identities.append((label, None))
+            self.add_member(query, label)
+        return identities
+
+    def match(self, encodings: List[np.ndarray]) -> List[Tuple[Optional[Any], float]]:
+        """Closest person and centroid distance for each face, without adding anything.
+
+        Faces farther than the tolerance from every centroid get None as their label.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if not len(self._index) or not len(queries):
+            return [(None, float('inf')) for _ in range(len(queries))]
+        distances, clusters = self._index.search(queries, k=1)
+        return [(self._labels[cluster] if cluster >= 0 and distance <= self.tolerance else None, float(distance))
+                for cluster, distance in zip(clusters[:, 0], distances[:, 0])]
+
+    def consolidate(self) -> Dict[str, Any]:
+        """Re-cluster every stored face and relabel the gallery, returning {face_key: new label} for moved faces.
+
+        Faces are visited in content-key order: leader clustering seeds the people, then
+        up to max_iterations passes reassign every face to its nearest centroid (faces
+        beyond the tolerance seed new people), split people whose two halves are more than
+        the tolerance apart and merge people whose centroids are within merge_threshold.
+        Each resulting person keeps the old label most of its faces had; the rest get new
+        labels in key order.
+        """
+        start = time.perf_counter()
+        entry_ids, encodings, keys = self.members()
+        if not len(entry_ids):
+            return {}
+
+        assignment, k = canonical_clusters(_leader_clusters(encodings, self.tolerance))
+        iterations = 0
+        for iterations in range(1, self.max_iterations + 1):
+            previous = assignment
+            assignment, k = self._refine(encodings, assignment, k)
+            if np.array_equal(assignment, previous):
+                break
+        relabelled = self.relabel(entry_ids, keys, assignment, k)
+
+        self.stats = {
+            'faces': len(entry_ids),
+            'people': k,
+            'iterations': iterations,
+            'relabelled': len(relabelled),
+            'seconds': time.perf_counter() - start
+        }
+        logger.info(f"Consolidated {len(entry_ids)} faces into {k} people in {iterations} passes, "
+                    f"{len(relabelled)} faces relabelled")
+        return relabelled
+
+    def members(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(entry_ids, float32 encodings, face keys) of every stored face, sorted by key"""
+        entry_ids, encodings = self.gallery.index.vectors()
+        keys = np.array([face_key(encoding) for encoding in encodings], dtype=str)
+        order = np.argsort(keys, kind='stable')
+        return entry_ids[order], np.ascontiguousarray(encodings[order], dtype=np.float32), keys[order]
+
+    def relabel(self, entry_ids: np.ndarray, keys: np.ndarray, assignment: np.ndarray, k: int) -> Dict[str, Any]:
+        """Apply a clustering of stored faces (k clusters numbered canonically), returning {face_key: new label} for moved faces"""
+        old_labels = self.gallery.person_ids[entry_ids]
+        labels = self._inherit_labels(assignment, k, old_labels)
+        relabelled = {}
+        for entry_id, key, old_label, cluster in zip(entry_ids, keys, old_labels, assignment):
+            if labels[cluster] != old_label:
+                self.gallery.set_person(int(entry_id), labels[cluster])
+                relabelled[str(key)] = labels[cluster]
+        self.rebuild()
+        return relabelled
+
+    def _refine(self, encodings: np.ndarray, assignment: np.ndarray, k: int, block: int = 4096) -> Tuple[np.ndarray, int]:
+        """One reassign / split / merge pass over clusters numbered canonically"""
+        centroids = _means(encodings, assignment, k)
+        counts = np.bincount(assignment, minlength=k)
+        sums = centroids.astype(np.float64) * counts[:, None]
+
+        # Reassign every face to its nearest centroid, measuring its own cluster without it so
+        # stray singletons can rejoin a person; faces that fit nowhere seed new clusters
+        previous = assignment
+        assignment = assignment.copy()
+        outliers = []
+        for start in range(0, len(encodings), block):
+            chunk = encodings[start:start + block]
+            own = previous[start:start + block]
+            distances = _distances(chunk, centroids)
+            others = np.maximum(counts[own] - 1, 1)[:, None]
+            own_distances = np.linalg.norm((sums[own] - chunk) / others - chunk, axis=1)
+            distances[np.arange(len(chunk)), own] = np.where(counts[own] > 1, own_distances, np.inf)
+            nearest = np.argmin(distances, axis=1)
+            fits = distances[np.arange(len(nearest)), nearest] <= self.tolerance
+            assignment[start:start + block] = nearest
+            outliers.extend(start + np.flatnonzero(~fits))
+        if outliers:
+            outliers = np.asarray(outliers, dtype=np.int64)
+            assignment[outliers] = k + _leader_clusters(encodings[outliers], self.tolerance)
+        assignment, k = canonical_clusters(assignment)
+
+        # Split clusters that hold two well separated groups
+        next_cluster = k
+        for cluster in range(k):
+            rows = np.flatnonzero(assignment == cluster)
+            if len(rows) < MIN_SPLIT_SIZE:
+                continue
+            halves = self._split(encodings[rows])
+            if halves is not None:
+                assignment[rows[halves]] = next_cluster
+                next_cluster += 1
+        k = next_cluster
+
+        # Merge clusters whose centroids are close, lowest cluster number wins
+        centroids = _means(encodings, assignment, k)
+        parent = np.arange(k)
+        def root(cluster):
+            while parent[cluster] != cluster:
+                cluster = parent[cluster]
+            return cluster
+        for start in range(0, k, block):
+            distances = _distances(centroids[start:start + block], centroids)
+            rows, cols = np.nonzero(distances < self.merge_threshold)
+            for a, b in zip(rows + start, cols):
+                if a < b:
+                    ra, rb = root(a), root(b)
+                    if ra != rb:
+                        parent[max(ra, rb)] = min(ra, rb)
+        roots = np.array([root(cluster) for cluster in range(k)], dtype=np.int64)
+        return canonical_clusters(roots[assignment])
+
+    def _split(self, encodings: np.ndarray, iterations: int = 5) -> Optional[np.ndarray]:
+        """Boolean mask of the second half if a cluster splits into two groups further apart than the tolerance"""
+        centroid = encodings.mean(axis=0)
+        a = encodings[np.argmax(np.linalg.norm(encodings - centroid, axis=1))]
+        b = encodings[np.argmax(np.linalg.norm(encodings - a, axis=1))]
+        second = None
+        for _ in range(iterations):
+            mask = np.linalg.norm(encodings - b, axis=1) < np.linalg.norm(encodings - a, axis=1)
+            if second is not None and np.array_equal(mask, second):
+                break
+            second = mask
+            if second.all() or not second.any():
+                return None
+            a, b = encodings[~second].mean(axis=0), encodings[second].mean(axis=0)
+        if np.linalg.norm(a - b) <= self.tolerance:
+            return None
+        return second
+
+    def _inherit_labels(self, assignment: np.ndarray, k: int, old_labels: np.ndarray) -> List[Any]:
+        """Give each cluster the old label most of its faces had, each old label going to one cluster"""
+        overlap = Counter((int(cluster), label) for cluster, label in zip(assignment, old_labels) if label is not None)
+        labels: List[Any] = [None] * k
+        used = set()
+        for (cluster, label), _ in sorted(overlap.items(), key=lambda item: (-item[1], item[0][0], str(item[0][1]))):
+            if labels[cluster] is None and label not in used:
+                labels[cluster] = label
+                used.add(label)
+        for cluster in range(k):
+            if labels[cluster] is None:
+                labels[cluster] = self.new_label()
+        return labels
@@ -0,0 +1,185 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+import numpy as np
+from typing import List, Tuple, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    filename TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    finished_at REAL,
+    cursor INTEGER,
+    owner TEXT,
+    lease_until REAL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, job_id, seq);
+CREATE INDEX IF NOT EXISTS job_items_cursor ON job_items (job_id, cursor);
+"""
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class JobQueue:
+    """Persistent SQLite queue of batch ingestion jobs.
+
+    A job is a list of uploaded files; each file is an item that moves from pending to
+    running to done/failed. Payloads are dropped once an item finishes.
+
+    Several replicas may share one database. A claimed item is leased to its `owner` for
+    `lease_seconds`; an item whose lease ran out (its replica died) can be claimed again
+    by any replica. On startup, only items still running under this queue's own owner,
+    i.e. left behind by its previous incarnation, are put back to pending at once.
+    """
+
+    def __init__(self, db_path: str = "jobs.db", owner: Optional[str] = None, lease_seconds: float = 300.0):
+        self.db_path = db_path
+        # Stable across restarts of the same replica, distinct between replicas
+        self.owner = owner or socket.gethostname()
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Databases created before leases were added
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")}
+        for column, kind in (('owner', 'TEXT'), ('lease_until', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE job_items ADD COLUMN {column} {kind}")
+        requeued = self._conn.execute(
+            "UPDATE job_items SET status = 'pending', owner = NULL, lease_until = NULL "
+            "WHERE status = 'running' AND owner = ?", (self.owner,)).rowcount
+        if requeued:
+            logger.info(f"Requeued {requeued} job items interrupted on {self.owner}")
+
+    def create_job(self, files: List[Tuple[str, bytes]]) -> str:
+        """Queue a batch of (filename, contents) and return its job id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT INTO jobs (id, total, created_at) VALUES (?, ?, ?)",
+                               (job_id, len(files), time.time()))
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, seq, filename, payload) VALUES (?, ?, ?, ?)",
+                [(job_id, seq, filename, sqlite3.Binary(contents)) for seq, (filename, contents) in enumerate(files)])
+            self._conn.execute("COMMIT")
+        return job_id
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Lease the oldest pending (or abandoned) item to this owner and return it, or None if there is none"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two replicas cannot claim the same item
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT i.job_id, i.seq, i.filename, i.payload FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                    "WHERE i.status = 'pending' OR (i.status = 'running' AND i.lease_until < ?) "
+                    "ORDER BY j.created_at, i.seq LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE job_items SET status = 'running', owner = ?, lease_until = ? WHERE job_id = ? AND seq = ?",
+                        (self.owner, now + self.lease_seconds, row[0], row[1]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {'job_id': row[0], 'seq': row[1], 'filename': row[2], 'payload': bytes(row[3])}
+
+    def release(self, job_id: str, seq: int):
+        """Put a claimed item back in the queue, e.g. when the processing pool is saturated"""
+        with self._lock:
+            self._conn.execute("UPDATE job_items SET status = 'pending', owner = NULL, lease_until = NULL "
+                               "WHERE job_id = ? AND seq = ?", (job_id, seq))
+
+    def complete(self, job_id: str, seq: int, result: Any):
+        self._finish(job_id, seq, 'done', json.dumps(result, default=_json_default), None)
+
+    def fail(self, job_id: str, seq: int, error: str):
+        self._finish(job_id, seq, 'failed', None, error)
+
+    def _finish(self, job_id: str, seq: int, status: str, result: Optional[str], error: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ?, "
+                "cursor = (SELECT COALESCE(MAX(cursor), 0) + 1 FROM job_items WHERE job_id = ?) "
+                "WHERE job_id = ? AND seq = ?", (status, result, error, time.time(), job_id, job_id, seq))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress counts for a job, or None if it does not exist"""
+        with self._lock:
+            job = self._conn.execute("SELECT total, created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+
+        total = job[0]
+        finished = counts.get('done', 0) + counts.get('failed', 0)
+        if finished == total:
+            status = 'completed'
+        elif finished or counts.get('running'):
+            status = 'running'
+        else:
+            status = 'queued'
+        return {
+            'job_id': job_id,
+            'status': status,
+            'total': total,
+            'pending': counts.get('pending', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'created_at': job[1]
+        }
+
+    def get_results(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """Items of a job that finished after cursor `after`, in the order they finished.
+
+        Pass the last cursor seen to fetch only new results.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cursor, seq, filename, status, result, error FROM job_items "
+                "WHERE job_id = ? AND cursor > ? ORDER BY cursor",
+                (job_id, after)).fetchall()
+        return [
+            {
+                'cursor': cursor,
+                'seq': seq,
+                'filename': filename,
+                'status': status,
+                'results': json.loads(result) if result is not None else None,
+                'error': error
+            }
+            for cursor, seq, filename, status, result, error in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
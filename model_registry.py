@@ -0,0 +1,109 @@
+import importlib
+import threading
+import time
+import logging
+from typing import Callable, Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _load_haar_frontalface():
+    import cv2
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+
+def _load_deepface():
+    return importlib.import_module('deepface').DeepFace
+
+
+def _load_deepface_detector(backend: str):
+    """Build a DeepFace detector by running it once on a blank frame"""
+    import numpy as np
+    deepface = registry.get('deepface')
+    deepface.extract_faces(img_path=np.zeros((64, 64, 3), dtype=np.uint8), target_size=(224, 224),
+                           detector_backend=backend, enforce_detection=False)
+    return backend
+
+
+def _load_face_recognition():
+    # Importing face_recognition loads the dlib HOG and CNN detectors, shape predictors and encoder
+    return importlib.import_module('face_recognition')
+
+
+def _load_face_visualizer():
+    return importlib.import_module('face_visualizer').FaceVisualizer()
+
+
+class ModelRegistry:
+    """Heavy models and backends, imported and loaded on first use.
+
+    Each model is registered under a name with a loader; `get` loads it once (thread-safe)
+    and records how long that took, and `preload` warms a set of models up front, e.g. at
+    server startup, so the first request does not pay for it.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        self._loaders[name] = loader
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        """Return a model, loading it on first use"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                loader = self._loader(name)
+                start = time.perf_counter()
+                self._models[name] = loader()
+                self._load_seconds[name] = time.perf_counter() - start
+                logger.info(f"Loaded {name} in {self._load_seconds[name]:.2f}s")
+            return self._models[name]
+
+    def _loader(self, name: str) -> Callable[[], Any]:
+        if name in self._loaders:
+            return self._loaders[name]
+        # Parameterised DeepFace detectors, e.g. deepface_detector:retinaface
+        if name.startswith('deepface_detector:'):
+            backend = name.split(':', 1)[1]
+            return lambda: _load_deepface_detector(backend)
+        raise KeyError(f"Unknown model {name!r}; registered: {sorted(self._loaders)}")
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """Load the given models (all registered ones by default) and return their load times"""
+        for name in (names if names is not None else list(self._loaders)):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Failed to preload {name}: {str(e)}")
+        return self.load_times()
+
+    def load_times(self) -> Dict[str, float]:
+        return dict(self._load_seconds)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'loaded': sorted(self._models),
+            'available': sorted(self._loaders),
+            'load_seconds': self.load_times()
+        }
+
+
+registry = ModelRegistry()
+registry.register('haar_frontalface', _load_haar_frontalface)
+registry.register('deepface', _load_deepface)
+registry.register('face_recognition', _load_face_recognition)
+registry.register('face_visualizer', _load_face_visualizer)
+
+
+def registry_report() -> Dict[str, Any]:
+    """The default registry's report; a module-level function so worker pools can call it"""
+    return registry.report()
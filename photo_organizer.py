@@ -0,0 +1,195 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import time
+import logging
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Dict, Any, Optional
+from face_stream import record_to_json, read_jsonl
+
+logger = logging.getLogger(__name__)
+
+ORGANIZER_STATE = '.organizer.json'
+STAGING_DIR = '.staging'
+# How each organized photo is materialised; "manifest" writes only photos.jsonl and metadata.json
+ORGANIZE_STRATEGIES = ('hardlink', 'reflink', 'symlink', 'copy', 'manifest')
+PHOTO_FIELDS = ('image_path', 'face_location', 'timestamp', 'face_distance', 'quality', 'thumbnail', 'preview')
+# Staging files kept open at once while streaming; beyond this the least recently written is closed
+MAX_OPEN_STAGING_FILES = 256
+
+# Linux ioctl that clones a file's extents copy-on-write (btrfs, XFS, ...)
+FICLONE = 0x40049409
+_LINK_FALLBACK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                         errno.ENOTTY, errno.ENOSYS)
+
+
+def reflink(src: str, dst: str):
+    """Copy-on-write clone of src at dst, raising OSError where the filesystem cannot do it"""
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def place_file(src: str, dst: str, strategy: str) -> str:
+    """Put src at dst using the strategy, falling back to a copy where links are impossible; returns the method used"""
+    if strategy == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in _LINK_FALLBACK_ERRORS:
+                raise
+    elif strategy == 'reflink':
+        try:
+            reflink(src, dst)
+            return 'reflink'
+        except (OSError, ImportError) as e:
+            if isinstance(e, OSError) and e.errno not in _LINK_FALLBACK_ERRORS:
+                raise
+    elif strategy == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+class PhotoOrganizer:
+    """Builds one folder per person from a stream of face records.
+
+    Photos are placed with hard links, reflinks or symlinks instead of copies where the
+    filesystem allows (copies are the fallback), or not at all with the "manifest"
+    strategy. Regeneration is incremental: each person's photo list is digested as the
+    stream goes by, and only people whose digest changed since the last run are rebuilt,
+    in parallel. Memory holds per-person counters only; the lists are staged on disk.
+    """
+
+    def __init__(self, output_base_dir: str = 'organized_faces', strategy: str = 'hardlink', workers: int = 8):
+        if strategy not in ORGANIZE_STRATEGIES:
+            raise ValueError(f"Unknown organize strategy: {strategy}")
+        self.output_base_dir = output_base_dir
+        self.strategy = strategy
+        self.workers = workers
+
+    def _state_path(self) -> str:
+        return os.path.join(self.output_base_dir, ORGANIZER_STATE)
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def organize(self, records: Iterable[Dict[str, Any]], relabelled: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Organize photos by person and return a report of what was rebuilt.
+
+        `relabelled` ({face_key: person_id}) maps streamed IDs to consolidated people.
+        """
+        start = time.perf_counter()
+        os.makedirs(self.output_base_dir, exist_ok=True)
+        staging_dir = os.path.join(self.output_base_dir, STAGING_DIR)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+
+        digests: Dict[str, Any] = {}
+        counts = Counter()
+        distance_totals = defaultdict(lambda: [0.0, 0])
+        staging_files = OrderedDict()
+        try:
+            for record in records:
+                person_id = str(record['person_id'])
+                if relabelled:
+                    person_id = str(relabelled.get(record.get('face_key'), person_id))
+                photo = {key: record[key] for key in PHOTO_FIELDS if key in record}
+                staging_file = staging_files.pop(person_id, None)
+                if staging_file is None:
+                    if len(staging_files) >= MAX_OPEN_STAGING_FILES:
+                        staging_files.popitem(last=False)[1].close()
+                    staging_file = open(os.path.join(staging_dir, f"{person_id}.jsonl"), 'a')
+                staging_files[person_id] = staging_file
+                staging_file.write(record_to_json(photo) + '\n')
+
+                # The digest covers only what decides the folder's files: the photo order, face
+                # boxes and each source file's size and mtime. Timestamps differ on every run
+                digest = digests.get(person_id)
+                if digest is None:
+                    digest = digests[person_id] = hashlib.sha256()
+                stat = os.stat(record['image_path'])
+                location = [int(v) for v in record['face_location']] if record.get('face_location') is not None else None
+                digest.update(json.dumps([record['image_path'], location, stat.st_size, stat.st_mtime_ns]).encode() + b'\n')
+
+                counts[person_id] += 1
+                if record.get('face_distance') is not None:
+                    distance_totals[person_id][0] += record['face_distance']
+                    distance_totals[person_id][1] += 1
+        finally:
+            for staging_file in staging_files.values():
+                staging_file.close()
+
+        previous = self._load_state()
+        same_strategy = previous.get('strategy') == self.strategy
+        old_digests = previous.get('people', {}) if same_strategy else {}
+        new_digests = {person_id: digest.hexdigest() for person_id, digest in digests.items()}
+        changed = [person_id for person_id, digest in new_digests.items()
+                   if old_digests.get(person_id) != digest or not os.path.isdir(os.path.join(self.output_base_dir, person_id))]
+        removed = [person_id for person_id in previous.get('people', {}) if person_id not in new_digests]
+
+        for person_id in removed:
+            shutil.rmtree(os.path.join(self.output_base_dir, person_id), ignore_errors=True)
+
+        methods = Counter()
+        # Each person is rebuilt by one worker; copies (the fallback) are where this pays off
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            summaries = {person_id: {'total_photos': counts[person_id],
+                                     'average_face_distance': (distance_totals[person_id][0] / distance_totals[person_id][1]
+                                                               if distance_totals[person_id][1] else None)}
+                         for person_id in changed}
+            for result in pool.map(lambda person_id: self._build_person(person_id, staging_dir, summaries[person_id]), changed):
+                methods.update(result)
+
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        with open(self._state_path(), 'w') as f:
+            json.dump({'strategy': self.strategy, 'people': new_digests}, f)
+
+        report = {
+            'strategy': self.strategy,
+            'people': len(new_digests),
+            'rebuilt': len(changed),
+            'unchanged': len(new_digests) - len(changed),
+            'removed': len(removed),
+            'files': dict(methods),
+            'seconds': time.perf_counter() - start
+        }
+        logger.info(f"Organized {report['people']} people into {self.output_base_dir}: {report['rebuilt']} rebuilt, "
+                    f"{report['unchanged']} unchanged, {report['removed']} removed, files {report['files']}")
+        return report
+
+    def _build_person(self, person_id: str, staging_dir: str, summary: Dict[str, Any]) -> Counter:
+        """Recreate one person's folder from its staged photo list"""
+        person_dir = os.path.join(self.output_base_dir, person_id)
+        shutil.rmtree(person_dir, ignore_errors=True)
+        os.makedirs(person_dir)
+        staged = os.path.join(staging_dir, f"{person_id}.jsonl")
+
+        methods = Counter()
+        if self.strategy != 'manifest':
+            for idx, photo in enumerate(read_jsonl(staged)):
+                src_path = photo['image_path']
+                ext = os.path.splitext(src_path)[1]
+                dst_path = os.path.join(person_dir, f"{person_id}_photo_{idx}{ext}")
+                methods[place_file(src_path, dst_path, self.strategy)] += 1
+
+        shutil.move(staged, os.path.join(person_dir, 'photos.jsonl'))
+        with open(os.path.join(person_dir, 'metadata.json'), 'w') as f:
+            json.dump({'person_id': person_id, 'photos_file': 'photos.jsonl', 'strategy': self.strategy, **summary},
+                      f, indent=2)
+        return methods
@@ -0,0 +1,68 @@
+import time
+import numpy as np
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Dict, Any, List
+
+
+class PipelineStats:
+    """Wall-clock time and item counts per pipeline stage"""
+
+    def __init__(self, keep_samples: bool = False):
+        self.keep_samples = keep_samples
+        self.stages: Dict[str, Dict[str, Any]] = OrderedDict()
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'items': 0, 'calls': 0, 'samples': []}
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1):
+        """Time a block of work that handled `items` items"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def add(self, name: str, seconds: float, items: int = 1):
+        stage = self._stage(name)
+        stage['seconds'] += seconds
+        stage['items'] += items
+        stage['calls'] += 1
+        if self.keep_samples:
+            stage['samples'].append(seconds)
+
+    def merge(self, other: 'PipelineStats'):
+        for name, data in other.stages.items():
+            stage = self._stage(name)
+            stage['seconds'] += data['seconds']
+            stage['items'] += data['items']
+            stage['calls'] += data['calls']
+            stage['samples'].extend(data['samples'])
+
+    def samples(self, name: str) -> List[float]:
+        return list(self._stage(name)['samples'])
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage totals and throughput, plus per-call latency percentiles when samples are kept"""
+        report = {}
+        for name, data in self.stages.items():
+            report[name] = {
+                'seconds': data['seconds'],
+                'items': data['items'],
+                'calls': data['calls'],
+                'items_per_second': data['items'] / data['seconds'] if data['seconds'] else 0.0
+            }
+            if data['samples']:
+                p50, p90, p99 = np.percentile(data['samples'], [50, 90, 99])
+                report[name].update({'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+                                     'max': float(max(data['samples']))})
+        return report
+
+    def format_report(self) -> str:
+        lines = []
+        for name, data in self.report().items():
+            lines.append(f"{name:<12} {data['items']:>7} items  {data['seconds']:9.2f}s  {data['items_per_second']:9.1f}/s")
+        return '\n'.join(lines)
@@ -0,0 +1,41 @@
+-- CreateTable
+CREATE TABLE "Person" (
+    "id" TEXT NOT NULL,
+    "userId" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "Person_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE "FaceEmbedding" (
+    "id" TEXT NOT NULL,
+    "photoId" TEXT,
+    "personId" TEXT,
+    "boundingBox" JSONB NOT NULL,
+    "confidence" DOUBLE PRECISION,
+    "embedding" BYTEA NOT NULL,
+    "quality" JSONB,
+    "inGallery" BOOLEAN NOT NULL DEFAULT false,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "FaceEmbedding_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "FaceEmbedding_photoId_idx" ON "FaceEmbedding"("photoId");
+
+-- CreateIndex
+CREATE INDEX "FaceEmbedding_personId_idx" ON "FaceEmbedding"("personId");
+
+-- CreateIndex
+CREATE INDEX "FaceEmbedding_inGallery_createdAt_idx" ON "FaceEmbedding"("inGallery", "createdAt");
+
+-- AddForeignKey
+ALTER TABLE "Person" ADD CONSTRAINT "Person_userId_fkey" FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE SET NULL ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "FaceEmbedding" ADD CONSTRAINT "FaceEmbedding_photoId_fkey" FOREIGN KEY ("photoId") REFERENCES "Photo"("id") ON DELETE SET NULL ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "FaceEmbedding" ADD CONSTRAINT "FaceEmbedding_personId_fkey" FOREIGN KEY ("personId") REFERENCES "Person"("id") ON DELETE SET NULL ON UPDATE CASCADE;
@@ -0,0 +1,11 @@
+-- DropIndex
+DROP INDEX "FaceEmbedding_inGallery_createdAt_idx";
+
+-- AlterTable
+ALTER TABLE "FaceEmbedding" ADD COLUMN     "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Existing faces keep their creation time as the sync cursor
+UPDATE "FaceEmbedding" SET "updatedAt" = "createdAt";
+
+-- CreateIndex
+CREATE INDEX "FaceEmbedding_inGallery_updatedAt_idx" ON "FaceEmbedding"("inGallery", "updatedAt");
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _noop():
+    return None
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class PoolUnavailable(Exception):
+    """The pool has been shut down or a worker process died"""
+
+
+class ProcessingPool:
+    """Bounded executor for CPU-bound work called from asyncio code.
+
+    At most `workers + queue_depth` tasks are admitted at once; further submissions fail
+    fast with PoolSaturated instead of queueing without limit, which lets an API answer
+    429 while the event loop stays free for cheap requests.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None, mode: str = "process",
+                 initializer: Callable = None, initargs: tuple = ()):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth if queue_depth is not None else 2 * self.workers
+        self.mode = mode
+        self._initializer = initializer
+        self._initargs = initargs
+        self._in_flight = 0
+        self._executor = self._create_executor()
+
+    def _create_executor(self):
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, initializer=self._initializer, initargs=self._initargs)
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=self._initializer, initargs=self._initargs)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool and await its result"""
+        if self._executor is None:
+            raise PoolUnavailable("Processing pool is shut down")
+        if self._in_flight >= self.capacity:
+            raise PoolSaturated(f"{self._in_flight} tasks in flight (capacity {self.capacity})")
+
+        executor = self._executor
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM on a huge image); replace the pool once for later requests
+            if self._executor is executor:
+                logger.error(f"Processing pool broke, restarting it: {str(e)}")
+                executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            raise PoolUnavailable("A worker process died") from e
+        finally:
+            self._in_flight -= 1
+
+    async def warm_up(self, fn: Callable = _noop) -> Dict[str, Any]:
+        """Start every worker now, running its initializer, instead of on the first requests.
+
+        Runs `fn` once per worker slot and returns the elapsed time and each call's result.
+        """
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[loop.run_in_executor(self._executor, fn) for _ in range(self.workers)])
+        return {'seconds': time.perf_counter() - start, 'results': results}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'in_flight': self._in_flight
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,268 @@
+import argparse
+import itertools
+import json
+import time
+import logging
+import numpy as np
+from typing import Tuple, Dict, Any, Optional
+from face_index import create_index
+from identity_clustering import IdentityClusterer, canonical_clusters
+
+logger = logging.getLogger(__name__)
+
+RECLUSTER_METHODS = ('chinese_whispers', 'components')
+
+
+def _nearest_per_row(rows: np.ndarray, cols: np.ndarray, distances: np.ndarray, k: int):
+    """Keep the k smallest distances for each row of a sparse candidate list"""
+    order = np.lexsort((cols, distances, rows))
+    rows, cols, distances = rows[order], cols[order], distances[order]
+    starts = np.flatnonzero(np.concatenate([[True], rows[1:] != rows[:-1]]))
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.concatenate([starts, [len(rows)]])))
+    keep = rank < k
+    return rows[keep], cols[keep], distances[keep]
+
+
+def neighbor_graph(encodings: np.ndarray, threshold: float, k: int = 16, index_backend: str = 'exact',
+                   index_options: Optional[Dict[str, Any]] = None, block: int = 512,
+                   column_block: int = 16384) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Edges (rows, cols, distances) from every face to up to k other faces within threshold.
+
+    With the exact backend, distances are computed in block x column_block tiles and each
+    tile's pairs are merged into a running top-k per row, so memory is bounded by the tile
+    and block * k whatever the corpus size or the size of one identity. Other backends
+    (e.g. "ivf") answer k-nearest-neighbour queries from an approximate index instead.
+    Each undirected edge is returned once, with rows < cols.
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    n = len(encodings)
+    sq_norms = np.einsum('ij,ij->i', encodings, encodings)
+
+    index = None
+    if index_backend != 'exact':
+        index = create_index(index_backend, dim=encodings.shape[1], **(index_options or {}))
+        index.add(encodings, range(n))
+
+    rows, cols, dists = [], [], []
+    for start in range(0, n, block):
+        chunk = encodings[start:start + block]
+        if index is not None:
+            best, best_ids = index.search(chunk, k + 1)
+            chunk_rows = np.broadcast_to(np.arange(start, start + len(chunk))[:, None], best_ids.shape)
+            keep = (best_ids >= 0) & (best_ids != chunk_rows) & (best <= threshold)
+            source, target, distance = chunk_rows[keep], best_ids[keep], best[keep]
+        else:
+            # Pairs within the threshold from each tile are merged into a running top-k per row,
+            # so at most block * k candidates are carried between tiles
+            source = target = np.empty(0, dtype=np.int64)
+            sq_distance = np.empty(0, dtype=np.float32)
+            for col_start in range(0, n, column_block):
+                columns = encodings[col_start:col_start + column_block]
+                sq = sq_norms[start:start + block, None] + sq_norms[None, col_start:col_start + column_block]
+                sq -= 2.0 * (chunk @ columns.T)
+                tile_rows, tile_cols = np.nonzero(sq <= threshold * threshold)
+                tile_rows, tile_cols = tile_rows + start, tile_cols + col_start
+                not_self = tile_rows != tile_cols
+                source, target, sq_distance = _nearest_per_row(
+                    np.concatenate([source, tile_rows[not_self]]), np.concatenate([target, tile_cols[not_self]]),
+                    np.concatenate([sq_distance, sq[tile_rows - start, tile_cols - col_start][not_self]]), k)
+            distance = np.sqrt(np.maximum(sq_distance, 0.0))
+
+        rows.append(np.minimum(source, target))
+        cols.append(np.maximum(source, target))
+        dists.append(distance.astype(np.float32))
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows, cols, dists = np.concatenate(rows), np.concatenate(cols), np.concatenate(dists)
+    # A pair found from both ends is kept once
+    _, unique = np.unique(rows * n + cols, return_index=True)
+    return rows[unique], cols[unique], dists[unique]
+
+
+def connected_components(n: int, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Component of every node, by min-label propagation with pointer jumping"""
+    labels = np.arange(n)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, rows, labels[cols])
+        np.minimum.at(labels, cols, labels[rows])
+        # Every label points at a smaller or equal node, so following pointers shortens chains
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def chinese_whispers(n: int, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray,
+                     iterations: int = 20, blocks: int = 16, seed: int = 0) -> np.ndarray:
+    """Chinese whispers clustering: each node repeatedly takes the label with the most edge weight among its neighbours.
+
+    Nodes are visited in a seeded random order, split into `blocks` groups that are each
+    updated together with vectorised numpy, so labels spread almost as in the sequential
+    algorithm without a Python loop per node. Ties go to the smaller label.
+    """
+    labels = np.arange(n)
+    if not len(rows):
+        return labels
+    source = np.concatenate([rows, cols])
+    target = np.concatenate([cols, rows])
+    weights = np.concatenate([weights, weights]).astype(np.float64)
+    rng = np.random.default_rng(seed)
+
+    for _ in range(iterations):
+        block_of = np.empty(n, dtype=np.int64)
+        block_of[rng.permutation(n)] = np.arange(n) * blocks // n
+        order = np.argsort(block_of[source], kind='stable')
+        bounds = np.searchsorted(block_of[source][order], np.arange(blocks + 1))
+        changed = 0
+        for b in range(blocks):
+            edges = order[bounds[b]:bounds[b + 1]]
+            if not len(edges):
+                continue
+            nodes, neighbor_labels = source[edges], labels[target[edges]]
+            pairs, inverse = np.unique(nodes * n + neighbor_labels, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights[edges])
+            pair_nodes, pair_labels = pairs // n, pairs % n
+            # Per node, the highest scoring label, smallest label first on ties
+            best = np.lexsort((pair_labels, -scores, pair_nodes))
+            first = np.concatenate([[True], pair_nodes[best][1:] != pair_nodes[best][:-1]])
+            winners, new_labels = pair_nodes[best][first], pair_labels[best][first]
+            changed += int(np.count_nonzero(labels[winners] != new_labels))
+            labels[winners] = new_labels
+        if not changed:
+            break
+    return labels
+
+
+def recluster(encodings: np.ndarray, method: str = 'chinese_whispers', threshold: float = 0.5, k: int = 16,
+              min_cluster_size: int = 2, index_backend: str = 'exact', index_options: Optional[Dict[str, Any]] = None,
+              iterations: int = 20, seed: int = 0) -> Tuple[np.ndarray, int, Dict[str, Any]]:
+    """Cluster encodings from scratch, returning (assignment, number of clusters, report).
+
+    Clusters are numbered by the first row they appear in. Clusters smaller than
+    min_cluster_size are outliers: they stay separate people, and are counted in the report.
+    """
+    if method not in RECLUSTER_METHODS:
+        raise ValueError(f"Unknown recluster method: {method}")
+    n = len(encodings)
+    stages = {}
+
+    start = time.perf_counter()
+    rows, cols, distances = neighbor_graph(encodings, threshold, k, index_backend, index_options)
+    stages['graph'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if method == 'components':
+        labels = connected_components(n, rows, cols)
+    else:
+        # Closer neighbours pull harder
+        labels = chinese_whispers(n, rows, cols, 1.0 - distances / (threshold + 1e-6), iterations, seed=seed)
+    assignment, clusters = canonical_clusters(labels) if n else (np.empty(0, dtype=np.int64), 0)
+    stages['cluster'] = time.perf_counter() - start
+
+    sizes = np.bincount(assignment, minlength=clusters)
+    small = sizes < min_cluster_size
+    report = {
+        'method': method,
+        'threshold': threshold,
+        'faces': n,
+        'edges': int(len(rows)),
+        'clusters': int(np.count_nonzero(~small)),
+        'outliers': int(sizes[small].sum()),
+        'largest_cluster': int(sizes.max()) if clusters else 0,
+        'stage_seconds': stages
+    }
+    return assignment, clusters, report
+
+
+def recluster_identities(clusterer: IdentityClusterer, **options) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Recluster every face in a clusterer's gallery and relabel it in place.
+
+    Faces are clustered in content-key order, so the result does not depend on the order
+    they were added in. Returns ({face_key: new label} for moved faces, report).
+    """
+    start = time.perf_counter()
+    entry_ids, encodings, keys = clusterer.members()
+    load_seconds = time.perf_counter() - start
+
+    assignment, clusters, report = recluster(encodings, **options)
+
+    start = time.perf_counter()
+    relabelled = clusterer.relabel(entry_ids, keys, assignment, clusters) if len(entry_ids) else {}
+    report['stage_seconds'] = {'load': load_seconds, **report['stage_seconds'], 'relabel': time.perf_counter() - start}
+    report['relabelled'] = len(relabelled)
+    report['seconds'] = sum(report['stage_seconds'].values())
+    clusterer.stats = report
+    logger.info(f"Reclustered {report['faces']} faces into {report['clusters']} people "
+                f"({report['outliers']} outliers) in {report['seconds']:.1f}s")
+    return relabelled, report
+
+
+def _recluster_gallery(path: str, output: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    from gallery_store import load_face_gallery, save_face_gallery
+    gallery, meta = load_face_gallery(path, mmap=True)
+    metadata = meta['metadata']
+    new_label = None
+    if 'next_person_id' in metadata:
+        # Keep numbering Person_N labels where the saving processor left off
+        numbers = itertools.count(metadata['next_person_id'])
+        new_label = lambda: f"Person_{next(numbers)}"
+    clusterer = IdentityClusterer(gallery, new_label=new_label)
+    _, report = recluster_identities(clusterer, **options)
+    if new_label is not None:
+        metadata['next_person_id'] = next(numbers)
+    save_face_gallery(output or path, clusterer.gallery, metadata)
+    return report
+
+
+def _recluster_store(database_url: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    from face_gallery import FaceGallery
+    from face_store import FaceStore, new_id
+    from identity_clustering import face_key
+    store = FaceStore(database_url)
+    try:
+        face_ids, person_ids, encodings, _ = store.load_gallery()
+        gallery = FaceGallery.from_arrays(encodings, np.array(person_ids, dtype=object))
+        clusterer = IdentityClusterer(gallery, new_label=new_id)
+        relabelled, report = recluster_identities(clusterer, **options)
+        moves: Dict[str, list] = {}
+        for face_id, encoding in zip(face_ids, encodings):
+            person_id = relabelled.get(face_key(encoding))
+            if person_id is not None:
+                moves.setdefault(str(person_id), []).append(face_id)
+        for person_id, ids in moves.items():
+            store.assign_person(ids, person_id)
+        return report
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild identities from every stored face encoding")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--gallery', help="Gallery directory written by save_gallery / export_model_data")
+    source.add_argument('--database-url', help="App database holding FaceEmbedding rows")
+    parser.add_argument('--output', help="Where to write the relabelled gallery (default: in place)")
+    parser.add_argument('--method', choices=RECLUSTER_METHODS, default='chinese_whispers')
+    parser.add_argument('--threshold', type=float, default=0.5, help="Largest encoding distance that links two faces")
+    parser.add_argument('--neighbors', type=int, default=16, help="Edges kept per face")
+    parser.add_argument('--min-cluster-size', type=int, default=2, help="Smaller clusters are reported as outliers")
+    parser.add_argument('--index-backend', default='exact', help="exact (blocked) or ivf (approximate) neighbour search")
+    parser.add_argument('--report', help="Optional JSON file for the report")
+    args = parser.parse_args()
+
+    options = {'method': args.method, 'threshold': args.threshold, 'k': args.neighbors,
+               'min_cluster_size': args.min_cluster_size, 'index_backend': args.index_backend}
+    if args.gallery:
+        report = _recluster_gallery(args.gallery, args.output, options)
+    else:
+        report = _recluster_store(args.database_url, options)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import List, Tuple, Dict, Any, Optional
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's contents without loading it all into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ScanManifest:
+    """Record of which files a directory scan has already processed.
+
+    Each entry stores the file's size, mtime and content hash plus the caller's result for
+    that file, so later scans only process new or changed files. `state` holds small
+    caller-owned data saved with the entries.
+
+    `save` writes a full snapshot atomically; between saves, `checkpoint` appends only the
+    entries changed since the last checkpoint to a journal beside it (`path` + ".journal"),
+    so checkpoint cost follows the changes, not the size of the manifest. Loading replays
+    the journal over the snapshot, so an interrupted run resumes cleanly. A journal record
+    may carry `extra` data for the caller that is kept out of the entries (and out of
+    memory once loaded, except in `journal_extras`) until the next save.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = 50):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.checkpoint_every = checkpoint_every
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.state: Dict[str, Any] = {}
+        # {path: extra} of records replayed from the journal, i.e. made since the last save
+        self.journal_extras: Dict[str, Any] = {}
+        self._pending: List[str] = []
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.files = data.get('files', {})
+                self.state = data.get('state', {})
+        # A first run that was interrupted has a journal but no snapshot yet
+        self._replay_journal()
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last line half written
+                    break
+                if change['op'] == 'record':
+                    self.files[change['path']] = change['entry']
+                    if change.get('extra') is not None:
+                        self.journal_extras[change['path']] = change['extra']
+                    else:
+                        self.journal_extras.pop(change['path'], None)
+                else:
+                    self.files.pop(change['path'], None)
+                    self.journal_extras.pop(change['path'], None)
+
+    def _log(self, op: str, path: str, extra: Any = None):
+        change = {'op': op, 'path': path}
+        if op == 'record':
+            change['entry'] = self.files[path]
+            if extra is not None:
+                change['extra'] = extra
+        self._pending.append(json.dumps(change))
+
+    def diff(self, paths: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """Split paths into (new or changed, unchanged) and list manifest entries that no longer exist"""
+        changed, unchanged = [], []
+        for path in paths:
+            entry = self.files.get(path)
+            if entry is None:
+                changed.append(path)
+                continue
+            stat = os.stat(path)
+            if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+                unchanged.append(path)
+            elif stat.st_size == entry['size'] and file_sha256(path) == entry['sha256']:
+                # Touched but identical, remember the new mtime so it is not rehashed next time
+                entry['mtime'] = stat.st_mtime
+                self._log('record', path)
+                unchanged.append(path)
+            else:
+                changed.append(path)
+
+        seen = set(paths)
+        deleted = [path for path in self.files if path not in seen]
+        return changed, unchanged, deleted
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(path)
+
+    def record(self, path: str, result: Any = None, sha256: Optional[str] = None, extra: Any = None):
+        """Mark a file as processed with its current size, mtime and hash.
+
+        Pass `sha256` when the caller already hashed the file's bytes, so it is not read
+        again. `extra` goes to the journal only (see the class docstring).
+        """
+        stat = os.stat(path)
+        self.files[path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': sha256 or file_sha256(path),
+            'processed_at': datetime.now().isoformat(),
+            'result': result
+        }
+        self._log('record', path, extra)
+
+    def forget(self, path: str):
+        if self.files.pop(path, None) is not None:
+            self._log('forget', path)
+
+    @property
+    def needs_checkpoint(self) -> bool:
+        """True once enough entries changed since the last checkpoint"""
+        return len(self._pending) >= self.checkpoint_every
+
+    def checkpoint(self):
+        """Append the entries changed since the last checkpoint to the journal and sync it"""
+        if not self._pending:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.journal_path, 'a') as f:
+            f.write('\n'.join(self._pending) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def save(self):
+        """Atomically write a full snapshot and drop the journal it supersedes"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files, 'state': self.state}, f)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_extras = {}
+        self._pending = []
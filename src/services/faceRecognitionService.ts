@@ -26,7 +26,7 @@ export interface FaceDetails {
 export interface FaceRecognitionResult {
   faces_detected: number;
   face_details: FaceDetails[];
-  visualization?: string; // Base64 encoded image with visualizations
+  visualization?: string; // Base64 encoded image with visualizations, only sent with visualize=true
 }
 
 export const processImage = async (imageFile: File): Promise<FaceRecognitionResult> => {
@@ -35,6 +35,7 @@ export const processImage = async (imageFile: File): Promise<FaceRecognitionResu
     formData.append('file', imageFile);
 
     const response = await axios.post(`${API_URL}/process-image`, formData, {
+      params: { visualize: true },
       headers: {
         'Content-Type': 'multipart/form-data',
       },
@@ -0,0 +1,34 @@
+import numpy as np
+
+import batch_detection
+from batch_detection import bucket_shape, letterbox, batch_cnn_face_locations
+
+
+def test_buckets_round_up_and_letterbox_pads_bottom_right():
+    assert bucket_shape((100, 200, 3)) == (128, 256)
+    assert bucket_shape((128, 129)) == (128, 256)
+
+    image = np.ones((100, 200, 3), dtype=np.uint8)
+    padded = letterbox(image, (128, 256))
+    assert padded.shape == (128, 256, 3)
+    assert np.array_equal(padded[:100, :200], image)
+    assert not padded[100:].any() and not padded[:, 200:].any()
+    assert letterbox(image, (100, 200)) is image
+
+
+def test_batches_by_size_and_returns_input_order(fake_face_recognition, monkeypatch):
+    batches = []
+
+    def batch_face_locations(images, number_of_times_to_upsample=1, batch_size=128):
+        batches.append([image.shape[:2] for image in images])
+        # One face per image, found at its own height, plus one inside the padding
+        return [[(0, 20, int(image[:, 0].sum()), 0), (110, 20, 120, 0)] for image in images]
+
+    fake_face_recognition.batch_face_locations = batch_face_locations
+    monkeypatch.setattr(batch_detection, 'face_recognition', fake_face_recognition)
+    images = [np.ones(shape, dtype=np.uint8) for shape in ((100, 100), (300, 300), (110, 90))]
+    results = batch_cnn_face_locations(images, batch_size=8)
+
+    assert sorted(batches) == [[(128, 128), (128, 128)], [(384, 384)]]
+    # Boxes starting in the padding are dropped, the rest are clipped to the image
+    assert results == [[(0, 20, 100, 0)], [(0, 20, 300, 0), (110, 20, 120, 0)], [(0, 20, 110, 0)]]
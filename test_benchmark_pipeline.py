@@ -0,0 +1,48 @@
+import os
+
+import cv2
+import numpy as np
+
+import face_recognition_processor
+from benchmark_detection_scaling import list_images
+from benchmark_pipeline import CONFIGURATIONS, make_synthetic_corpus, run_configuration
+
+
+def write_dataset(directory, count: int = 3) -> str:
+    os.makedirs(directory, exist_ok=True)
+    for seed in range(count):
+        image = np.random.default_rng(seed).integers(0, 256, (120, 120, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, f"photo_{seed}.png"), image)
+    return str(directory)
+
+
+def test_synthetic_corpus_is_varied_and_generated_once(tmp_path):
+    sources = list_images(write_dataset(tmp_path / "sources", 2))
+    path = make_synthetic_corpus(sources, 4, str(tmp_path / "corpus"))
+    images = list_images(path)
+    assert len(images) == 4
+    assert len({cv2.imread(image).tobytes() for image in images}) == 4
+
+    mtimes = [os.path.getmtime(image) for image in images]
+    assert make_synthetic_corpus(sources, 4, str(tmp_path / "corpus")) == path
+    assert [os.path.getmtime(image) for image in images] == mtimes
+
+
+def test_learning_configuration_counts_faces_and_errors(tmp_path, fake_face_recognition, fake_face_visualizer):
+    dataset = write_dataset(tmp_path / "dataset")
+    (tmp_path / "dataset" / "broken.jpg").write_bytes(b"not an image")
+
+    result = run_configuration('learning', CONFIGURATIONS['learning'], dataset, workers=1)
+    assert (result['images'], result['faces'], result['errors']) == (4, 3, 1)
+    # Landmarks and encodings are timed as separate stages
+    assert {'detect', 'landmark', 'encode'} <= set(result['stages'])
+
+
+def test_recognition_configuration_streams_every_face(tmp_path, fake_face_recognition, monkeypatch):
+    monkeypatch.setattr(face_recognition_processor, 'face_recognition', fake_face_recognition)
+    dataset = write_dataset(tmp_path / "dataset")
+
+    result = run_configuration('recognition-serial', CONFIGURATIONS['recognition-serial'], dataset, workers=1)
+    assert (result['images'], result['faces'], result['errors']) == (3, 3, 0)
+    assert result['images_per_second'] > 0
+    assert {'detect', 'landmark', 'encode'} <= set(result['stages'])
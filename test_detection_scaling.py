@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+from detection_scaling import downscale_for_detection, upscale_locations, upscale_boxes, crop_face, equalization_lut
+from face_learning_model import FaceLearningModel
+
+
+def test_small_images_are_left_alone():
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert downscale_for_detection(image, None)[1] == 1.0
+    small, scale = downscale_for_detection(image, 640)
+    assert small is image and scale == 1.0
+
+
+def test_longest_side_is_bounded():
+    image = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    small, scale = downscale_for_detection(image, 1000)
+    assert small.shape == (750, 1000, 3)
+    assert scale == 0.25
+
+
+def test_locations_map_back_to_full_resolution():
+    shape = (3000, 4000, 3)
+    assert upscale_locations([(100, 300, 250, 150)], 0.25, shape) == [(400, 1200, 1000, 600)]
+    # Boxes touching the edge of the small image stay inside the full one
+    assert upscale_locations([(0, 1001, 751, -1)], 0.25, shape) == [(0, 4000, 3000, 0)]
+
+
+def test_boxes_and_eyes_map_back_to_full_resolution():
+    faces = [{'x': 150, 'y': 100, 'w': 150, 'h': 150, 'left_eye': (190.0, 140.0), 'right_eye': None}]
+    [face] = upscale_boxes(faces, 0.25, (3000, 4000, 3))
+    assert (face['x'], face['y'], face['w'], face['h']) == (600, 400, 600, 600)
+    assert face['left_eye'] == (760.0, 560.0)
+    assert face['right_eye'] is None
+
+
+def test_crop_location_is_relative_to_the_crop():
+    image = np.arange(200 * 200).reshape(200, 200)
+    crop, (top, right, bottom, left) = crop_face(image, (40, 120, 120, 40), margin=0.25)
+    assert crop.shape == (120, 120)
+    assert (top, right, bottom, left) == (20, 100, 100, 20)
+    assert crop[top, left] == image[40, 40]
+
+    # The margin is clipped at the image border
+    crop, location = crop_face(image, (0, 200, 200, 0))
+    assert crop.shape == (200, 200) and location == (0, 200, 200, 0)
+
+
+def test_equalization_lut_matches_opencv():
+    gray = np.random.default_rng(0).integers(40, 180, (64, 64), dtype=np.uint8)
+    np.testing.assert_allclose(equalization_lut(gray)[gray], cv2.equalizeHist(gray), atol=1)
+    flat = np.full((8, 8), 7, dtype=np.uint8)
+    assert np.array_equal(equalization_lut(flat), np.arange(256))
+
+
+def test_learning_model_detects_small_and_encodes_full_resolution(fake_face_recognition):
+    seen = []
+    detect = fake_face_recognition.face_locations
+    fake_face_recognition.face_locations = lambda image, *args, **kwargs: seen.append(image.shape) or detect(image)
+    image = np.random.default_rng(0).integers(0, 256, (400, 400, 3), dtype=np.uint8)
+
+    _, locations, _, _, landmarks = FaceLearningModel(max_detection_dim=100)._get_face_encodings(image)
+    assert seen == [(100, 100, 3)]
+    assert locations == [(40, 200, 200, 40)]
+    # Landmarks come from the full-resolution face region
+    assert landmarks[0][:, 0].max() > 100
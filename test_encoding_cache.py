@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+from encoding_cache import EncodingCache, hash_bytes
+
+
+def make_entry(faces: int = 2, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return {
+        'face_locations': [(10 * i, 10 * i + 40, 10 * i + 40, 10 * i) for i in range(faces)],
+        'face_encodings': list(rng.normal(0, 0.1, (faces, 128))),
+        'quality': [{'blur': float(i), 'size': 40.0} for i in range(faces)],
+        'extras': {'model': 'hog'}
+    }
+
+
+def test_entry_round_trips(tmp_path):
+    cache = EncodingCache(str(tmp_path))
+    entry = make_entry()
+    key = cache.key(hash_bytes(b'image'), {'model': 'hog'})
+    assert cache.get(key) is None
+    cache.put(key, entry)
+
+    cached = cache.get(key)
+    assert cached['face_locations'] == entry['face_locations']
+    np.testing.assert_allclose(cached['face_encodings'], entry['face_encodings'], atol=1e-6)
+    assert cached['quality'] == entry['quality']
+    assert cached['extras'] == entry['extras']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_no_faces_round_trips(tmp_path):
+    cache = EncodingCache(str(tmp_path))
+    cache.put('0' * 64, {'face_locations': [], 'face_encodings': []})
+    assert cache.get('0' * 64) == {'face_locations': [], 'face_encodings': [], 'quality': [], 'extras': None}
+
+
+def test_key_depends_on_content_and_settings(tmp_path):
+    cache = EncodingCache(str(tmp_path))
+    key = cache.key(hash_bytes(b'image'), {'model': 'hog', 'upsample': 1})
+    assert key == cache.key(hash_bytes(b'image'), {'upsample': 1, 'model': 'hog'})
+    assert key != cache.key(hash_bytes(b'other'), {'model': 'hog', 'upsample': 1})
+    assert key != cache.key(hash_bytes(b'image'), {'model': 'cnn', 'upsample': 1})
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EncodingCache(str(tmp_path))
+    cache.put('a' * 64, make_entry())
+    size = os.path.getsize(cache._path('a' * 64))
+
+    cache = EncodingCache(str(tmp_path), max_bytes=3 * size)
+    keys = ['a' * 64, 'b' * 64, 'c' * 64]
+    for key in keys[1:]:
+        cache.put(key, make_entry())
+    for age, key in enumerate(keys):
+        os.utime(cache._path(key), (age, age))
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get(keys[0]) is not None
+    cache.put('d' * 64, make_entry())
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get('d' * 64) is not None
+
+
+def test_unreadable_entry_is_dropped(tmp_path):
+    cache = EncodingCache(str(tmp_path))
+    key = 'e' * 64
+    cache.put(key, make_entry())
+    path = cache._path(key)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 4)
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import os
 from datetime import datetime
+from scan_manifest import ScanManifest
 
 def detect_faces(image_path, output_dir='test_results'):
     # Create output directory if it doesn't exist
@@ -43,20 +44,42 @@ def detect_faces(image_path, output_dir='test_results'):
     print(f"Result saved to {output_path}")
     return len(faces), output_path
 
-def process_directory(input_dir, output_dir='test_results'):
-    results = []
+def process_directory(input_dir, output_dir='test_results', manifest_path=None):
+    image_paths = []
     for root, _, files in os.walk(input_dir):
         for file in files:
             if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(root, file)
-                print(f"\nProcessing {image_path}")
-                face_count, output_path = detect_faces(image_path, output_dir)
-                if face_count > 0:  # Only add successful detections
-                    results.append({
-                        'input_path': image_path,
-                        'output_path': output_path,
-                        'face_count': face_count
-                    })
+                image_paths.append(os.path.join(root, file))
+    
+    # In incremental mode, only new or changed images are processed again
+    manifest = ScanManifest(manifest_path) if manifest_path else None
+    if manifest is not None:
+        changed, _, deleted = manifest.diff(image_paths)
+        for image_path in deleted:
+            manifest.forget(image_path)
+        changed = set(changed)
+    
+    results = []
+    for image_path in image_paths:
+        if manifest is not None and image_path not in changed:
+            result = manifest.get(image_path)['result']
+        else:
+            print(f"\nProcessing {image_path}")
+            face_count, output_path = detect_faces(image_path, output_dir)
+            result = {
+                'input_path': image_path,
+                'output_path': output_path,
+                'face_count': face_count
+            }
+            if manifest is not None:
+                manifest.record(image_path, result)
+                if manifest.needs_checkpoint:
+                    manifest.checkpoint()
+        if result['face_count'] > 0:  # Only add successful detections
+            results.append(result)
+    
+    if manifest is not None:
+        manifest.save()
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+from face_detection_processor import FaceDetectionProcessor
+
+# Two eye dots on a line tilted 20 degrees, inside a 100x100 face box at (50, 50)
+EYES = ((72, 90), (128, 110))
+FACE = {'x': 50, 'y': 50, 'w': 100, 'h': 100, 'confidence': 1.0, 'method': 'haar'}
+
+
+def tilted_face() -> np.ndarray:
+    image = np.zeros((200, 200, 3), dtype=np.uint8)
+    for x, y in EYES:
+        cv2.circle(image, (x, y), 4, (255, 255, 255), -1)
+    return image
+
+
+def dot_centres(crop: np.ndarray) -> np.ndarray:
+    _, _, _, centroids = cv2.connectedComponentsWithStats((crop[:, :, 0] > 127).astype(np.uint8))
+    return centroids[1:][np.argsort(centroids[1:, 0])]
+
+
+def eye_landmarks(location):
+    points = np.zeros((68, 2), dtype=np.int32)
+    points[36:42], points[42:48] = EYES
+    return points
+
+
+def test_haar_face_is_rotated_from_landmark_eyes(fake_face_recognition):
+    fake_face_recognition.landmarks = eye_landmarks
+    crop = FaceDetectionProcessor().align_faces(tilted_face(), [dict(FACE)])[0]
+    left, right = dot_centres(crop)
+    assert abs(left[1] - right[1]) < 2
+    assert fake_face_recognition.shape_calls == 1
+
+
+def test_detector_eyes_skip_the_landmark_pass(fake_face_recognition):
+    face = {**FACE, 'method': 'deepface', 'left_eye': EYES[1], 'right_eye': EYES[0]}
+    crop = FaceDetectionProcessor().align_faces(tilted_face(), [face])[0]
+    left, right = dot_centres(crop)
+    assert abs(left[1] - right[1]) < 2
+    assert fake_face_recognition.shape_calls == 0
@@ -0,0 +1,51 @@
+import numpy as np
+
+from face_gallery import FaceGallery
+
+
+def test_best_matches_agree_with_pairwise_distances(synthetic_faces):
+    encodings = synthetic_faces(people=4, faces_per_person=10)
+    gallery = FaceGallery(chunk_size=8)
+    for i, encoding in enumerate(encodings):
+        gallery.add(encoding, f"person{i // 10}")
+    assert len(gallery) == 40
+
+    queries = encodings[::7] + 0.005
+    entry_ids, distances = gallery.best_matches(list(queries))
+    expected = np.linalg.norm(encodings[None, :, :] - queries[:, None, :], axis=2)
+    assert np.array_equal(entry_ids, expected.argmin(axis=1))
+    np.testing.assert_allclose(distances, expected.min(axis=1), atol=1e-5)
+    assert [gallery.person_ids[i] for i in entry_ids] == [f"person{i * 7 // 10}" for i in range(len(queries))]
+
+
+def test_empty_gallery_matches_nothing():
+    entry_ids, distances = FaceGallery().best_matches([np.zeros(128)] * 2)
+    assert list(entry_ids) == [-1, -1]
+    assert np.isinf(distances).all()
+
+
+def test_removed_and_moved_entries(synthetic_faces):
+    encodings = synthetic_faces(people=2, faces_per_person=1)
+    gallery = FaceGallery()
+    first, second = (gallery.add(encoding, f"person{i}") for i, encoding in enumerate(encodings))
+    gallery.set_person(second, "person0")
+    assert list(gallery.person_ids) == ["person0", "person0"]
+
+    gallery.remove([first])
+    assert len(gallery) == 1
+    assert gallery.best_matches([encodings[0]])[0][0] == second
+    stored, person_ids = gallery.to_arrays()
+    assert np.array_equal(stored, encodings[1:]) and person_ids == ["person0"]
+
+
+def test_gallery_from_read_only_arrays_copies_on_first_change(synthetic_faces):
+    encodings = synthetic_faces(people=2, faces_per_person=2)
+    person_ids = np.array(["a", "a", "b", "b"])
+    encodings.flags.writeable = False
+    person_ids.flags.writeable = False
+
+    gallery = FaceGallery.from_arrays(encodings, person_ids)
+    assert gallery.best_matches([encodings[2]])[0][0] == 2
+    gallery.add(encodings[0], "a-long-person-id")
+    assert list(gallery.person_ids) == ["a", "a", "b", "b", "a-long-person-id"]
+    assert list(person_ids) == ["a", "a", "b", "b"]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from face_index import BruteForceIndex, IVFIndex
+
+
+def naive_search(gallery: np.ndarray, queries: np.ndarray, k: int):
+    distances = np.linalg.norm(queries[:, None, :] - gallery[None, :, :], axis=2)
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), order
+
+
+@pytest.mark.parametrize('k', [1, 5])
+def test_tiled_search_matches_full_scan(synthetic_faces, k):
+    gallery = synthetic_faces(people=10, faces_per_person=30)
+    queries = synthetic_faces(people=10, faces_per_person=2, seed=1)
+    ids = np.arange(len(gallery)) + 1000
+
+    # A block much smaller than the gallery, so results have to survive many tiles
+    index = BruteForceIndex(search_block=7)
+    index.add(gallery, ids)
+    distances, found = index.search(queries, k)
+
+    expected_distances, expected_rows = naive_search(gallery, queries, k)
+    np.testing.assert_allclose(distances, expected_distances, atol=1e-4)
+    assert (found == ids[expected_rows]).all()
+
+
+def test_search_pads_when_gallery_is_smaller_than_k(synthetic_faces):
+    index = BruteForceIndex(search_block=2)
+    index.add(synthetic_faces(people=1, faces_per_person=3), [4, 5, 6])
+    distances, found = index.search(synthetic_faces(people=1, faces_per_person=2), k=5)
+    assert (found[:, 3:] == -1).all() and np.isinf(distances[:, 3:]).all()
+    assert sorted(found[0, :3]) == [4, 5, 6]
+
+    distances, found = BruteForceIndex().search(np.zeros((2, 128)), k=1)
+    assert (found == -1).all() and np.isinf(distances).all()
+
+
+def test_removed_ids_are_not_returned(synthetic_faces):
+    gallery = synthetic_faces(people=3, faces_per_person=5)
+    index = BruteForceIndex(search_block=4)
+    index.add(gallery, range(len(gallery)))
+    index.remove([0, 7])
+    _, found = index.search(gallery[[0, 7]], k=1)
+    assert 0 not in found and 7 not in found
+    assert len(index) == len(gallery) - 2
+
+
+def test_ivf_probing_every_list_is_exact(synthetic_faces):
+    gallery = synthetic_faces(people=8, faces_per_person=20)
+    queries = synthetic_faces(people=8, faces_per_person=2, seed=1)
+    exact = BruteForceIndex()
+    exact.add(gallery, range(len(gallery)))
+    ivf = IVFIndex(nlist=8, nprobe=8, train_size=64)
+    ivf.add(gallery, range(len(gallery)))
+    assert ivf.is_trained
+
+    exact_distances, exact_ids = exact.search(queries, k=3)
+    ivf_distances, ivf_ids = ivf.search(queries, k=3)
+    np.testing.assert_allclose(ivf_distances, exact_distances, atol=1e-5)
+    assert (ivf_ids == exact_ids).all()
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from face_learning_model import FaceLearningModel
+
+
+def test_landmarks_predicted_once_per_face(fake_face_recognition):
+    fake_face_recognition.locations = [(10, 50, 50, 10), (60, 120, 120, 60)]
+    image = np.random.default_rng(0).integers(0, 256, (160, 160, 3), dtype=np.uint8)
+    encodings, locations, quality, characteristics, landmarks = FaceLearningModel()._get_face_encodings(image)
+    assert len(encodings) == len(landmarks) == 2
+    # The encoder reuses the landmark pass instead of predicting its own shapes
+    assert fake_face_recognition.shape_calls == 2
+    assert all(points.shape == (68, 2) for points in landmarks)
+    assert all(chars['has_eyes'] for chars in characteristics)
+
+
+def encoded_photo(seed: int = 0) -> bytes:
+    image = np.random.default_rng(seed).integers(0, 256, (120, 120, 3), dtype=np.uint8)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def test_path_bytes_and_array_inputs_agree(tmp_path, fake_face_recognition, fake_face_visualizer):
+    data = encoded_photo()
+    path = tmp_path / "photo.png"
+    path.write_bytes(data)
+
+    model = FaceLearningModel()
+    analyses = [model.analyze_image(image) for image in (str(path), data, FaceLearningModel.load_image(data))]
+    for faces in analyses:
+        assert [face['face']['location'] for face in faces] == [analyses[0][0]['face']['location']]
+        assert np.array_equal(faces[0]['encoding'], analyses[0][0]['encoding'])
+    # The same photo as an upload or a file is the same person
+    assert model.process_image(data)[0]['person_id'] == model.process_image(str(path))[0]['person_id']
+
+
+def test_undecodable_upload_is_rejected():
+    with pytest.raises(ValueError):
+        FaceLearningModel.load_image(b"not an image")
+
+
+def test_batch_keeps_going_past_a_bad_file(fake_face_recognition, fake_face_visualizer):
+    model = FaceLearningModel()
+    outcomes = model.analyze_images([encoded_photo(0), b"not an image", encoded_photo(1), encoded_photo(0)])
+    assert [sorted(outcome) for outcome in outcomes] == [['faces'], ['error'], ['faces'], ['faces']]
+
+    # Every face of the batch is matched in one call; repeats within the batch join the same person
+    faces = [face for outcome in outcomes for face in outcome.get('faces', [])]
+    people = [face['person_id'] for face in model.assign_identities(faces)]
+    assert people[0] == people[2] != people[1]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from face_quality import QUALITY_FIELDS, score_face, score_faces, to_gray
+
+
+def test_crop_and_in_image_scores_share_one_formula():
+    image = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    boxes = [(10, 70, 60, 20), (40, 150, 110, 90)]
+    in_image = score_faces(image, boxes)
+    assert in_image == score_faces(image, boxes, gray=to_gray(image))
+    for (top, right, bottom, left), scores in zip(boxes, in_image):
+        assert score_face(image[top:bottom, left:right]) == scores
+        assert set(scores) == set(QUALITY_FIELDS)
+        assert all(0.0 <= value <= 1.0 for value in scores.values())
+
+
+def test_sharp_faces_score_higher_than_flat_ones():
+    flat = np.full((50, 50, 3), 128, dtype=np.uint8)
+    checker = np.kron((np.indices((10, 10)).sum(axis=0) % 2) * 255, np.ones((5, 5)))
+    sharp = np.repeat(checker[:, :, None], 3, axis=2).astype(np.uint8)
+    assert score_face(flat)['sharpness'] == 0.0 and score_face(flat)['blur'] == 1.0
+    assert score_face(sharp)['sharpness'] > 0.5
+    # Boxes outside the image are clipped, and empty ones score zero
+    assert score_faces(flat, [(60, 80, 70, 60)])[0]['brightness'] == 0.0
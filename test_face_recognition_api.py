@@ -0,0 +1,82 @@
+import base64
+import importlib
+import os
+import sys
+
+import cv2
+import msgpack
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """The API module configured for in-process workers and scratch storage"""
+    root = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("FACE_WORKER_MODE", "thread")
+        mp.setenv("FACE_WORKERS", "2")
+        mp.setenv("FACE_PRELOAD", "0")
+        mp.setenv("FACE_JOBS_DB", str(root / "jobs.db"))
+        mp.setenv("FACE_GALLERY_PATH", str(root / "gallery"))
+        mp.setenv("FACE_THUMBNAIL_DIR", str(root / "thumbnails"))
+        module = importlib.import_module("face_recognition_api")
+    yield module
+    module.processing_pool.shutdown()
+    module.job_queue.close()
+
+
+@pytest.fixture
+def client(api, fake_face_recognition, fake_face_visualizer):
+    # Without the context manager the startup hooks (job drainers, warm-up) do not run
+    api.recent_analyses.clear()
+    return TestClient(api.app)
+
+
+def upload(seed: int = 0):
+    image = np.random.default_rng(seed).integers(0, 256, (120, 120, 3), dtype=np.uint8)
+    return {'file': ('photo.png', cv2.imencode('.png', image)[1].tobytes(), 'image/png')}
+
+
+def test_results_are_lean_unless_asked(client):
+    body = client.post('/process-image', files=upload()).json()
+    assert body['faces_detected'] == 1
+    assert 'visualization' not in body and 'encoding' not in body['face_details'][0]
+
+    body = client.post('/process-image?include_encodings=true&visualize=true', files=upload()).json()
+    assert len(np.frombuffer(base64.b64decode(body['face_details'][0]['encoding']), dtype=np.float32)) == 128
+    assert cv2.imdecode(np.frombuffer(base64.b64decode(body['visualization']), np.uint8), cv2.IMREAD_COLOR) is not None
+
+
+def test_msgpack_carries_raw_float32_encodings(client):
+    response = client.post('/process-image?include_encodings=true', files=upload(1),
+                           headers={'Accept': 'application/msgpack'})
+    assert response.headers['content-type'] == 'application/msgpack'
+    face = msgpack.unpackb(response.content)['face_details'][0]
+    assert len(np.frombuffer(face['encoding'], dtype=np.float32)) == 128
+    assert client.post('/process-image?format=xml', files=upload(1)).status_code == 400
+
+
+def test_visualization_reuses_the_analysis_and_ingests_nothing(api, client, fake_face_recognition):
+    client.post('/process-image', files=upload(2))
+    people = len(api.face_model.clusterer)
+    shapes = fake_face_recognition.shape_calls
+
+    response = client.post('/process-image/visualization', files=upload(2))
+    assert response.headers['content-type'] == 'image/jpeg'
+    assert response.headers['x-faces-detected'] == '1'
+    assert fake_face_recognition.shape_calls == shapes
+    assert len(api.face_model.clusterer) == people
+
+
+def test_train_batch_reports_bad_files_without_failing(client):
+    files = [('files', upload(seed)['file']) for seed in (3, 4, 3)]
+    files.insert(1, ('files', ('bad.png', b'not an image', 'image/png')))
+    body = client.post('/train-batch', files=files).json()
+
+    assert ['error' in entry for entry in body] == [False, True, False, False]
+    people = [entry['results'][0]['person_id'] for entry in body if 'results' in entry]
+    assert people[0] == people[2] != people[1]
@@ -0,0 +1,101 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import batch_detection
+import face_recognition_processor
+from face_recognition_processor import FaceRecognitionProcessor
+
+
+@pytest.fixture
+def fake_backend(fake_face_recognition, monkeypatch):
+    """The fake face_recognition, also used by the processor for decoding and detection"""
+    monkeypatch.setattr(face_recognition_processor, 'face_recognition', fake_face_recognition)
+    monkeypatch.setattr(batch_detection, 'face_recognition', fake_face_recognition)
+    return fake_face_recognition
+
+
+def write_photos(directory, seeds):
+    """One noise image per seed; photos with the same seed hold the same face"""
+    os.makedirs(directory, exist_ok=True)
+    for name, seed in seeds.items():
+        image = np.random.default_rng(seed).integers(0, 256, (120, 120, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, name), image)
+    return str(directory)
+
+
+def people_by_photo(processor):
+    return {os.path.basename(photo['image_path']): person_id
+            for person_id, photos in processor.person_photos.items() for photo in photos}
+
+
+def test_pool_matches_serial_numbering(tmp_path, fake_backend):
+    input_dir = write_photos(tmp_path / "photos", {'a.png': 0, 'b.png': 1, 'c.png': 0, 'd.png': 2})
+
+    serial = FaceRecognitionProcessor()
+    assert serial.process_directory(input_dir, str(tmp_path / "serial")) == 4
+    pooled = FaceRecognitionProcessor()
+    assert pooled.process_directory(input_dir, str(tmp_path / "pooled"), workers=2) == 4
+
+    people = people_by_photo(serial)
+    assert people == people_by_photo(pooled)
+    assert people == {'a.png': 'Person_1', 'b.png': 'Person_2', 'c.png': 'Person_1', 'd.png': 'Person_3'}
+    assert sorted(os.listdir(tmp_path / "pooled")) == sorted(os.listdir(tmp_path / "serial"))
+    for photos in pooled.person_photos.values():
+        assert all(photo['face_location'] == (10, 50, 50, 10) and photo['quality'] for photo in photos)
+
+
+def sharp_photo():
+    return np.random.default_rng(0).integers(0, 256, (120, 120, 3), dtype=np.uint8)
+
+
+def test_cascade_only_runs_cnn_when_a_trigger_fires(fake_backend):
+    fake_backend.locations = [(10, 110, 110, 10)]
+    processor = FaceRecognitionProcessor(detection_policy="cascade")
+
+    assert processor._detect_faces(sharp_photo()) == ([(10, 110, 110, 10)], [])
+    assert fake_backend.detector_calls == ['hog_scored']
+
+    fake_backend.face_detector.score = 0.1
+    fake_backend.detector_calls = []
+    assert processor._detect_faces(sharp_photo()) == ([(10, 110, 110, 10)], ['low_confidence'])
+    assert fake_backend.detector_calls == ['hog_scored', 'cnn']
+
+
+def test_cascade_triggers_and_stats(fake_backend):
+    processor = FaceRecognitionProcessor(detection_policy="cascade")
+    blurry = np.full((120, 120, 3), 128, dtype=np.uint8)
+
+    assert processor._cascade_triggers(sharp_photo(), [], []) == ['no_faces']
+    # A face smaller than min_face_size, or a blurry image, is hard for HOG
+    assert processor._cascade_triggers(sharp_photo(), [(10, 50, 50, 10)], [1.0]) == ['hard_image']
+    assert processor._cascade_triggers(blurry, [(10, 110, 110, 10)], [1.0]) == ['hard_image']
+
+    quiet = FaceRecognitionProcessor(detection_policy="cascade", cascade_options={'escalate_on_hard_image': False})
+    assert quiet._cascade_triggers(blurry, [(10, 50, 50, 10)], [0.1]) == ['low_confidence']
+
+    for triggers in (['no_faces'], [], ['low_confidence', 'hard_image']):
+        processor._record_detection({'escalation_triggers': triggers})
+    # Cached analyses ran no detector and are not counted
+    processor._record_detection({'escalation_triggers': None})
+    stats = processor.get_detection_stats()
+    assert (stats['images'], stats['escalated']) == (3, 2)
+    assert stats['triggers'] == {'no_faces': 1, 'low_confidence': 1, 'hard_image': 1}
+
+
+def test_batched_cnn_detection_matches_serial(tmp_path, fake_backend):
+    input_dir = write_photos(tmp_path / "photos", {'a.png': 0, 'b.png': 1, 'c.png': 0, 'd.png': 2, 'e.png': 1})
+
+    serial = FaceRecognitionProcessor()
+    serial.process_directory(input_dir, str(tmp_path / "serial"))
+    fake_backend.detector_calls = []
+    batched = FaceRecognitionProcessor()
+    batched.process_directory(input_dir, str(tmp_path / "batched"), batch_size=2)
+
+    assert people_by_photo(batched) == people_by_photo(serial)
+    # One CNN call for the whole window of same-size images; HOG still runs per image
+    assert fake_backend.detector_calls.count(('cnn_batch', 5)) == 1
+    assert fake_backend.detector_calls.count('hog') == 5
+    assert 'cnn' not in fake_backend.detector_calls
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from face_learning_model import FaceLearningModel
+from face_store import FaceStore, face_embeddings
+
+
+def make_faces(encodings, person_id, prefix):
+    return [{'id': f"{prefix}{i}", 'person_id': person_id, 'bounding_box': {'top': 0, 'right': 10, 'bottom': 10, 'left': 0},
+             'confidence': 0.9, 'embedding': encoding, 'quality': None, 'in_gallery': True}
+            for i, encoding in enumerate(encodings)]
+
+
+def backdate(store: FaceStore, when: datetime):
+    with store.engine.begin() as conn:
+        conn.execute(update(face_embeddings).values(createdAt=when, updatedAt=when))
+
+
+def test_load_gallery_since_cursor_includes_relabels(tmp_path, synthetic_faces):
+    store = FaceStore(f"sqlite:///{tmp_path / 'faces.db'}")
+    encodings = synthetic_faces(people=2, faces_per_person=2)
+    store.add_faces(make_faces(encodings[:2], 'a', 'a'))
+    face_ids, person_ids, loaded, latest = store.load_gallery()
+    assert face_ids == ['a0', 'a1'] and person_ids == ['a', 'a']
+    assert (loaded == encodings[:2]).all()
+
+    backdate(store, datetime(2020, 1, 1))
+    cursor = datetime(2021, 1, 1)
+    store.add_faces(make_faces(encodings[2:], 'b', 'b'))
+    face_ids, _, _, latest = store.load_gallery(cursor)
+    assert sorted(face_ids) == ['b0', 'b1'] and latest > cursor
+
+    # Moving an old face bumps it past the cursor, so other replicas see the new person
+    store.assign_person(['a1'], 'b')
+    face_ids, person_ids, _, _ = store.load_gallery(cursor)
+    assert dict(zip(face_ids, person_ids))['a1'] == 'b'
+
+
+def test_sync_applies_relabels_from_other_replicas(tmp_path, synthetic_faces):
+    store = FaceStore(f"sqlite:///{tmp_path / 'faces.db'}")
+    encodings = synthetic_faces(people=2, faces_per_person=3)
+    store.add_faces(make_faces(encodings[:3], 'a', 'a') + make_faces(encodings[3:], 'b', 'b'))
+
+    replica = FaceLearningModel(store=store)
+    assert replica.sync_from_store() == 6
+    assert replica.match_identities([{'face': {}, 'encoding': encodings[0]}])[0]['person_id'] == 'a'
+
+    # Another replica's consolidation moves a0 to a new person
+    store.assign_person(['a0'], 'c')
+    assert replica.sync_from_store() == 1
+    assert replica.match_identities([{'face': {}, 'encoding': encodings[0]}])[0]['person_id'] == 'c'
+    assert replica.match_identities([{'face': {}, 'encoding': encodings[1]}])[0]['person_id'] == 'a'
+    assert len(replica.clusterer) == 3
+
+    # Rows re-read through the sync overlap are not applied twice
+    assert replica.sync_from_store() == 0
@@ -0,0 +1,58 @@
+import numpy as np
+
+from face_store import FaceStore
+from face_stream import JsonlSink, BinarySink, StoreSink, read_jsonl, write_records
+from gallery_store import load_gallery
+
+
+def make_records(encodings):
+    return [{'face_key': f"photo.jpg:{i}", 'person_id': str(i % 2), 'face_location': (0, 40, 40, 0),
+             'encoding': encoding, 'quality': {'blur': 1.0}, 'face_distance': 0.25,
+             'face_image': np.zeros((40, 40, 3), dtype=np.uint8)}
+            for i, encoding in enumerate(encodings)]
+
+
+def test_jsonl_sink_round_trips_and_applies_relabels(tmp_path, synthetic_faces):
+    records = make_records(synthetic_faces(people=2, faces_per_person=2))
+    path = str(tmp_path / "faces.jsonl")
+    with JsonlSink(path) as sink:
+        assert write_records(iter(records), [sink]) == 4
+        sink.relabel({'photo.jpg:0': 'merged'})
+
+    loaded = list(read_jsonl(path))
+    assert [record['person_id'] for record in loaded] == ['merged', '1', '0', '1']
+    assert all('face_image' not in record for record in loaded)
+    assert loaded[1]['face_location'] == (0, 40, 40, 0)
+    for record, original in zip(loaded, records):
+        assert np.array_equal(record['encoding'], original['encoding'])
+
+
+def test_binary_sink_writes_a_gallery(tmp_path, synthetic_faces):
+    encodings = synthetic_faces(people=2, faces_per_person=2)
+    path = str(tmp_path / "gallery")
+    sink = BinarySink(path, metadata={'source': 'test'})
+    write_records(make_records(encodings) + [{'face_key': 'photo.jpg:4', 'encoding': None}], [sink])
+    sink.relabel({'photo.jpg:3': '0'})
+    sink.close()
+
+    loaded, _, person_ids, meta = load_gallery(path)
+    assert np.array_equal(loaded, encodings)
+    assert list(person_ids) == ['0', '1', '0', '0']
+    assert meta['metadata'] == {'source': 'test'}
+    assert not list(tmp_path.glob("*.raw-*"))
+
+
+def test_store_sink_inserts_in_batches_and_moves_rows(tmp_path, synthetic_faces):
+    store = FaceStore(f"sqlite:///{tmp_path / 'faces.db'}")
+    batches = []
+    add_faces = store.add_faces
+    store.add_faces = lambda faces: batches.append(len(faces)) or add_faces(faces)
+
+    with StoreSink(store, batch_size=3, photo_id=None) as sink:
+        write_records(make_records(synthetic_faces(people=2, faces_per_person=2)), [sink])
+        sink.relabel({'photo.jpg:1': '0'})
+    assert batches == [3, 1]
+
+    face_ids, person_ids, encodings, _ = store.load_gallery()
+    assert len(face_ids) == 4 and encodings.shape == (4, 128)
+    assert sorted(person_ids) == ['0', '0', '0', '1']
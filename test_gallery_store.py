@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from face_learning_model import FaceLearningModel
+from gallery_store import load_clusters, load_face_gallery, save_face_gallery
+from identity_clustering import IdentityClusterer
+
+
+def trained_model(encodings: np.ndarray) -> FaceLearningModel:
+    model = FaceLearningModel()
+    model.clusterer.assign(list(encodings))
+    return model
+
+
+def test_import_restores_clusters_without_scanning_faces(tmp_path, synthetic_faces, monkeypatch):
+    encodings = synthetic_faces(people=4, faces_per_person=10)
+    model = trained_model(encodings)
+    model.export_model_data(str(tmp_path / 'gallery'))
+
+    loaded = FaceLearningModel()
+
+    def scan(self):
+        raise AssertionError("rebuild scans every encoding")
+    monkeypatch.setattr(IdentityClusterer, 'rebuild', scan)
+    loaded.import_model_data(str(tmp_path / 'gallery'))
+    assert len(loaded.clusterer) == len(model.clusterer) == 4
+    np.testing.assert_allclose(loaded.clusterer.centroids(), model.clusterer.centroids(), atol=1e-6)
+    queries = [{'face': {}, 'encoding': encoding} for encoding in encodings[::5]]
+    assert ([face['person_id'] for face in loaded.match_identities(queries)] ==
+            [face['person_id'] for face in model.match_identities(queries)])
+
+
+def test_galleries_saved_without_clusters_still_load(tmp_path, synthetic_faces):
+    model = trained_model(synthetic_faces(people=2, faces_per_person=5))
+    save_face_gallery(str(tmp_path / 'gallery'), model.gallery)
+    assert load_clusters(str(tmp_path / 'gallery')) is None
+
+    loaded = FaceLearningModel()
+    loaded.import_model_data(str(tmp_path / 'gallery'))
+    assert len(loaded.clusterer) == 2
+
+
+def test_adding_to_a_loaded_gallery_keeps_fixed_width_ids(tmp_path, synthetic_faces):
+    encodings = synthetic_faces(people=2, faces_per_person=3)
+    model = trained_model(encodings)
+    save_face_gallery(str(tmp_path / 'gallery'), model.gallery)
+    gallery, _ = load_face_gallery(str(tmp_path / 'gallery'))
+    assert gallery.person_ids.dtype.kind == 'U'
+
+    entry_id = gallery.add(encodings[0], 'a-much-longer-person-id')
+    assert gallery.person_ids.dtype.kind == 'U'
+    assert gallery.person_ids[entry_id] == 'a-much-longer-person-id'
+    assert list(gallery.person_ids[:len(encodings)]) == list(model.gallery.person_ids[:len(encodings)])
+
+    gallery.remove([entry_id])
+    assert gallery.person_ids[entry_id] is None
+
+
+def test_mismatched_clusters_are_rejected(tmp_path, synthetic_faces):
+    model = trained_model(synthetic_faces(people=2, faces_per_person=3))
+    labels, sums, counts = model.clusterer.cluster_state()
+    with pytest.raises(ValueError):
+        save_face_gallery(str(tmp_path / 'gallery'), model.gallery, clusters=(labels, sums, counts + 1))
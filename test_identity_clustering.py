@@ -0,0 +1,40 @@
+import numpy as np
+from identity_clustering import IdentityClusterer, face_key
+
+
+def consolidated_people(encodings: np.ndarray, batch_size: int = 7):
+    """People after online assignment in the given order and a consolidate pass, as sets of face keys"""
+    clusterer = IdentityClusterer(tolerance=0.6)
+    for start in range(0, len(encodings), batch_size):
+        clusterer.assign(encodings[start:start + batch_size])
+    clusterer.consolidate()
+    entry_ids, _, keys = clusterer.members()
+    people = {}
+    for key, label in zip(keys, clusterer.gallery.person_ids[entry_ids]):
+        people.setdefault(label, set()).add(str(key))
+    return {frozenset(keys) for keys in people.values()}
+
+
+def test_consolidate_is_order_independent(synthetic_faces):
+    encodings = synthetic_faces()
+    expected = consolidated_people(encodings)
+    assert len(expected) == 6
+    for seed in range(3):
+        shuffled = encodings[np.random.default_rng(seed).permutation(len(encodings))]
+        assert consolidated_people(shuffled, batch_size=seed + 1) == expected
+
+
+def test_consolidate_reports_moved_faces(synthetic_faces):
+    encodings = synthetic_faces(people=2, faces_per_person=5)
+    clusterer = IdentityClusterer(tolerance=0.6)
+    # One person split in two by hand; consolidation must bring them back together
+    for encoding in encodings[:5]:
+        clusterer.add_member(encoding, 'Person_a')
+    for encoding in encodings[5:8]:
+        clusterer.add_member(encoding, 'Person_b')
+    for encoding in encodings[8:]:
+        clusterer.add_member(encoding, 'Person_c')
+    relabelled = clusterer.consolidate()
+    assert set(relabelled) == {face_key(encoding) for encoding in encodings[8:]}
+    assert set(relabelled.values()) == {'Person_b'}
+
@@ -0,0 +1,58 @@
+import time
+
+from job_queue import JobQueue
+
+
+def test_replica_restart_only_requeues_its_own_items(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    a = JobQueue(db_path, owner="a")
+    job_id = a.create_job([("one.jpg", b"1"), ("two.jpg", b"2")])
+    assert a.claim_next()['seq'] == 0
+
+    # Another replica starting up leaves a's in-flight item alone and takes the next one
+    b = JobQueue(db_path, owner="b")
+    assert b.claim_next()['seq'] == 1
+    assert b.claim_next() is None
+    assert a.get_job(job_id)['running'] == 2
+
+    # a restarting gets its own interrupted item back
+    a.close()
+    a = JobQueue(db_path, owner="a")
+    assert a.get_job(job_id)['pending'] == 1
+    assert a.claim_next()['filename'] == "one.jpg"
+
+
+def test_expired_lease_is_claimed_by_another_replica(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    a = JobQueue(db_path, owner="a", lease_seconds=0.05)
+    b = JobQueue(db_path, owner="b")
+    a.create_job([("one.jpg", b"1")])
+    assert a.claim_next() is not None
+    assert b.claim_next() is None
+
+    time.sleep(0.1)
+    item = b.claim_next()
+    assert item is not None and item['payload'] == b"1"
+
+
+def test_results_follow_the_cursor(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), owner="a")
+    job_id = queue.create_job([("one.jpg", b"1"), ("two.jpg", b"2")])
+    first, second = queue.claim_next(), queue.claim_next()
+    queue.complete(job_id, second['seq'], [{'person_id': 1}])
+    queue.fail(job_id, first['seq'], "no faces")
+
+    results = queue.get_results(job_id)
+    assert [(r['filename'], r['status']) for r in results] == [("two.jpg", 'done'), ("one.jpg", 'failed')]
+    assert results[0]['results'] == [{'person_id': 1}]
+    assert queue.get_results(job_id, after=results[0]['cursor'])[0]['error'] == "no faces"
+    assert queue.get_job(job_id)['status'] == 'completed'
+
+
+def test_released_item_is_claimed_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), owner="a")
+    job_id = queue.create_job([("one.jpg", b"1")])
+    item = queue.claim_next()
+    queue.release(job_id, item['seq'])
+    assert queue.get_job(job_id)['status'] == 'queued'
+    assert queue.claim_next()['seq'] == item['seq']
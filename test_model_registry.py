@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from model_registry import ModelRegistry
+
+
+def test_model_is_loaded_once_on_first_use():
+    calls = []
+    registry = ModelRegistry()
+    registry.register('model', lambda: calls.append(1) or object())
+    assert not registry.is_loaded('model')
+
+    threads = [threading.Thread(target=registry.get, args=('model',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert registry.get('model') is registry.get('model')
+    assert registry.is_loaded('model')
+    assert set(registry.load_times()) == {'model'}
+
+
+def test_unknown_model_raises():
+    with pytest.raises(KeyError):
+        ModelRegistry().get('missing')
+
+
+def test_preload_skips_models_that_fail():
+    registry = ModelRegistry()
+    registry.register('good', object)
+    registry.register('bad', lambda: 1 / 0)
+    assert set(registry.preload()) == {'good'}
+    report = registry.report()
+    assert report['loaded'] == ['good']
+    assert report['available'] == ['bad', 'good']
+
+
+def test_deepface_detectors_are_parameterised(monkeypatch):
+    registry = ModelRegistry()
+    backends = []
+    monkeypatch.setattr('model_registry._load_deepface_detector',
+                        lambda backend: backends.append(backend) or backend)
+    registry.get('deepface_detector:retinaface')
+    registry.get('deepface_detector:retinaface')
+    assert backends == ['retinaface']
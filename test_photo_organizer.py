@@ -0,0 +1,58 @@
+import os
+import tempfile
+from photo_organizer import PhotoOrganizer
+
+
+def make_records(image_dir: str, people: dict):
+    """Face records for {person_id: number of photos}, each photo a small file of its own"""
+    records = []
+    for person_id, photos in people.items():
+        for i in range(photos):
+            path = os.path.join(image_dir, f"{person_id}_{i}.jpg")
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(f"{person_id} {i}".encode())
+            records.append({'image_path': path, 'face_location': (0, 10, 10, 0), 'person_id': person_id,
+                            'face_key': f"{person_id}_{i}", 'face_distance': 0.1 * i, 'timestamp': f"run {len(records)}"})
+    return records
+
+
+def test_incremental_rebuild():
+    with tempfile.TemporaryDirectory() as root:
+        image_dir, output_dir = os.path.join(root, 'images'), os.path.join(root, 'organized')
+        os.makedirs(image_dir)
+        organizer = PhotoOrganizer(output_dir, strategy='hardlink', workers=2)
+
+        report = organizer.organize(make_records(image_dir, {'Person_1': 2, 'Person_2': 3, 'Person_3': 1}))
+        assert (report['people'], report['rebuilt'], report['unchanged']) == (3, 3, 0)
+        assert len([name for name in os.listdir(os.path.join(output_dir, 'Person_2')) if name.endswith('.jpg')]) == 3
+
+        # Same photos, new timestamps: nothing to rebuild
+        report = organizer.organize(make_records(image_dir, {'Person_1': 2, 'Person_2': 3, 'Person_3': 1}))
+        assert (report['rebuilt'], report['unchanged']) == (0, 3)
+
+        # Person_1 gains a photo; the others are untouched
+        report = organizer.organize(make_records(image_dir, {'Person_1': 3, 'Person_2': 3, 'Person_3': 1}))
+        assert (report['rebuilt'], report['unchanged']) == (1, 2)
+
+        # Relabelling moves every Person_3 photo to Person_2
+        records = make_records(image_dir, {'Person_1': 3, 'Person_2': 3, 'Person_3': 1})
+        report = organizer.organize(records, relabelled={'Person_3_0': 'Person_2'})
+        assert (report['people'], report['rebuilt'], report['removed']) == (2, 1, 1)
+        assert len([name for name in os.listdir(os.path.join(output_dir, 'Person_2')) if name.endswith('.jpg')]) == 4
+        assert not os.path.exists(os.path.join(output_dir, 'Person_3'))
+
+
+def test_removes_people_who_are_gone():
+    with tempfile.TemporaryDirectory() as root:
+        image_dir, output_dir = os.path.join(root, 'images'), os.path.join(root, 'organized')
+        os.makedirs(image_dir)
+        organizer = PhotoOrganizer(output_dir, strategy='manifest')
+        organizer.organize(make_records(image_dir, {'Person_1': 2, 'Person_2': 1}))
+        assert os.path.isdir(os.path.join(output_dir, 'Person_2'))
+
+        report = organizer.organize(make_records(image_dir, {'Person_1': 2}))
+        assert (report['people'], report['rebuilt'], report['removed']) == (1, 0, 1)
+        assert not os.path.exists(os.path.join(output_dir, 'Person_2'))
+        assert os.path.isdir(os.path.join(output_dir, 'Person_1'))
+
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from processing_pool import ProcessingPool, PoolSaturated, PoolUnavailable
+
+
+def square(value):
+    return value * value
+
+
+def die():
+    os._exit(1)
+
+
+def test_submissions_beyond_capacity_fail_fast():
+    release = threading.Event()
+    pool = ProcessingPool(workers=1, queue_depth=1, mode="thread")
+
+    async def scenario():
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(pool.capacity)]
+        await asyncio.sleep(0)
+        assert pool.in_flight == 2
+        with pytest.raises(PoolSaturated):
+            await pool.run(square, 3)
+        release.set()
+        await asyncio.gather(*running)
+        assert pool.in_flight == 0
+        return await pool.run(square, 3)
+
+    try:
+        assert asyncio.run(scenario()) == 9
+    finally:
+        pool.shutdown()
+
+
+def test_dead_worker_replaces_the_pool():
+    pool = ProcessingPool(workers=1, queue_depth=0)
+
+    async def scenario():
+        with pytest.raises(PoolUnavailable):
+            await pool.run(die)
+        return await pool.run(square, 4)
+
+    try:
+        assert asyncio.run(scenario()) == 16
+    finally:
+        pool.shutdown()
+
+
+def test_warm_up_runs_once_per_worker_and_shutdown_rejects_work():
+    pool = ProcessingPool(workers=2, mode="thread")
+    warm = asyncio.run(pool.warm_up(threading.get_ident))
+    assert len(warm['results']) == 2
+    assert pool.stats() == {'mode': 'thread', 'workers': 2, 'queue_depth': 4, 'in_flight': 0}
+
+    pool.shutdown()
+    with pytest.raises(PoolUnavailable):
+        asyncio.run(pool.run(square, 2))
@@ -0,0 +1,48 @@
+import numpy as np
+from recluster import neighbor_graph, recluster
+
+
+# Probing every list makes the IVF index exact, so its graph must match the tiled one
+IVF_OPTIONS = {'nlist': 4, 'nprobe': 4, 'train_size': 64}
+
+
+def test_ivf_graph_matches_exact(synthetic_faces):
+    encodings = synthetic_faces(people=8, faces_per_person=30)
+    exact_rows, exact_cols, exact_distances = neighbor_graph(encodings, threshold=0.5, k=8, block=64, column_block=100)
+    ivf_rows, ivf_cols, ivf_distances = neighbor_graph(encodings, threshold=0.5, k=8, index_backend='ivf',
+                                                       index_options=IVF_OPTIONS, block=64)
+    assert len(exact_rows) > 0
+    exact = {(r, c): d for r, c, d in zip(exact_rows, exact_cols, exact_distances)}
+    ivf = {(r, c): d for r, c, d in zip(ivf_rows, ivf_cols, ivf_distances)}
+    assert exact.keys() == ivf.keys()
+    assert np.allclose([exact[edge] for edge in exact], [ivf[edge] for edge in exact], atol=1e-4)
+
+
+def test_recluster_backends_agree(synthetic_faces):
+    encodings = synthetic_faces(people=8, faces_per_person=30)
+    for method in ('chinese_whispers', 'components'):
+        exact, exact_k, _ = recluster(encodings, method=method)
+        ivf, ivf_k, _ = recluster(encodings, method=method, index_backend='ivf', index_options=IVF_OPTIONS)
+        assert exact_k == ivf_k == 8
+        assert np.array_equal(exact, ivf)
+
+
+def test_recluster_empty():
+    for backend, options in (('exact', None), ('ivf', IVF_OPTIONS)):
+        assignment, clusters, report = recluster(np.empty((0, 128), dtype=np.float32), index_backend=backend,
+                                                 index_options=options)
+        assert len(assignment) == 0 and clusters == 0
+        assert report['faces'] == 0 and report['edges'] == 0 and report['largest_cluster'] == 0
+
+
+
+def test_exact_graph_keeps_top_k_across_tiles(synthetic_faces):
+    # One dense identity: every face is within the threshold of all the others
+    encodings = synthetic_faces(people=1, faces_per_person=300)
+    rows, cols, distances = neighbor_graph(encodings, threshold=0.5, k=4, block=32, column_block=50)
+    whole_rows, whole_cols, whole_distances = neighbor_graph(encodings, threshold=0.5, k=4, block=32, column_block=1000)
+    assert np.array_equal(rows, whole_rows) and np.array_equal(cols, whole_cols)
+    assert np.allclose(distances, whole_distances, atol=1e-5)
+    # Every face keeps its k nearest neighbours and no more
+    degree = np.bincount(np.concatenate([rows, cols]), minlength=len(encodings))
+    assert degree.min() >= 4 and len(rows) <= 4 * len(encodings)
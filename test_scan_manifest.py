@@ -0,0 +1,65 @@
+import json
+import os
+from scan_manifest import ScanManifest, file_sha256
+
+
+def write_files(directory: str, count: int):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"image_{i}.jpg")
+        with open(path, 'wb') as f:
+            f.write(f"image {i}".encode())
+        paths.append(path)
+    return paths
+
+
+def test_checkpoints_append_only_changed_entries(tmp_path):
+    paths = write_files(str(tmp_path), 6)
+    manifest_path = str(tmp_path / 'manifest.json')
+    manifest = ScanManifest(manifest_path, checkpoint_every=2)
+    for path in paths[:4]:
+        manifest.record(path, {'faces': 1}, extra={'encodings': path})
+        if manifest.needs_checkpoint:
+            manifest.checkpoint()
+    manifest.save()
+    assert not os.path.exists(manifest.journal_path)
+
+    manifest = ScanManifest(manifest_path, checkpoint_every=2)
+    manifest.record(paths[4], {'faces': 2}, extra={'encodings': 'e4'})
+    manifest.forget(paths[0])
+    manifest.checkpoint()
+    snapshot = os.path.getmtime(manifest_path)
+    with open(manifest.journal_path) as f:
+        assert [json.loads(line)['op'] for line in f] == ['record', 'forget']
+
+    # An interrupted run: the snapshot is untouched, the journal replays over it
+    resumed = ScanManifest(manifest_path)
+    assert os.path.getmtime(manifest_path) == snapshot
+    assert set(resumed.files) == set(paths[1:5])
+    assert resumed.files[paths[4]]['result'] == {'faces': 2}
+    assert resumed.journal_extras == {paths[4]: {'encodings': 'e4'}}
+    assert 'extra' not in resumed.files[paths[4]]
+
+
+def test_truncated_journal_line_is_ignored(tmp_path):
+    paths = write_files(str(tmp_path), 2)
+    manifest = ScanManifest(str(tmp_path / 'manifest.json'))
+    manifest.save()
+    manifest.record(paths[0])
+    manifest.record(paths[1])
+    manifest.checkpoint()
+    with open(manifest.journal_path, 'r+') as f:
+        content = f.read()
+        f.seek(0)
+        f.write(content[:-20])
+        f.truncate()
+    assert set(ScanManifest(manifest.path).files) == {paths[0]}
+
+
+def test_record_reuses_a_known_hash(tmp_path, monkeypatch):
+    path = write_files(str(tmp_path), 1)[0]
+    known = file_sha256(path)
+    monkeypatch.setattr('scan_manifest.file_sha256', lambda path: (_ for _ in ()).throw(AssertionError("rehashed")))
+    manifest = ScanManifest(str(tmp_path / 'manifest.json'))
+    manifest.record(path, sha256=known)
+    assert manifest.files[path]['sha256'] == known
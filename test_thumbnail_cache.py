@@ -0,0 +1,47 @@
+import os
+
+import cv2
+import numpy as np
+
+from encoding_cache import hash_bytes
+from face_learning_model import FaceLearningModel
+from thumbnail_cache import ThumbnailCache
+
+
+def random_image(seed: int, size: int = 96) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def test_cache_is_kept_under_max_bytes(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), preview_size=96)
+    first = cache.put_preview(random_image(0))
+    size = os.path.getsize(cache.path(first))
+
+    cache = ThumbnailCache(str(tmp_path), preview_size=96, max_bytes=6 * size)
+    keys = [first] + [cache.put_preview(random_image(seed)) for seed in range(1, 4)]
+    for age, key in enumerate(keys):
+        os.utime(cache.path(key), (age, age))
+    # Reading a thumbnail makes it recently used, so it outlives ones written after it
+    assert cache.read(keys[0]) is not None
+    keys += [cache.put_preview(random_image(seed)) for seed in range(4, 7)]
+
+    on_disk = sum(os.path.getsize(cache.path(key)) for key in keys if os.path.exists(cache.path(key)))
+    assert on_disk <= cache.max_bytes
+    assert cache.read(keys[1]) is None
+    assert cache.read(keys[0]) is not None
+    assert cache.read(keys[-1]) is not None
+
+
+def test_learning_model_keys_thumbnails_by_file_bytes(tmp_path, fake_face_recognition, fake_face_visualizer):
+    path = str(tmp_path / 'photo.png')
+    cv2.imwrite(path, random_image(0, 120))
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    model = FaceLearningModel(thumbnail_dir=str(tmp_path / 'thumbnails'))
+    from_path = model.analyze_image(path)[0]['face']
+    from_bytes = model.analyze_image(data)[0]['face']
+    location = fake_face_recognition.locations[0]
+    # The same key FaceRecognitionProcessor derives from the file's bytes
+    assert from_path['thumbnail'] == from_bytes['thumbnail'] == model.thumbnails.key(hash_bytes(data), 'face', location)
+    assert model.thumbnails.read(from_path['thumbnail']) is not None
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import re
+import logging
+import cv2
+import numpy as np
+from typing import List, Tuple, Optional
+from encoding_cache import hash_array
+from detection_scaling import crop_face
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_VERSION = 1
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_thumbnail_key(key: str) -> bool:
+    """Whether a string is a well-formed key, so it can safely become a cache path"""
+    return bool(_KEY_PATTERN.match(key))
+
+
+def _fit(image: np.ndarray, size: int, upscale: bool = False) -> np.ndarray:
+    """Resize so the longer side is size; smaller images are left alone unless upscale"""
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale == 1 or (scale > 1 and not upscale):
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=interpolation)
+
+
+class ThumbnailCache:
+    """Content-addressed on-disk cache of face crops and photo previews, stored as JPEG.
+
+    Keys hash the image content (the file bytes' hash where there is a file, see
+    encoding_cache.hash_bytes) with the face box, size and format version, so a
+    thumbnail is encoded once however often the photo is ingested, and a key's bytes
+    never change. Files are sharded into subdirectories by the first two hex digits.
+    Once the directory grows past `max_bytes`, least-recently-used thumbnails are
+    deleted; they are written again the next time their photo is ingested.
+    """
+
+    def __init__(self, cache_dir: str = '.thumbnail_cache', face_size: int = 160, preview_size: int = 512,
+                 margin: float = 0.25, jpeg_quality: int = 85, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.face_size = face_size
+        self.preview_size = preview_size
+        self.margin = margin
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = self._scan()[1]
+
+    def key(self, content_hash: str, kind: str, face_location: Optional[Tuple[int, int, int, int]] = None) -> str:
+        """Key of a "face" or "preview" thumbnail of the image with this content hash"""
+        size = self.face_size if kind == 'face' else self.preview_size
+        payload = json.dumps({'content': content_hash, 'kind': kind, 'box': face_location and [int(v) for v in face_location],
+                              'size': size, 'margin': self.margin, 'quality': self.jpeg_quality,
+                              'version': THUMBNAIL_VERSION})
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def _scan(self):
+        entries, total = [], 0
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.jpg'):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        return entries, total
+
+    def _touch(self, path: str) -> bool:
+        """Mark a thumbnail as recently used, returning whether it exists"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def read(self, key: str) -> Optional[bytes]:
+        """JPEG bytes for a key, or None if it was never generated or has been evicted"""
+        if not is_thumbnail_key(key):
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(self.path(key))
+        return data
+
+    def _evict(self):
+        """Delete least-recently-used thumbnails until the cache is back under 90% of max_bytes"""
+        # Rescan rather than trusting the running total, other processes share the directory
+        entries, total = self._scan()
+        entries.sort()
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def _write(self, key: str, thumbnail: np.ndarray, rgb: bool):
+        path = self.path(key)
+        if rgb and thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_RGB2BGR)
+        ok, buffer = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            logger.warning(f"Could not encode thumbnail {key}")
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.tobytes())
+        os.replace(tmp_path, path)
+
+        self._total_bytes += len(buffer)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def put_faces(self, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]],
+                  content_hash: Optional[str] = None, rgb: bool = True) -> List[str]:
+        """Store a square face_size crop per face, padded with black where the crop is not square, and return their keys"""
+        content_hash = content_hash or hash_array(image)
+        keys = []
+        for location in face_locations:
+            key = self.key(content_hash, 'face', location)
+            if not self._touch(self.path(key)):
+                crop = _fit(crop_face(image, location, self.margin)[0], self.face_size, upscale=True)
+                height, width = crop.shape[:2]
+                if height < self.face_size or width < self.face_size:
+                    top, left = (self.face_size - height) // 2, (self.face_size - width) // 2
+                    crop = cv2.copyMakeBorder(crop, top, self.face_size - height - top, left, self.face_size - width - left,
+                                              cv2.BORDER_CONSTANT, value=0)
+                self._write(key, crop, rgb)
+            keys.append(key)
+        return keys
+
+    def put_preview(self, image: np.ndarray, content_hash: Optional[str] = None, rgb: bool = True) -> str:
+        """Store a whole-photo preview no larger than preview_size and return its key"""
+        key = self.key(content_hash or hash_array(image), 'preview')
+        if not self._touch(self.path(key)):
+            self._write(key, _fit(image, self.preview_size), rgb)
+        return key